@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Approximate nearest-neighbour candidate generation for VectorIndex.
+
+With every Tata manual loaded the chunk matrix reaches hundreds of
+thousands of rows, and even one vectorised mat-vec per query dominates
+latency on the on-device box. An ANN index narrows the scan to a small
+candidate set, which VectorIndex then scores exactly (cosine on the
+float32 rows) and filters with the DTC / component masks.
+
+Backends, selected with ANN_BACKEND:
+
+    exact   no ANN; full mat-vec scan (default, and the fallback)
+    ivf     pure-numpy inverted file: spherical k-means centroids, each
+            query scans the ANN_NPROBE closest lists
+    hnsw    hnswlib graph index (optional dependency; falls back to ivf
+            when hnswlib is not installed)
+
+Below ANN_MIN_ROWS rows the exact scan is faster and no ANN is built.
+Built indexes are persisted next to the embedding store as
+<model-slug>.<backend>.npz / .hnsw and reused while the chunk store
+fingerprint (see embedding_store.store_fingerprint) is unchanged.
+benchmark_retrieval.py measures recall@k against brute force.
+"""
+
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from embedding_store import EMBEDDING_CACHE_DIR, store_fingerprint, store_paths
+
+ANN_BACKEND = os.environ.get("ANN_BACKEND", "exact").lower()
+ANN_MIN_ROWS = int(os.environ.get("ANN_MIN_ROWS", "20000"))
+ANN_NLIST = int(os.environ.get("ANN_NLIST", "0"))      # 0 -> ~2 * sqrt(n)
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "8"))
+ANN_HNSW_M = int(os.environ.get("ANN_HNSW_M", "16"))
+ANN_HNSW_EF = int(os.environ.get("ANN_HNSW_EF", "128"))
+
+ANN_BACKENDS = ("exact", "ivf", "hnsw")
+
+
+class ANNIndex(ABC):
+    """Interface: candidates(query, k) -> row ids likely to hold the top k."""
+
+    backend = "exact"
+
+    @abstractmethod
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        """Row ids to score exactly for `query` (unit vector)."""
+
+    @abstractmethod
+    def save(self, path: str, fingerprint: str) -> None:
+        """Persist the index, tagged with the chunk store fingerprint."""
+
+
+# ---------------------------------------------------------------------------
+# IVF (pure numpy)
+# ---------------------------------------------------------------------------
+
+def _spherical_kmeans(matrix: np.ndarray, n_lists: int,
+                      iterations: int = 10, sample: int = 50000,
+                      seed: int = 0) -> np.ndarray:
+    """Unit-norm centroids fitted on a random sample of `matrix` rows."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(matrix), size=min(sample, len(matrix)), replace=False)
+    data = np.asarray(matrix[np.sort(rows)], dtype=np.float32)
+    centroids = data[rng.choice(len(data), size=n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.zeros_like(centroids)
+        used = counts > 0
+        sums[used] = np.add.reduceat(data[order], starts[used], axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0.0
+        # Re-seed empty lists with random points so every list is used
+        sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+        norms[empty] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray,
+            batch_size: int = 65536) -> np.ndarray:
+    """Closest centroid per row, in batches so memmaps stay paged."""
+    out = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), batch_size):
+        block = np.asarray(matrix[start:start + batch_size], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex(ANNIndex):
+    """Inverted file over k-means lists, stored as CSR (list_ptr / list_rows)."""
+
+    backend = "ivf"
+
+    def __init__(self, centroids: np.ndarray, list_ptr: np.ndarray,
+                 list_rows: np.ndarray, nprobe: int = ANN_NPROBE):
+        self.centroids = centroids
+        self.list_ptr = list_ptr
+        self.list_rows = list_rows
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: int = ANN_NLIST,
+              nprobe: int = ANN_NPROBE) -> "IVFIndex":
+        n_lists = n_lists or int(2 * np.sqrt(len(matrix)))
+        n_lists = max(1, min(n_lists, len(matrix)))
+        centroids = _spherical_kmeans(matrix, n_lists)
+        assign = _assign(matrix, centroids)
+        list_rows = np.argsort(assign, kind="stable").astype(np.int32)
+        list_ptr = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=n_lists), out=list_ptr[1:])
+        return cls(centroids, list_ptr, list_rows, nprobe)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = ANN_NPROBE) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_ptr"], data["list_rows"], nprobe)
+
+    def save(self, path: str, fingerprint: str) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, centroids=self.centroids, list_ptr=self.list_ptr,
+                 list_rows=self.list_rows, fingerprint=np.array(fingerprint))
+        os.replace(tmp, path)
+
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        nprobe = min(self.nprobe, len(self.centroids))
+        sims = self.centroids @ query
+        probe = np.argpartition(-sims, nprobe - 1)[:nprobe]
+        return np.concatenate(
+            [self.list_rows[self.list_ptr[p]:self.list_ptr[p + 1]] for p in probe]
+        )
+
+
+# ---------------------------------------------------------------------------
+# HNSW (hnswlib, optional)
+# ---------------------------------------------------------------------------
+
+class HNSWIndex(ANNIndex):
+    """hnswlib inner-product graph; rows are unit-norm so IP == cosine."""
+
+    backend = "hnsw"
+
+    def __init__(self, index, ef: int = ANN_HNSW_EF):
+        self.index = index
+        self.ef = ef
+        self.index.set_ef(ef)
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, m: int = ANN_HNSW_M,
+              ef: int = ANN_HNSW_EF) -> "HNSWIndex":
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=int(matrix.shape[1]))
+        index.init_index(max_elements=len(matrix), ef_construction=200, M=m)
+        for start in range(0, len(matrix), 65536):
+            block = np.asarray(matrix[start:start + 65536], dtype=np.float32)
+            index.add_items(block, np.arange(start, start + len(block)))
+        return cls(index, ef)
+
+    @classmethod
+    def load(cls, path: str, dim: int, ef: int = ANN_HNSW_EF) -> "HNSWIndex":
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.load_index(path)
+        return cls(index, ef)
+
+    def save(self, path: str, fingerprint: str) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        self.index.save_index(tmp)
+        os.replace(tmp, path)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint}, f)
+
+    def candidates(self, query: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, self.index.get_current_count())
+        if k > self.ef:   # hnswlib needs ef >= k
+            self.ef = k
+            self.index.set_ef(k)
+        labels, _ = self.index.knn_query(query.reshape(1, -1), k=k)
+        return labels[0].astype(np.int64)
+
+
+# ---------------------------------------------------------------------------
+# Selection + persistence
+# ---------------------------------------------------------------------------
+
+def ann_path(model_name: str, backend: str,
+             cache_dir: str = EMBEDDING_CACHE_DIR) -> str:
+    npy_path, _ = store_paths(model_name, cache_dir)
+    suffix = ".hnsw" if backend == "hnsw" else ".npz"
+    return f"{npy_path[:-len('.npy')]}.{backend}{suffix}"
+
+
+def _load(path: str, backend: str, dim: int, fingerprint: str) -> Optional[ANNIndex]:
+    try:
+        if backend == "ivf":
+            with np.load(path) as data:
+                if str(data["fingerprint"]) != fingerprint:
+                    return None
+            return IVFIndex.load(path)
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") != fingerprint:
+                return None
+        return HNSWIndex.load(path, dim)
+    except (OSError, ValueError, KeyError, RuntimeError):
+        return None
+
+
+def _hnswlib_available() -> bool:
+    try:
+        import hnswlib  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_ann(matrix: np.ndarray, backend: str) -> Optional[ANNIndex]:
+    if backend == "hnsw":
+        return HNSWIndex.build(matrix)
+    if backend == "ivf":
+        return IVFIndex.build(matrix)
+    return None
+
+
+def load_or_build_ann(matrix: np.ndarray,
+                      chunks: Sequence[Dict],
+                      model_name: str,
+                      backend: str = ANN_BACKEND,
+                      cache_dir: str = EMBEDDING_CACHE_DIR) -> Optional[ANNIndex]:
+    """
+    ANN index for `matrix` (rows == `chunks`), or None for an exact scan.
+
+    Reuses the persisted index when its fingerprint matches the chunk
+    store; otherwise builds one and tries to persist it.
+    """
+    if backend not in ANN_BACKENDS:
+        print(f"⚠️ Unknown ANN_BACKEND '{backend}'; using exact search")
+        return None
+    if backend == "exact" or len(matrix) < ANN_MIN_ROWS:
+        return None
+    if backend == "hnsw" and not _hnswlib_available():
+        print("⚠️ ANN_BACKEND=hnsw but hnswlib is not installed; using ivf")
+        backend = "ivf"
+
+    fingerprint = store_fingerprint(chunks, model_name)
+    path = ann_path(model_name, backend, cache_dir)
+    index = _load(path, backend, int(matrix.shape[1]), fingerprint)
+    if index is not None:
+        print(f"✅ Loaded {backend} ANN index from {path}")
+        return index
+
+    start = time.perf_counter()
+    index = build_ann(matrix, backend)
+    print(f"   - Built {backend} ANN index over {len(matrix)} rows "
+          f"in {time.perf_counter() - start:.1f}s")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        index.save(path, fingerprint)
+    except OSError as e:
+        print(f"⚠️ Could not persist ANN index to {cache_dir}: {e}")
+    return index
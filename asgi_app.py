@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Minimal ASGI adapter for the async serving mode of both backends.
+
+Flask views run the whole RAG pipeline inside a worker thread, so one slow
+Claude / Ollama call pins a gunicorn sync worker. In async mode the same
+endpoints are served by this small ASGI app instead: handlers are
+coroutines, retrieval runs on a thread pool and the LLM call is awaited,
+so a single process (one event loop) can serve many technicians at once.
+
+    uvicorn local_api_server:asgi_app --port 5002
+    gunicorn -k uvicorn.workers.UvicornWorker chatbot_backend:asgi_app
+
+Handlers take the parsed JSON body (or {} for GET) and return
+(status, payload): a dict is sent as JSON, a str as HTML.
+"""
+
+import json
+from typing import Awaitable, Callable, Dict, Tuple, Union
+
+Payload = Union[Dict, str]
+Handler = Callable[[Dict], Awaitable[Tuple[int, Payload]]]
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def make_asgi_app(routes: Dict[Tuple[str, str], Handler],
+                  cors_origin: str = "*"):
+    """Build an ASGI callable dispatching (METHOD, path) to `routes`."""
+
+    cors_headers = [
+        (b"access-control-allow-origin", cors_origin.encode()),
+        (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+        (b"access-control-allow-headers", b"Content-Type"),
+    ]
+
+    async def send_response(send, status: int, payload: Payload):
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = b"text/html; charset=utf-8"
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = b"application/json"
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type),
+                        (b"content-length", str(len(body)).encode())] + cors_headers,
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if scope["type"] != "http":
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+
+        if method == "OPTIONS":
+            await send({
+                "type": "http.response.start",
+                "status": 204,
+                "headers": cors_headers,
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        handler = routes.get((method, path))
+        if handler is None:
+            await send_response(send, 404, {"error": f"No route for {method} {path}"})
+            return
+
+        data: Dict = {}
+        if method == "POST":
+            raw = await _read_body(receive)
+            try:
+                data = json.loads(raw or b"{}")
+            except ValueError:
+                await send_response(send, 400, {"error": "Body must be JSON."})
+                return
+
+        try:
+            status, payload = await handler(data)
+        except Exception as e:
+            status, payload = 500, {"error": f"Internal Server Error: {str(e)}"}
+        await send_response(send, status, payload)
+
+    return app
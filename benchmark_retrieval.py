@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retrieval benchmark: latency, scanned memory and recall@k of VectorIndex
+configurations (ANN backend x embedding dtype) against the float32
+brute-force scan.
+
+    python benchmark_retrieval.py                       # synthetic, 100k x 384
+    python benchmark_retrieval.py --rows 300000 --backends exact ivf hnsw
+    python benchmark_retrieval.py --dtypes float32 float16 int8 --rescore 0 4
+    python benchmark_retrieval.py --store sentence-transformers/all-MiniLM-L6-v2
+
+Synthetic data is clustered unit vectors (manual chunks are far from
+uniform); queries are perturbed copies of random rows. With --store the
+persisted embedding store is used instead and queries are sampled from it.
+"""
+
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from ann_index import ANN_BACKENDS, build_ann
+from embedding_store import EMBEDDING_CACHE_DIR, store_paths
+from quantization import QuantizedMatrix
+from vector_index import VectorIndex
+
+
+def synthetic_matrix(rows: int, dim: int, clusters: int = 256,
+                     seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    matrix = centers[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def sample_queries(matrix: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(matrix), size=n, replace=False)
+    queries = np.asarray(matrix[rows]) + 0.05 * rng.normal(size=(n, matrix.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def run(index: VectorIndex, queries: np.ndarray, k: int):
+    """Return (per-query top-k row lists, per-query latencies in ms)."""
+    results: List[List[int]] = []
+    latencies: List[float] = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = index.search(query, top_k=k)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        results.append([row for row, _score in hits])
+    return results, np.array(latencies)
+
+
+def recall_at_k(truth: List[List[int]], found: List[List[int]]) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / max(1, sum(len(t) for t in truth))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=["exact", "ivf"],
+                        choices=ANN_BACKENDS)
+    parser.add_argument("--dtypes", nargs="+", default=["float32"],
+                        choices=["float32", "float16", "int8"])
+    parser.add_argument("--rescore", nargs="+", type=int, default=[4],
+                        help="float32 rescoring factor(s) for quantized dtypes")
+    parser.add_argument("--store", metavar="MODEL",
+                        help="benchmark the persisted embedding store of MODEL")
+    parser.add_argument("--cache-dir", default=EMBEDDING_CACHE_DIR)
+    args = parser.parse_args()
+
+    if args.store:
+        matrix = np.load(store_paths(args.store, args.cache_dir)[0], mmap_mode="r")
+    else:
+        matrix = synthetic_matrix(args.rows, args.dim)
+    chunks = [{"id": i, "text": ""} for i in range(len(matrix))]
+    queries = sample_queries(matrix, min(args.queries, len(matrix)))
+    print(f"{len(matrix)} rows x {matrix.shape[1]} dims, "
+          f"{len(queries)} queries, k={args.k}\n")
+
+    exact = VectorIndex(chunks, matrix, normalized=True)
+    truth, _ = run(exact, queries, args.k)
+
+    quantized = {
+        dtype: QuantizedMatrix.quantize(matrix, dtype)
+        for dtype in args.dtypes if dtype != "float32"
+    }
+
+    rows: List[Dict] = []
+    for backend in args.backends:
+        start = time.perf_counter()
+        ann = None if backend == "exact" else build_ann(matrix, backend)
+        build_s = time.perf_counter() - start
+        for dtype in args.dtypes:
+            for rescore in ([0] if dtype == "float32" else args.rescore):
+                index = VectorIndex(chunks, matrix, normalized=True, ann=ann,
+                                    quantized=quantized.get(dtype), rescore=rescore)
+                found, latencies = run(index, queries, args.k)
+                rows.append({
+                    "backend": backend,
+                    "dtype": dtype,
+                    "rescore": rescore,
+                    "build_s": build_s,
+                    "scan_mb": index.memory_stats()["scan_mb"],
+                    "p50_ms": float(np.percentile(latencies, 50)),
+                    "p95_ms": float(np.percentile(latencies, 95)),
+                    "recall": recall_at_k(truth, found),
+                })
+
+    print(f"{'backend':<8} {'dtype':<8} {'rescore':>7} {'build s':>8} {'scan MB':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(args.k):>9}")
+    for r in rows:
+        print(f"{r['backend']:<8} {r['dtype']:<8} {r['rescore']:>7} {r['build_s']:>8.2f} "
+              f"{r['scan_mb']:>8.1f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} "
+              f"{r['recall']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BM25 lexical index over the manual chunks.
+
+MiniLM embeddings blur exact tokens such as part codes, fuse labels
+("WW MOTOR 10A"), pin numbers and DTCs. This index scores them exactly and
+runs next to the dense VectorIndex (see VectorIndex.hybrid_search):
+
+    - tokens      : lower-cased alphanumerics, keeping "3.3v", "p0117",
+                    "1.954-2.160" and "10a" as single terms
+    - postings    : CSR arrays per term (term_ptr -> doc ids, int32)
+    - weights     : the full BM25 term weight (IDF x saturated, length-
+                    normalised TF) is precomputed per posting at build
+                    time, so a query is a few scatter-adds into one
+                    float32 score vector
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """Sparse inverted index; row i scores `chunks[i]["text"]`."""
+
+    def __init__(self, chunks: Sequence[Dict],
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(chunks)
+        self.vocabulary: Dict[str, int] = {}
+
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        lengths = np.zeros(self.n_docs, dtype=np.float32)
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk.get("text", ""))
+            lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                doc_ids.append(row)
+                tfs.append(tf)
+
+        n_terms = len(self.vocabulary)
+        term_arr = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_arr, kind="stable")
+        self.term_ptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_arr, minlength=n_terms), out=self.term_ptr[1:])
+        self.doc_ids = np.array(doc_ids, dtype=np.int32)[order]
+
+        df = np.diff(self.term_ptr).astype(np.float32)
+        self.idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        tf = np.array(tfs, dtype=np.float32)[order]
+        avg_len = float(lengths.mean()) if self.n_docs else 0.0
+        norm = self.k1 * (1.0 - self.b + self.b * lengths[self.doc_ids] / (avg_len or 1.0))
+        posting_terms = term_arr[order]
+        self.weights = (
+            self.idf[posting_terms] * tf * (self.k1 + 1.0) / (tf + norm)
+        ).astype(np.float32)
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row (0.0 where no query term occurs)."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term, qtf in Counter(tokenize(query)).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            # Doc ids are unique within a term's postings: plain fancy-add
+            scores[self.doc_ids[start:end]] += qtf * self.weights[start:end]
+        return scores
+
+    def search(self, query: str,
+               mask: Optional[np.ndarray] = None,
+               top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return [(row, bm25 score), ...] for rows matching any query term."""
+        if self.n_docs == 0 or top_k <= 0:
+            return []
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0.0
+        hits = np.flatnonzero(scores > 0.0)
+        if len(hits) > top_k:
+            hits = np.sort(hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]])
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(i), float(scores[i])) for i in hits]
@@ -3,16 +3,34 @@ TATA Nano Diagnostics Chatbot - RAG POC with Smart Image Display
 KG + VectorDB Hybrid (Manual KB, In-Memory)
 """
 
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, render_template_string, request, jsonify, stream_with_context
 from flask_cors import CORS
 import anthropic
+import asyncio
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from typing import List, Dict, Tuple
 import sys
 
+from embedding_store import load_or_encode
+from manual_ingest import MANUAL_PATHS, ingest_manuals
+from rag_cache import (
+    AnswerCache, QueryEmbeddingCache, SemanticAnswerCache,
+    answer_cache_key, entity_signature
+)
+from vector_index import VectorIndex
+from entity_matcher import EntityMatcher
+from kg_store import DIAGNOSTIC_HOPS, REPAIR_HOP, KnowledgeGraphStore, dedupe
+from asgi_app import make_asgi_app
+from ann_index import load_or_build_ann
+from quantization import EMBEDDING_RESCORE, load_or_quantize
+from context_packer import INPUT_TOKEN_BUDGET, make_token_counter, pack_context
+from prompt_templates import PROMPT_TEMPLATE_VERSION, RenderedPrompt
+from claude_prompt import PromptUsage, message_request
+
 app = Flask(__name__)
 CORS(app)
 
@@ -31,8 +49,22 @@ if not ANTHROPIC_API_KEY:
 print(f"✅ API Key loaded: {ANTHROPIC_API_KEY[:20]}...")
 
 # Initialize models
-embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+embedder = SentenceTransformer(EMBEDDING_MODEL)
+count_tokens = make_token_counter(embedder.tokenizer)  # memoised prompt token counts
+query_embeddings = QueryEmbeddingCache()  # LRU: query text -> embedding
+answer_cache = AnswerCache()  # TTL/LRU of Claude answers (optional SQLite)
+semantic_cache = SemanticAnswerCache()  # paraphrases with the same entities
 claude_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+async_claude_client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)  # ASGI mode
+retrieval_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('RETRIEVAL_THREADS', 4)),
+    thread_name_prefix='retrieval'
+)
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+# Claude has room for more evidence and longer answers than the on-device model
+CLAUDE_INPUT_TOKEN_BUDGET = int(os.environ.get('CLAUDE_INPUT_TOKEN_BUDGET', 2 * INPUT_TOKEN_BUDGET))
+CLAUDE_OUTPUT_SCALE = float(os.environ.get('CLAUDE_OUTPUT_SCALE', 2.0))  # x OUTPUT_TOKEN_LIMITS
 
 # HTML Template
 HTML = '''<!DOCTYPE html>
@@ -418,305 +450,215 @@ MANUAL_CHUNKS = [
     }
 ]
 
-# Lazy loading - compute embeddings on first use
-print("✅ Embedder initialized (embeddings computed on first query)")
+# Extra manuals (PDF / JSON / JSONL) listed in MANUAL_PATHS
+if MANUAL_PATHS:
+    ingest_manuals(MANUAL_PATHS, MANUAL_CHUNKS, KNOWLEDGE_GRAPH)
+
+# Eager loading - embeddings are memory-mapped from the on-disk store
+# (encoded and persisted only if MANUAL_CHUNKS or the model changed);
+# ANN_BACKEND=ivf|hnsw adds a persisted ANN index for large manual sets,
+# EMBEDDING_DTYPE=int8|float16 scans a quantized copy (float32 rescoring)
+_embeddings = load_or_encode(MANUAL_CHUNKS, embedder, EMBEDDING_MODEL)
+VECTOR_INDEX = VectorIndex(
+    MANUAL_CHUNKS,
+    _embeddings,
+    normalized=True,
+    ann=load_or_build_ann(_embeddings, MANUAL_CHUNKS, EMBEDDING_MODEL),
+    quantized=load_or_quantize(_embeddings, MANUAL_CHUNKS, EMBEDDING_MODEL),
+    rescore=EMBEDDING_RESCORE
+)
+print("✅ Vector index ready:", len(VECTOR_INDEX), "chunks")
 
 # ==================== ENTITY EXTRACTION ====================
 
+# Keyword / alias tables compiled into entity_matcher (see entity_matcher.py)
+IMAGE_KEYWORDS = ['show', 'display', 'picture', 'image', 'photo', 'diagram', 'where is', 'location of']
+DETAIL_KEYWORDS = ['details', 'detail', 'description', 'describe', 'what is', 'what does', 'tell me', 'explain', 'mean', 'meaning']
+REPAIR_KEYWORDS = ['repair', 'fix', 'steps', 'procedure', 'how to']
+COMPONENT_ALIASES = {
+    "coolant sensor": "Coolant Sensor",
+    "temperature sensor": "Coolant Sensor",
+    "ect sensor": "Coolant Sensor",
+    "radiator fan": "Radiator Fan",
+    "fan": "Radiator Fan",
+    "window motor": "Window Motor",
+    "window": "Window Motor",
+    "thermostat": "Thermostat",
+    "ecu": "ECU"
+}
+# Only counted when the query also names a DTC ("P0117 faulty part")
+PART_ALIASES = {
+    "faulty part": "Coolant Sensor",
+    "part": "Coolant Sensor"
+}
+SYMPTOM_ALIASES = {
+    "continuous fan": "Continuous Fan",
+    "always on": "Continuous Fan",
+    "always running": "Continuous Fan",
+    "won't turn off": "Continuous Fan",
+    "fan running": "Continuous Fan",
+    "fan runs": "Continuous Fan",
+    "sluggish": "Sluggish Performance",
+    "slow": "Sluggish Performance",
+    "cold start": "Cold Start Problem",
+    "won't start": "Cold Start Problem"
+}
+
+def build_entity_matcher() -> EntityMatcher:
+    """Compile KG node names + alias tables into one automaton (built at startup)"""
+    return EntityMatcher.from_knowledge_graph(KNOWLEDGE_GRAPH, {
+        "component": COMPONENT_ALIASES,
+        "part": PART_ALIASES,
+        "symptom": SYMPTOM_ALIASES,
+        "image": {kw: kw for kw in IMAGE_KEYWORDS},
+        "detail": {kw: kw for kw in DETAIL_KEYWORDS},
+        "repair": {kw: kw for kw in REPAIR_KEYWORDS}
+    })
+
+entity_matcher = build_entity_matcher()
+
 def extract_entities(query: str) -> Dict[str, List[str]]:
-    """Enhanced entity extraction with strict image detection"""
-    query_lower = query.lower()
+    """Enhanced entity extraction with strict image detection (single automaton pass)"""
+    found = entity_matcher.match(query)
     
     entities = {
-        "dtc_codes": [],
-        "components": [],
-        "symptoms": [],
+        "dtc_codes": found["dtc"],
+        "components": list(found["component"]),
+        "symptoms": found["symptom"],
         "wants_image": False,
         "query_type": "general"
     }
     
     # VERY STRICT image request detection
     # Must have explicit image words WITHOUT detail/description words
-    image_keywords = ['show', 'display', 'picture', 'image', 'photo', 'diagram', 'where is', 'location of']
-    detail_keywords = ['details', 'detail', 'description', 'describe', 'what is', 'what does', 'tell me', 'explain', 'mean', 'meaning']
-    
-    has_image_keyword = any(word in query_lower for word in image_keywords)
-    has_detail_keyword = any(word in query_lower for word in detail_keywords)
-    
     # CRITICAL: If query has detail/description words, it's NOT an image request
     # Even if it has "show" in "show us details"
-    if has_detail_keyword:
+    if found["detail"]:
         entities["wants_image"] = False
         entities["query_type"] = "explanation"
-    elif has_image_keyword:
+    elif found["image"]:
         entities["wants_image"] = True
         entities["query_type"] = "image_request"
-    elif any(word in query_lower for word in ['repair', 'fix', 'steps', 'procedure', 'how to']):
+    elif found["repair"]:
         entities["query_type"] = "repair"
     else:
         entities["query_type"] = "general"
     
-    # Extract DTC codes
-    dtc_codes = ["p0117", "p0118", "p0300", "p0691"]
-    for dtc in dtc_codes:
-        if dtc in query_lower:
-            entities["dtc_codes"].append(dtc.upper())
-    
-    # Extract components
-    components = {
-        "coolant sensor": "Coolant Sensor",
-        "temperature sensor": "Coolant Sensor",
-        "ect sensor": "Coolant Sensor",
-        "radiator fan": "Radiator Fan",
-        "fan": "Radiator Fan",
-        "window motor": "Window Motor",
-        "window": "Window Motor",
-        "thermostat": "Thermostat",
-        "ecu": "ECU",
-        "faulty part": "Coolant Sensor",  # When asking for "faulty part" with P0117
-        "part": "Coolant Sensor"
-    }
-    for keyword, component in components.items():
-        if keyword in query_lower:
-            if keyword in ["faulty part", "part"] and entities["dtc_codes"]:
-                entities["components"].append(component)
-            elif keyword not in ["faulty part", "part"]:
+    # "faulty part" / "part" only mean the coolant sensor alongside a DTC
+    if entities["dtc_codes"]:
+        for component in found["part"]:
+            if component not in entities["components"]:
                 entities["components"].append(component)
     
-    # Extract symptoms
-    symptoms = {
-        "continuous fan": "Continuous Fan",
-        "always on": "Continuous Fan",
-        "always running": "Continuous Fan",
-        "won't turn off": "Continuous Fan",
-        "fan running": "Continuous Fan",
-        "fan runs": "Continuous Fan",
-        "sluggish": "Sluggish Performance",
-        "slow": "Sluggish Performance",
-        "cold start": "Cold Start Problem",
-        "won't start": "Cold Start Problem"
-    }
-    for keyword, symptom in symptoms.items():
-        if keyword in query_lower:
-            entities["symptoms"].append(symptom)
-    
     return entities
 
 # ==================== KG RETRIEVAL ====================
 
+# Array-backed view of KNOWLEDGE_GRAPH: interned node ids, CSR edges per relation
+kg_store = KnowledgeGraphStore(KNOWLEDGE_GRAPH)
+
 def kg_query(entities: Dict[str, List[str]]) -> List[Tuple[str, str, str]]:
-    """Retrieve triples from knowledge graph"""
+    """Retrieve triples from knowledge graph (ranked: DTC > component > symptom facts)"""
+    query_type = entities.get("query_type")
     triples = []
     
     # Query by DTC codes
+    # Only include repair steps if query type is repair or image request
+    dtc_relations = ["FAULT_CAUSE", "BLINK_CODE", "SYMPTOM", "AFFECTS"]
+    if query_type in ["repair", "image_request"]:
+        dtc_relations.append("REPAIR_STEP")
     for dtc in entities.get("dtc_codes", []):
-        if dtc in KNOWLEDGE_GRAPH:
-            node = KNOWLEDGE_GRAPH[dtc]
-            triples.append((dtc, "FAULT_CAUSE", node.get("fault_cause", "")))
-            triples.append((dtc, "BLINK_CODE", node.get("blink_code", "")))
-            for symptom in node.get("symptoms", []):
-                triples.append((dtc, "SYMPTOM", symptom))
-            for component in node.get("affects", []):
-                triples.append((dtc, "AFFECTS", component))
-            
-            # Only include repair steps if query type is repair or image request
-            if entities.get("query_type") in ["repair", "image_request"]:
-                for step in node.get("repair_steps", [])[:3]:
-                    triples.append((dtc, "REPAIR_STEP", step))
+        triples.extend(kg_store.facts(dtc, dtc_relations, limits={"REPAIR_STEP": 3}))
     
     # Query by components
+    component_relations = ["VOLTAGE", "RESISTANCE", "RELATED_TO", "FUSE"]
+    if query_type in ["image_request", "repair"]:
+        component_relations.insert(0, "LOCATION")
     for component in entities.get("components", []):
-        if component in KNOWLEDGE_GRAPH:
-            node = KNOWLEDGE_GRAPH[component]
-            if "location" in node and entities.get("query_type") in ["image_request", "repair"]:
-                triples.append((component, "LOCATION", node["location"]))
-            if "voltage" in node:
-                triples.append((component, "VOLTAGE", node["voltage"]))
-            if "resistance" in node:
-                triples.append((component, "RESISTANCE", node["resistance"]))
-            if "related_dtcs" in node:
-                for dtc in node["related_dtcs"]:
-                    triples.append((component, "RELATED_TO", dtc))
-            if "fuses" in node:
-                for fuse in node["fuses"]:
-                    triples.append((component, "FUSE", fuse))
+        triples.extend(kg_store.facts(component, component_relations))
     
     # Query by symptoms
-    for symptom in entities.get("symptoms", []):
-        if symptom in KNOWLEDGE_GRAPH:
-            node = KNOWLEDGE_GRAPH[symptom]
-            for dtc in node.get("indicates", []):
-                triples.append((symptom, "INDICATES", dtc))
-            for cause in node.get("caused_by", []):
-                triples.append((symptom, "CAUSED_BY", cause))
+    # Symptom-only queries: multi-hop symptom -> DTC -> component / fuse,
+    # DTCs shared by several symptoms ranked first (memoised per symptom set)
+    symptoms = entities.get("symptoms", [])
+    if symptoms and not entities.get("dtc_codes"):
+        hops = DIAGNOSTIC_HOPS
+        if query_type in ["repair", "image_request"]:
+            hops = hops + (REPAIR_HOP,)
+        ranked = kg_store.multi_hop(tuple(sorted(symptoms)), hops)
+        triples.extend(triple for triple, _score in ranked)
+    else:
+        for symptom in symptoms:
+            triples.extend(kg_store.facts(symptom, ["INDICATES", "CAUSED_BY"]))
     
-    return list(set(triples))[:10]
+    # Deterministic: de-duplicate keeping rank order (no set iteration order)
+    return dedupe(triples)[:10]
 
 # ==================== VECTOR RETRIEVAL ====================
 
-def vector_search(query: str, entities: Dict[str, List[str]], top_k: int = 5) -> List[Dict]:
-    """Retrieve relevant chunks using vector similarity"""
-    # Encode query
-    query_embedding = embedder.encode(query)
+def vector_search(query: str, entities: Dict[str, List[str]], top_k: int = 4,
+                  query_embedding=None) -> List[Dict]:
+    """Retrieve relevant chunks: dense similarity + BM25 (exact codes, fuse labels), fused with RRF"""
+    index = VECTOR_INDEX
     
-    # Filter chunks
-    filtered_chunks = MANUAL_CHUNKS.copy()
+    # Encode query unless the caller already did (LRU-cached: repeated questions skip the encoder)
+    if query_embedding is None:
+        query_embedding = query_embeddings.get_or_encode(query, embedder.encode)
     
-    if entities.get("dtc_codes"):
-        filtered_chunks = [c for c in filtered_chunks if c.get("dtc") in entities["dtc_codes"] or not c.get("dtc")]
-    
-    if entities.get("components"):
-        filtered_chunks = [c for c in filtered_chunks if c.get("component") in entities["components"] or not c.get("component")]
-    
-    # Calculate similarity
-    results = []
-    for chunk in filtered_chunks:
-        # Compute embedding if not cached
-        if "embedding" not in chunk:
-            chunk["embedding"] = embedder.encode(chunk["text"])
-        
-        similarity = cosine_similarity(
-            query_embedding.reshape(1, -1),
-            chunk["embedding"].reshape(1, -1)
-        )[0][0]
-        
-        results.append({
-            "text": chunk["text"],
-            "score": float(similarity),
-            "page": chunk.get("page", "N/A"),
-            "section": chunk.get("section", "N/A")
-        })
-    
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results[:top_k]
+    # Filter (boolean masks) + dense mat-vec and BM25 postings + RRF
+    hits = index.hybrid_search(query_embedding, query, entities, top_k=top_k)
+    return index.results(hits)
 
 # ==================== HYBRID FUSION ====================
 
-def hybrid_fusion(triples: List[Tuple], chunks: List[Dict]) -> Dict:
-    """Combine KG and Vector results"""
-    K = 60
-    kg_score = 0.4 / (K + 1) if triples else 0
-    vector_scores = [chunk["score"] for chunk in chunks]
-    avg_vector_score = sum(vector_scores) / len(vector_scores) if vector_scores else 0
-    
-    return {
-        "kg_weight": 0.4,
-        "vector_weight": 0.6,
-        "kg_score": kg_score,
-        "vector_score": avg_vector_score,
-        "combined_score": (0.4 * kg_score) + (0.6 * avg_vector_score)
-    }
+def hybrid_fusion(query: str, triples: List[Tuple], chunks: List[Dict], query_type: str = "general") -> Dict:
+    """Rank KG triples and vector chunks together (RRF) and pack the best into the input token budget"""
+    return pack_context(query, triples, chunks, query_type, count_tokens=count_tokens,
+                        input_budget=CLAUDE_INPUT_TOKEN_BUDGET, output_scale=CLAUDE_OUTPUT_SCALE,
+                        backend="claude", kg_weight=0.4, vector_weight=0.6)
 
 # ==================== CLAUDE GENERATION ====================
 
-def generate_answer(query: str, triples: List[Tuple], chunks: List[Dict], query_type: str = "general") -> str:
-    """Generate answer using Claude with context-aware formatting"""
-    
-    # Format triples
-    triples_text = "\n".join([
-        f"- {subj} --[{pred}]--> {obj}"
-        for subj, pred, obj in triples[:5]
-    ]) if triples else "No specific graph relationships found."
-    
-    # Format chunks
-    chunks_text = "\n\n".join([
-        f"[Page {chunk['page']}, {chunk['section']}]\n{chunk['text']}"
-        for chunk in chunks[:3]
-    ]) if chunks else "No relevant manual sections found."
-    
-    # Adjust instructions based on query type
-    if query_type == "explanation":
-        response_sections = """
-2. For DTC explanation queries (details/description WITHOUT image request), include ONLY:
-   - <h3>📋 [DTC Code]: [Description]</h3>
-   - <h4>🔍 What This Means</h4>
-   - <h4>⚠️ Symptoms You Might Notice</h4>
-   - <h4>🔍 Most Likely Causes</h4>
-   
-   STRICTLY EXCLUDE:
-   - Repair steps or procedures
-   - Detailed location information
-   - Component specifications (voltage, resistance, pin details)
-   - Installation or removal instructions
-   
-   Keep response concise - focused ONLY on understanding the problem."""
-    
-    elif query_type == "image_request":
-        response_sections = """
-2. For image/location requests (show/picture/diagram), include:
-   - <h3>📋 [Component Name]: [Brief Description]</h3>
-   - <h4>📍 Component Location</h4> (detailed physical location)
-   - <h4>🔌 Connection Details</h4> (pin numbers, wire colors, connector type)
-   - <h4>🔧 Quick Visual Check</h4> (what to look for visually)
-   
-   Provide detailed location and connection info since images will be displayed."""
-    
-    elif query_type == "repair":
-        response_sections = """
-2. For repair queries, include:
-   - <h3>📋 [DTC Code]: [Description]</h3>
-   - <h4>🔍 What This Means</h4>
-   - <h4>🔧 Repair Procedure</h4> (numbered steps)
-   - <h4>📍 Component Location</h4>
-   - <h4>⚠️ Important Notes</h4>"""
+ANSWER_ERROR_PREFIX = "⚠️ Error generating response"  # never cached
+
+# System blocks (cached instructions first, then the retrieved context) and
+# prompt-cache accounting live in claude_prompt.py; the /api/health
+# "prompt_cache" totals show whether cache reads actually happen.
+prompt_usage = PromptUsage()
+
+def generate_answer(query: str, prompt: RenderedPrompt, max_tokens: int = 2048, client=None) -> str:
+    """Generate answer using Claude with context-aware formatting (client defaults to claude_client)"""
+    request = message_request(CLAUDE_MODEL, query, prompt, max_tokens)
     
-    else:
-        response_sections = """
-2. For general queries, provide appropriate sections based on context."""
-    
-    # Enhanced system prompt
-    system_prompt = f"""You are an expert TATA Nano diagnostic technician assistant.
-
-KNOWLEDGE GRAPH RELATIONSHIPS:
-{triples_text}
-
-RELEVANT MANUAL SECTIONS:
-{chunks_text}
-
-CRITICAL FORMATTING INSTRUCTIONS:
-1. Structure your response with clear HTML formatting:
-   - Use <h3> for main headings
-   - Use <h4> for subheadings
-   - Use <strong> for emphasis
-   - Use <ul> and <li> for bullet lists
-   - Use <ol> and <li> for numbered lists
-   - Use <p> for paragraphs
-
-{response_sections}
-
-3. Always cite page numbers when available
-4. End with: <p><em>Source: TATA Nano EMS Service Manual v5.0</em></p>
-
-ANSWER STYLE:
-- Professional but accessible
-- Use automotive terminology correctly
-- Match detail level EXACTLY to query type
-- Provide ONLY what's requested
-
-CRITICAL RULES FOR EXPLANATION QUERIES:
-- If user asks for "details" or "description" WITHOUT mentioning images/pictures/show:
-  * Give ONLY: explanation, symptoms, causes
-  * DO NOT include: repair steps, location details, pin numbers, connector specs, voltages, resistance values
-  * Keep it diagnostic understanding ONLY
-  
-- If user asks to "show" or wants "picture/image/location":
-  * Include detailed location, connector info, pin numbers
-  * Images will be added automatically
-
-NEVER make up information not in the provided context."""
+    try:
+        response = (client or claude_client).messages.create(**request)
+        prompt_usage.record(response.usage)
+        return response.content[0].text
+    except Exception as e:
+        return f"{ANSWER_ERROR_PREFIX}: {str(e)}"
 
+async def generate_answer_async(query: str, prompt: RenderedPrompt, max_tokens: int = 2048, client=None) -> str:
+    """Awaitable generate_answer (AsyncAnthropic) for the ASGI serving mode"""
+    request = message_request(CLAUDE_MODEL, query, prompt, max_tokens)
+    
     try:
-        response = claude_client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=2048,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": query}
-            ]
-        )
+        response = await (client or async_claude_client).messages.create(**request)
+        prompt_usage.record(response.usage, kind="async")
         return response.content[0].text
     except Exception as e:
-        return f"⚠️ Error generating response: {str(e)}"
+        return f"{ANSWER_ERROR_PREFIX}: {str(e)}"
+
+def stream_answer(query: str, prompt: RenderedPrompt, max_tokens: int = 2048, client=None):
+    """Same as generate_answer, but yields text deltas as Claude produces them"""
+    request = message_request(CLAUDE_MODEL, query, prompt, max_tokens)
+    
+    try:
+        with (client or claude_client).messages.stream(**request) as stream:
+            for text in stream.text_stream:
+                yield text
+            prompt_usage.record(stream.get_final_message().usage, kind="stream")
+    except Exception as e:
+        yield f"{ANSWER_ERROR_PREFIX}: {str(e)}"
 
 # ==================== IMAGE HANDLING ====================
 
@@ -769,50 +711,190 @@ def add_images_to_response(response: str, entities: Dict, triples: List[Tuple],
 def home():
     return render_template_string(HTML)
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    query = request.json.get('message', '')
-    
+def retrieve_context(query: str) -> Dict:
+    """Steps 1-4 of the pipeline, shared by /api/chat and /api/chat/stream"""
     # Step 1: Entity extraction
     entities = extract_entities(query)
     
     # Step 2: KG retrieval
     triples = kg_query(entities)
     
-    # Step 3: Vector retrieval
-    chunks = vector_search(query, entities, top_k=5)
+    # Step 3: Vector retrieval (the query is encoded once, reused by the semantic cache)
+    query_embedding = query_embeddings.get_or_encode(query, embedder.encode)
+    chunks = vector_search(query, entities, top_k=4, query_embedding=query_embedding)
+    
+    # Step 4: Hybrid fusion (RRF) packs the best evidence into the input token budget
+    # (embedder tokenizer) and renders the template for the query type
+    packed = hybrid_fusion(query, triples, chunks, entities.get("query_type", "general"))
+    fusion, prompt = packed["fusion"], packed["prompt"]
+    triples, chunks = prompt.triples, prompt.chunks
+    
+    return {
+        "entities": entities,
+        "triples": triples,
+        "chunks": chunks,
+        "prompt": prompt,
+        "max_tokens": packed["max_output_tokens"],
+        "input_tokens": packed["input_tokens"],
+        "fusion_scores": fusion,
+        "cache_key": answer_cache_key(query, entities, chunks, CLAUDE_MODEL, PROMPT_TEMPLATE_VERSION),
+        "signature": entity_signature(entities, chunks, CLAUDE_MODEL, PROMPT_TEMPLATE_VERSION),
+        "query_embedding": query_embedding
+    }
+
+def cached_answer(ctx: Dict):
+    """Exact answer cache first, then semantic (paraphrase) cache -> (answer, status)"""
+    answer = answer_cache.get(ctx["cache_key"])
+    if answer is not None:
+        return answer, "hit"
+    answer = semantic_cache.get(ctx["query_embedding"], ctx["signature"])
+    if answer is not None:
+        return answer, "semantic_hit"
+    return None, "miss"
+
+def remember_answer(ctx: Dict, answer: str):
+    # "in", not startswith: a stream can fail after some text arrived
+    if answer and ANSWER_ERROR_PREFIX not in answer:
+        answer_cache.put(ctx["cache_key"], answer)
+        semantic_cache.put(ctx["query_embedding"], ctx["signature"], answer)
+
+def response_sources(ctx: Dict) -> Dict:
+    return {
+        "kg_triples": len(ctx["triples"]),
+        "vector_chunks": len(ctx["chunks"]),
+        "scores": f"KG:{ctx['fusion_scores']['kg_score']:.3f}, Vec:{ctx['fusion_scores']['vector_score']:.3f}",
+        "context_tokens": ctx["fusion_scores"]["tokens"],
+        "prompt_tokens": ctx["input_tokens"],
+        "max_tokens": ctx["max_tokens"],
+        "dropped": ctx["fusion_scores"]["dropped"] + ctx["prompt"].trimmed
+    }
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    query = request.json.get('message', '')
     
-    # Step 4: Hybrid fusion
-    fusion_scores = hybrid_fusion(triples, chunks)
+    # Steps 1-4: entities, KG, vectors, fusion
+    ctx = retrieve_context(query)
+    entities = ctx["entities"]
     
-    # Step 5: Generate answer with Claude (context-aware)
-    answer = generate_answer(query, triples, chunks, query_type=entities.get("query_type", "general"))
+    # Step 5: Generate answer with Claude (context-aware), unless the exact
+    # prompt or a paraphrase with the same entities was already answered
+    answer, cache_status = cached_answer(ctx)
+    if answer is None:
+        answer = generate_answer(query, ctx["prompt"], max_tokens=ctx["max_tokens"])
+        remember_answer(ctx, answer)
     
+    return jsonify(chat_response(query, ctx, answer, cache_status))
+
+def chat_response(query: str, ctx: Dict, answer: str, cache_status: str) -> Dict:
+    """Steps 6-7: images (only if explicitly requested) + response payload"""
     # Step 6: Add images ONLY if explicitly requested (not for explanation queries)
-    answer = add_images_to_response(answer, entities, triples, query)
+    answer = add_images_to_response(answer, ctx["entities"], ctx["triples"], query)
     
     # Step 7: Format response
-    response = {
+    return {
         "answer": answer,
-        "sources": {
-            "kg_triples": len(triples),
-            "vector_chunks": len(chunks),
-            "scores": f"KG:{fusion_scores['kg_score']:.2f}, Vec:{fusion_scores['vector_score']:.2f}"
-        },
-        "entities": entities
+        "cache": cache_status,
+        "sources": response_sources(ctx),
+        "entities": ctx["entities"]
     }
-    
-    return jsonify(response)
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming /api/chat over Server-Sent Events:
+      meta  -> {cache, sources, entities} right after retrieval
+      token -> {"text": ...} for each Claude text delta
+      done  -> {"answer": ...} final HTML (with images, if requested)
+      error -> {"error": ...} instead of done if the pipeline failed
+    """
+    query = (request.get_json(silent=True) or {}).get('message', '')
+    
+    def generate():
+        try:
+            ctx = retrieve_context(query)
+            entities = ctx["entities"]
+            answer, cache_status = cached_answer(ctx)
+            
+            yield sse_event("meta", {
+                "cache": cache_status,
+                "sources": response_sources(ctx),
+                "entities": entities
+            })
+            
+            if answer is None:
+                parts = []
+                for text in stream_answer(query, ctx["prompt"], max_tokens=ctx["max_tokens"]):
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+                answer = "".join(parts)
+                remember_answer(ctx, answer)
+            else:
+                yield sse_event("token", {"text": answer})
+            
+            answer = add_images_to_response(answer, entities, ctx["triples"], query)
+            yield sse_event("done", {"answer": answer})
+        except Exception as e:
+            # Always end the stream with a terminal event so the client stops waiting
+            yield sse_event("error", {"error": f"Error during RAG process: {str(e)}"})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/health', methods=['GET'])
 def health():
-    return jsonify({
+    return jsonify(health_payload())
+
+def health_payload() -> Dict:
+    return {
         "status": "healthy",
         "mode": "POC - Manual KB",
         "kg_nodes": len(KNOWLEDGE_GRAPH),
         "vector_chunks": len(MANUAL_CHUNKS),
-        "claude_api": "configured" if ANTHROPIC_API_KEY else "missing"
-    })
+        "vector_index": VECTOR_INDEX.memory_stats(),
+        "claude_api": "configured" if ANTHROPIC_API_KEY else "missing",
+        "query_cache": query_embeddings.stats(),
+        "answer_cache": answer_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "llm_calls_avoided": answer_cache.hits + semantic_cache.hits,
+        "prompt_cache": prompt_usage.stats()
+    }
+
+# ==================== ASYNC SERVING MODE (ASGI) ====================
+# gunicorn -k uvicorn.workers.UvicornWorker chatbot_backend:asgi_app
+# Retrieval runs on retrieval_pool, the Claude call is awaited, so one
+# process serves many concurrent technicians.
+
+async def home_async(_data):
+    return 200, HTML
+
+async def chat_async(data):
+    query = data.get('message', '')
+    loop = asyncio.get_running_loop()
+    ctx = await loop.run_in_executor(retrieval_pool, retrieve_context, query)
+    
+    answer, cache_status = cached_answer(ctx)
+    if answer is None:
+        answer = await generate_answer_async(query, ctx["prompt"], max_tokens=ctx["max_tokens"])
+        remember_answer(ctx, answer)
+    
+    return 200, chat_response(query, ctx, answer, cache_status)
+
+async def health_async(_data):
+    return 200, health_payload()
+
+asgi_app = make_asgi_app({
+    ('GET', '/'): home_async,
+    ('POST', '/api/chat'): chat_async,
+    ('GET', '/api/health'): health_async
+})
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
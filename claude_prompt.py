@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Claude Messages API requests with prompt caching, and cache usage totals.
+
+The instruction block of a rendered prompt (prompt_templates.py) is the
+same for every request of a query_type, so message_request() sends it as
+the first `system` block and the retrieved context as a second one:
+
+    system = [instructions (cache_control), context]
+
+Anthropic only caches a prefix that reaches the model's minimum cacheable
+length (1024 tokens for Sonnet, 2048 for Haiku); shorter prefixes are
+processed normally and the marker costs nothing. The current
+instructions are roughly 450-550 tokens, so reads only start once they
+grow past the minimum (or on a model with a smaller one). PromptUsage
+logs cache reads / writes per call, which shows whether that happens.
+"""
+
+import threading
+from typing import Dict, List
+
+from prompt_templates import RenderedPrompt
+
+PROMPT_CACHE_CONTROL = {"type": "ephemeral"}
+
+_USAGE_KEYS = ("input_tokens", "cache_read_input_tokens",
+               "cache_creation_input_tokens", "output_tokens")
+
+
+def system_blocks(prompt: RenderedPrompt) -> List[Dict]:
+    """Cached instructions first, then the per-request context."""
+    return [
+        {"type": "text", "text": prompt.instructions, "cache_control": PROMPT_CACHE_CONTROL},
+        {"type": "text", "text": prompt.context},
+    ]
+
+
+def message_request(model: str,
+                    query: str,
+                    prompt: RenderedPrompt,
+                    max_tokens: int) -> Dict:
+    """Keyword arguments for client.messages.create() / .stream()."""
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": system_blocks(prompt),
+        "messages": [{"role": "user", "content": query}],
+    }
+
+
+class PromptUsage:
+    """Thread-safe totals of cached vs uncached input tokens across calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, **{key: 0 for key in _USAGE_KEYS}}
+
+    def record(self, usage, kind: str = "create") -> Dict:
+        """Add one response's `usage` to the totals and log it."""
+        counts = {key: getattr(usage, key, None) or 0 for key in _USAGE_KEYS}
+        with self._lock:
+            self._totals["requests"] += 1
+            for key, value in counts.items():
+                self._totals[key] += value
+        print(f"💰 Claude {kind}: input {counts['input_tokens']} uncached, "
+              f"{counts['cache_read_input_tokens']} cache read, "
+              f"{counts['cache_creation_input_tokens']} cache write, "
+              f"output {counts['output_tokens']}")
+        return counts
+
+    def stats(self) -> Dict:
+        with self._lock:
+            totals = dict(self._totals)
+        prompt_tokens = (totals["input_tokens"] + totals["cache_read_input_tokens"]
+                         + totals["cache_creation_input_tokens"])
+        totals["cached_fraction"] = (
+            round(totals["cache_read_input_tokens"] / prompt_tokens, 3) if prompt_tokens else 0.0
+        )
+        return totals
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reciprocal rank fusion of KG evidence and vector hits into one context.
+
+Both backends used to send triples[:5] and chunks[:3] to the LLM no matter
+how relevant they were. fuse_context() instead ranks every candidate in a
+single list and keeps the best ones that fit a token budget:
+
+    score(item) = kg_weight     / (k + kg_rank)
+                + vector_weight / (k + vector_rank)
+
+A triple's kg_rank is its position in kg_query()'s ranking and a chunk's
+vector_rank its position in the vector results. Evidence also counts for
+the other list when the two agree: a chunk that mentions the subject or
+object of a triple gets that triple's kg_rank, and a triple mentioned in a
+chunk gets that chunk's vector_rank. Corroborated items therefore rise to
+the top and uncorroborated tail results are the first to be dropped.
+"""
+
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+Triple = Tuple[str, str, str]
+
+RRF_K = int(os.environ.get("RRF_K", "60"))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "800"))
+
+# Terms shorter than this ("5V", "A") match too much text to corroborate
+_MIN_TERM_LENGTH = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return max(1, len(text) // 4)
+
+
+def format_triple(triple: Triple) -> str:
+    subj, pred, obj = triple
+    return f"- {subj} --[{pred}]--> {obj}"
+
+
+def format_chunk(chunk: Dict) -> str:
+    return f"[Page {chunk['page']}, {chunk['section']}]\n{chunk['text']}"
+
+
+def _terms(triple: Triple) -> List[str]:
+    subj, _pred, obj = triple
+    return [t.lower() for t in (subj, obj) if len(t) >= _MIN_TERM_LENGTH]
+
+
+def fuse_context(triples: Sequence[Triple],
+                 chunks: Sequence[Dict],
+                 kg_weight: float = 0.4,
+                 vector_weight: float = 0.6,
+                 k: int = RRF_K,
+                 token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 count_tokens: Callable[[str], int] = estimate_tokens) -> Dict:
+    """
+    Fuse ranked `triples` and `chunks` and select context within budget.
+
+    Returns {"triples", "chunks"} (selected, each in fused order) plus
+    "ranked" (every candidate with its RRF score), the selected "tokens",
+    "token_budget", "dropped" and the summed "kg_score" / "vector_score"
+    of the selected items. The best item is always kept, even over budget.
+    """
+    chunk_texts = [c["text"].lower() for c in chunks]
+    triple_terms = [_terms(t) for t in triples]
+
+    candidates: List[Dict] = []
+    for kg_rank, triple in enumerate(triples, start=1):
+        vector_rank: Optional[int] = None
+        for rank, text in enumerate(chunk_texts, start=1):
+            if any(term in text for term in triple_terms[kg_rank - 1]):
+                vector_rank = rank
+                break
+        candidates.append({"kind": "triple", "item": triple, "text": format_triple(triple),
+                           "kg_rank": kg_rank, "vector_rank": vector_rank})
+
+    for vector_rank, (chunk, text) in enumerate(zip(chunks, chunk_texts), start=1):
+        kg_rank = None
+        for rank, terms in enumerate(triple_terms, start=1):
+            if any(term in text for term in terms):
+                kg_rank = rank
+                break
+        candidates.append({"kind": "chunk", "item": chunk, "text": format_chunk(chunk),
+                           "kg_rank": kg_rank, "vector_rank": vector_rank})
+
+    for cand in candidates:
+        kg_part = kg_weight / (k + cand["kg_rank"]) if cand["kg_rank"] else 0.0
+        vec_part = vector_weight / (k + cand["vector_rank"]) if cand["vector_rank"] else 0.0
+        cand["kg_score"] = kg_part
+        cand["vector_score"] = vec_part
+        cand["score"] = kg_part + vec_part
+
+    # Stable sort: ties keep KG-before-vector and original rank order
+    candidates.sort(key=lambda c: -c["score"])
+
+    selected: List[Dict] = []
+    used = 0
+    for cand in candidates:
+        cost = count_tokens(cand["text"])
+        if selected and used + cost > token_budget:
+            continue   # a smaller, lower-ranked item may still fit
+        selected.append(cand)
+        used += cost
+
+    return {
+        "triples": [c["item"] for c in selected if c["kind"] == "triple"],
+        "chunks": [c["item"] for c in selected if c["kind"] == "chunk"],
+        "ranked": [
+            {"kind": c["kind"], "score": round(c["score"], 5),
+             "kg_rank": c["kg_rank"], "vector_rank": c["vector_rank"]}
+            for c in candidates
+        ],
+        "tokens": used,
+        "token_budget": token_budget,
+        "dropped": len(candidates) - len(selected),
+        "kg_score": sum(c["kg_score"] for c in selected),
+        "vector_score": sum(c["vector_score"] for c in selected),
+    }
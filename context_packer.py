@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token-budget-aware packing of the prompt context and the answer length.
+
+Context selection used to be budgeted with a ~4 characters/token guess
+and every answer was allowed the same fixed length (num_predict=768 on
+Ollama, max_tokens=2048 on Claude). pack_context() does this instead:
+
+    - counts tokens with a real local tokenizer (the embedder's, which is
+      already loaded), memoised per text since the same manual chunks come
+      back across queries
+    - derives the evidence budget from INPUT_TOKEN_BUDGET minus the
+      static instructions and the user query, fuses the KG triples and
+      vector chunks into it (fuse_context), then renders the template
+      with the same counter as a final guard
+    - picks the output limit from OUTPUT_TOKEN_LIMITS by query_type:
+      explanations are much shorter than step-by-step repair procedures,
+      and on the on-device box every token not generated is time saved
+
+The MiniLM WordPiece tokenizer is not the LLM's tokenizer; it usually
+splits English text and part numbers into more pieces than the Gemma or
+Claude tokenizers do, so its counts err on the safe (shorter) side.
+"""
+
+import os
+from functools import lru_cache
+from typing import Callable, Dict, Sequence, Tuple
+
+from context_fusion import estimate_tokens, fuse_context
+from prompt_templates import get_template, render_prompt
+
+# Instructions + evidence + user query. With the default output limits this
+# stays inside Ollama's default 2048-token context window.
+INPUT_TOKEN_BUDGET = int(os.environ.get("INPUT_TOKEN_BUDGET", "1280"))
+
+# Max answer tokens per query_type (Ollama num_predict, Claude max_tokens)
+OUTPUT_TOKEN_LIMITS: Dict[str, int] = {
+    "explanation": int(os.environ.get("OUTPUT_TOKENS_EXPLANATION", "384")),
+    "image_request": int(os.environ.get("OUTPUT_TOKENS_IMAGE_REQUEST", "512")),
+    "repair": int(os.environ.get("OUTPUT_TOKENS_REPAIR", "768")),
+    "general": int(os.environ.get("OUTPUT_TOKENS_GENERAL", "512")),
+}
+
+Triple = Tuple[str, str, str]
+
+
+def make_token_counter(tokenizer=None, cache_size: int = 4096) -> Callable[[str], int]:
+    """
+    Memoised `text -> token count` using a Hugging Face tokenizer (e.g.
+    SentenceTransformer(...).tokenizer); estimate_tokens when None.
+    """
+    if tokenizer is None:
+        return estimate_tokens
+
+    @lru_cache(maxsize=cache_size)
+    def count_tokens(text: str) -> int:
+        # verbose=False: manual chunks can exceed the encoder's 512-token
+        # limit, which only matters for embedding, not for counting
+        return max(1, len(tokenizer.encode(text, add_special_tokens=False, verbose=False)))
+
+    return count_tokens
+
+
+def output_token_limit(query_type: str, scale: float = 1.0) -> int:
+    """Answer length for `query_type`; `scale` widens it for larger models."""
+    limit = OUTPUT_TOKEN_LIMITS.get(query_type, OUTPUT_TOKEN_LIMITS["general"])
+    return int(limit * scale)
+
+
+def pack_context(query: str,
+                 triples: Sequence[Triple],
+                 chunks: Sequence[Dict],
+                 query_type: str = "general",
+                 count_tokens: Callable[[str], int] = estimate_tokens,
+                 input_budget: int = INPUT_TOKEN_BUDGET,
+                 output_scale: float = 1.0,
+                 backend: str = "ollama",
+                 **fusion_kwargs) -> Dict:
+    """
+    Fuse and render the best evidence that fits `input_budget`.
+
+    Returns {"fusion": fuse_context() result, "prompt": RenderedPrompt,
+    "input_tokens": instructions + context + query, "max_output_tokens"}.
+    """
+    template = get_template(query_type, backend)
+    query_tokens = count_tokens(query)
+    prompt_budget = max(0, input_budget - query_tokens)
+    evidence_budget = max(0, prompt_budget - count_tokens(template.instructions))
+
+    fusion = fuse_context(triples, chunks, token_budget=evidence_budget,
+                          count_tokens=count_tokens, **fusion_kwargs)
+    prompt = render_prompt(fusion["triples"], fusion["chunks"], query_type, backend,
+                           token_budget=prompt_budget, count_tokens=count_tokens)
+    return {
+        "fusion": fusion,
+        "prompt": prompt,
+        "input_tokens": prompt.tokens + query_tokens,
+        "max_output_tokens": output_token_limit(query_type, output_scale),
+    }
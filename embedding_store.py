@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk embedding store for the manual chunks.
+
+Layout (one pair of files per embedding model):
+
+    <EMBEDDING_CACHE_DIR>/<model-slug>.npy    float32 [n_chunks, dim], rows L2-normalised
+    <EMBEDDING_CACHE_DIR>/<model-slug>.json   sidecar: model name + chunk id/text hash per row
+                                              + fingerprint (rows, sha1) of the .npy
+
+On startup the sidecar is compared with the current chunk list. If the model
+and every (id, hash) pair match, the .npy file is memory-mapped read-only, so
+the encoder is never called and gunicorn workers share the same page-cache
+pages. Otherwise only the added / edited chunks are re-encoded (diffed by
+chunk id + text hash) and the files are rewritten.
+
+The .npy is renamed into place first and the sidecar last. A crash in
+between leaves a sidecar whose .npy fingerprint no longer matches, so the
+store is treated as stale instead of pairing new rows with old metadata.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".nano_cache"),
+)
+
+STORE_VERSION = 2
+
+
+def text_hash(text: str) -> str:
+    """Stable content hash used to detect edited chunks."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name).strip("_")
+
+
+def store_paths(model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR):
+    """Return (npy_path, sidecar_path) for `model_name`."""
+    base = os.path.join(cache_dir, _model_slug(model_name))
+    return base + ".npy", base + ".json"
+
+
+def _chunk_keys(chunks: Sequence[Dict]) -> List[Dict[str, str]]:
+    return [{"id": str(c["id"]), "hash": text_hash(c["text"])} for c in chunks]
+
+
+def store_fingerprint(chunks: Sequence[Dict], model_name: str) -> str:
+    """Hash of model + every (id, text hash); derived indexes key on this."""
+    raw = json.dumps([model_name, _chunk_keys(chunks)], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def matrix_fingerprint(npy_path: str, block_size: int = 1 << 20) -> Dict:
+    """Row count + sha1 of a .npy file, recorded in (and checked against) the sidecar."""
+    digest = hashlib.sha1()
+    with open(npy_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    rows = np.load(npy_path, mmap_mode="r").shape[0]
+    return {"rows": int(rows), "sha1": digest.hexdigest()}
+
+
+def _read_store(npy_path: str, meta_path: str, model_name: str):
+    """(sidecar, memmap) if both files belong together, else (None, None)."""
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION or meta.get("model") != model_name:
+            return None, None
+        if meta.get("matrix") != matrix_fingerprint(npy_path):
+            return None, None
+        matrix = np.load(npy_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None, None
+    if matrix.dtype != np.float32 or matrix.shape[0] != len(meta.get("chunks", [])):
+        return None, None
+    return meta, matrix
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return np.ascontiguousarray(embeddings / norms, dtype=np.float32)
+
+
+def load_embeddings(chunks: Sequence[Dict],
+                    model_name: str,
+                    cache_dir: str = EMBEDDING_CACHE_DIR) -> Optional[np.ndarray]:
+    """
+    Memory-map the cached embeddings if they match `chunks` exactly.
+
+    Returns None when the cache is missing, stale or unreadable, or when
+    the .npy does not match the fingerprint in the sidecar.
+    """
+    meta, matrix = _read_store(*store_paths(model_name, cache_dir), model_name)
+    if meta is None or meta.get("chunks") != _chunk_keys(chunks):
+        return None
+    return matrix
+
+
+def save_embeddings(chunks: Sequence[Dict],
+                    model_name: str,
+                    embeddings: np.ndarray,
+                    cache_dir: str = EMBEDDING_CACHE_DIR) -> None:
+    """
+    Write normalised embeddings + sidecar.
+
+    Both files are written to temp paths and renamed into place with
+    os.replace, so a reader never maps a half-written .npy. The sidecar
+    goes last and carries the .npy fingerprint.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    npy_path, meta_path = store_paths(model_name, cache_dir)
+    embeddings = _normalize(embeddings)
+
+    tmp_npy = f"{npy_path}.{os.getpid()}.tmp"
+    with open(tmp_npy, "wb") as f:
+        np.save(f, embeddings)
+    fingerprint = matrix_fingerprint(tmp_npy)
+    os.replace(tmp_npy, npy_path)
+
+    dim = int(embeddings.shape[1]) if embeddings.ndim == 2 else 0
+    _write_sidecar(meta_path, chunks, model_name, dim, fingerprint)
+
+
+def encode_in_batches(texts: Sequence[str],
+                      embedder,
+                      batch_size: int = 64) -> Iterator[np.ndarray]:
+    """
+    Yield L2-normalised float32 embeddings for `texts`, one batch at a time.
+
+    Only `batch_size` texts are in the encoder at once, so peak memory does
+    not grow with the size of the manual. Throughput is printed at the end.
+    """
+    start = time.perf_counter()
+    done = 0
+    for i in range(0, len(texts), batch_size):
+        batch = list(texts[i:i + batch_size])
+        emb = embedder.encode(batch, batch_size=batch_size, convert_to_numpy=True)
+        done += len(batch)
+        yield _normalize(emb)
+
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else float("inf")
+    print(f"   - Encoded {done} chunks in {elapsed:.1f}s ({rate:.1f} chunks/s)")
+
+
+def _load_previous(model_name: str, cache_dir: str):
+    """Return (memmap, {(id, hash): row}) of the current store, or (None, {})."""
+    meta, matrix = _read_store(*store_paths(model_name, cache_dir), model_name)
+    if meta is None:
+        return None, {}
+    return matrix, {(k["id"], k["hash"]): row for row, k in enumerate(meta["chunks"])}
+
+
+def _write_sidecar(meta_path: str, chunks: Sequence[Dict],
+                   model_name: str, dim: int, fingerprint: Dict) -> None:
+    meta = {
+        "version": STORE_VERSION,
+        "model": model_name,
+        "dim": dim,
+        "dtype": "float32",
+        "matrix": fingerprint,
+        "chunks": _chunk_keys(chunks),
+    }
+    tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+
+
+def _prepend(first, rest: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+    if first is not None:
+        yield first
+    yield from rest
+
+
+def encode_to_store(chunks: Sequence[Dict],
+                    embedder,
+                    model_name: str,
+                    cache_dir: str = EMBEDDING_CACHE_DIR,
+                    batch_size: int = 64) -> Dict[str, int]:
+    """
+    Incrementally (re)build the on-disk store for `chunks`.
+
+    The new chunk list is diffed against the persisted sidecar by
+    (chunk id, text hash):
+      - unchanged chunks reuse their old row (no encoder call),
+      - added / edited chunks are batch-encoded,
+      - removed chunks are simply not copied over.
+
+    Rows are written into a memory-mapped temp .npy and renamed into place,
+    so readers holding the old memmap keep a consistent view until they
+    swap to the new one; the sidecar follows with the new fingerprint. Returns {"reused", "encoded", "removed"} counts.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    npy_path, meta_path = store_paths(model_name, cache_dir)
+    tmp_npy = f"{npy_path}.{os.getpid()}.tmp"
+
+    old_matrix, old_rows = _load_previous(model_name, cache_dir)
+    keys = [(k["id"], k["hash"]) for k in _chunk_keys(chunks)]
+    reuse = [(row, old_rows[key]) for row, key in enumerate(keys) if key in old_rows]
+    to_encode = [row for row, key in enumerate(keys) if key not in old_rows]
+
+    new_batches = encode_in_batches(
+        [chunks[row]["text"] for row in to_encode], embedder, batch_size
+    )
+    if old_matrix is not None and old_matrix.shape[0] > 0:
+        dim = int(old_matrix.shape[1])
+    else:
+        # Dimension comes from the first encoded batch
+        first = next(new_batches, None)
+        dim = int(first.shape[1]) if first is not None else 0
+        new_batches = _prepend(first, new_batches)
+
+    out = np.lib.format.open_memmap(
+        tmp_npy, mode="w+", dtype=np.float32, shape=(len(chunks), dim),
+    )
+    if reuse:
+        new_idx, old_idx = (np.array(ix) for ix in zip(*reuse))
+        out[new_idx] = old_matrix[old_idx]
+
+    pos = 0
+    for emb in new_batches:
+        out[to_encode[pos:pos + len(emb)]] = emb
+        pos += len(emb)
+    out.flush()
+    del out
+    fingerprint = matrix_fingerprint(tmp_npy)
+    os.replace(tmp_npy, npy_path)
+    _write_sidecar(meta_path, chunks, model_name, dim, fingerprint)
+
+    kept = set(keys)
+    stats = {
+        "reused": len(reuse),
+        "encoded": len(to_encode),
+        "removed": sum(1 for key in old_rows if key not in kept),
+    }
+    print(
+        f"   - Embedding store: {stats['reused']} reused, "
+        f"{stats['encoded']} encoded, {stats['removed']} removed"
+    )
+    return stats
+
+
+def load_or_encode(chunks: Sequence[Dict],
+                   embedder,
+                   model_name: str,
+                   cache_dir: str = EMBEDDING_CACHE_DIR,
+                   batch_size: int = 64) -> np.ndarray:
+    """
+    Return L2-normalised float32 embeddings for `chunks`.
+
+    Cache hit  -> read-only memmap, encoder not called.
+    Cache miss -> encode only added/edited chunks into the store
+                  (encode_to_store), then memory-map the new file.
+    """
+    if not chunks:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    cached = load_embeddings(chunks, model_name, cache_dir)
+    if cached is not None:
+        print(f"✅ Loaded {len(chunks)} chunk embeddings from {cache_dir}")
+        return cached
+
+    print(f"⏳ Updating embedding store for {len(chunks)} chunks ({model_name}) ...")
+    try:
+        encode_to_store(chunks, embedder, model_name, cache_dir, batch_size)
+    except OSError as e:
+        print(f"⚠️ Could not write embedding cache to {cache_dir}: {e}")
+        return np.concatenate(
+            list(encode_in_batches([c["text"] for c in chunks], embedder, batch_size))
+        )
+
+    mapped = load_embeddings(chunks, model_name, cache_dir)
+    if mapped is None:
+        raise RuntimeError(f"Embedding store in {cache_dir} is unreadable")
+    return mapped
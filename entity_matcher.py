@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-pass entity extraction with a compiled Aho-Corasick automaton.
+
+Both backends used to lowercase the query and test `kw in q` for every
+keyword of several dicts (O(keywords x query length) per request, and
+"fan" matched inside "fanbelt"). Instead, one automaton is built at
+startup from:
+
+    - KNOWLEDGE_GRAPH node names (Component / Symptom nodes),
+    - the backend's alias tables (component, symptom, query-type keywords),
+
+and every query is scanned once. Entity aliases (components, symptoms)
+are kept only on word boundaries, where a plural "s" / "es" may sit
+before the closing boundary ("fans", "windows" - but still not
+"fanbelt"). Query-type keywords (image / detail / repair) only need to
+start a word, so inflections keep working as with the old substring scan
+("fixing", "showing", "explained"). Overlapping matches are all reported
+("fan runs" yields both the symptom and the "fan" component, as before). DTC codes are picked up
+by a regex for any P/B/C/U + 4 digit code rather than a fixed list.
+"""
+
+from collections import deque
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from manual_ingest import DTC_PATTERN
+
+# KG node type -> matcher category
+_KG_CATEGORIES = {"Component": "component", "Symptom": "symptom"}
+
+# Keyword categories matched as word prefixes ("repair" in "repairing")
+KEYWORD_CATEGORIES = ("image", "detail", "repair")
+
+
+class AhoCorasick:
+    """Plain Aho-Corasick automaton over characters."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, object]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, payload) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), payload))
+        self._built = False
+
+    def build(self) -> None:
+        """Compute failure links (BFS) and merge output sets."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """Yield (start, end, payload) for every (overlapping) match."""
+        if not self._built:
+            self.build()
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, payload in self._out[node]:
+                yield i - length + 1, i + 1, payload
+
+
+# Plural endings accepted between a match and its closing word boundary
+_PLURAL_SUFFIXES = ("s", "es")
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _ends_word(text: str, end: int) -> bool:
+    """True if a word ends at `end`, optionally after a plural suffix."""
+    if end >= len(text) or not _is_word_char(text[end]):
+        return True
+    for suffix in _PLURAL_SUFFIXES:
+        stop = end + len(suffix)
+        if text.startswith(suffix, end) and (stop >= len(text) or not _is_word_char(text[stop])):
+            return True
+    return False
+
+
+class EntityMatcher:
+    """
+    Compiled multi-pattern matcher.
+
+    `tables` maps a category ("component", "symptom", "image", ...) to an
+    {alias: canonical} dict. match() returns {category: [canonical, ...]}
+    (deduplicated, in order of first appearance) plus "dtc" codes.
+    Matches in `prefix_categories` may run on into the rest of a word.
+    """
+
+    def __init__(self, tables: Dict[str, Dict[str, str]],
+                 prefix_categories: Sequence[str] = KEYWORD_CATEGORIES):
+        self.categories = list(tables)
+        self.prefix_categories = frozenset(prefix_categories)
+        self._automaton = AhoCorasick()
+        for category, table in tables.items():
+            for alias, canonical in table.items():
+                self._automaton.add(alias.lower(), (category, canonical))
+        self._automaton.build()
+
+    @classmethod
+    def from_knowledge_graph(cls,
+                             knowledge_graph: Dict[str, Dict],
+                             alias_tables: Dict[str, Dict[str, str]],
+                             prefix_categories: Sequence[str] = KEYWORD_CATEGORIES
+                             ) -> "EntityMatcher":
+        """Alias tables + the names of Component / Symptom KG nodes."""
+        tables = {category: dict(table) for category, table in alias_tables.items()}
+        for name, node in knowledge_graph.items():
+            category = _KG_CATEGORIES.get(node.get("type"))
+            if category:
+                tables.setdefault(category, {}).setdefault(name.lower(), name)
+        return cls(tables, prefix_categories)
+
+    def match(self, query: str) -> Dict[str, List[str]]:
+        text = query.lower()
+        found: Dict[str, List[str]] = {category: [] for category in self.categories}
+
+        for start, end, (category, canonical) in self._automaton.iter_matches(text):
+            if start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if category not in self.prefix_categories and not _ends_word(text, end):
+                continue
+            if canonical not in found[category]:
+                found[category].append(canonical)
+
+        dtcs: List[str] = []
+        for m in DTC_PATTERN.finditer(query):
+            code = m.group(0).upper()
+            if code not in dtcs:
+                dtcs.append(code)
+        found["dtc"] = dtcs
+        return found
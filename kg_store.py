@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact, indexed store for KNOWLEDGE_GRAPH.
+
+KNOWLEDGE_GRAPH stays the editable source (a dict of free-form dicts);
+this module compiles it at load time into:
+
+    - interned node ids   : every node name and attribute value gets an int
+    - typed edge arrays   : one CSR adjacency (indptr / indices, int32) per
+                            relation, e.g. SYMPTOM, AFFECTS, RELATED_TO
+    - reverse edges       : the transposed CSR per relation, precomputed
+
+List attributes ("symptoms": [...]) become one edge per item and scalar
+attributes ("voltage": "3.3V") one edge to a value node. Edge order per
+node follows the order in KNOWLEDGE_GRAPH, so results are deterministic
+(repair steps stay in step order).
+
+multi_hop() runs a bounded-depth BFS over these arrays (symptom -> DTC ->
+component -> fuse / repair step) with per-hop fan-out limits and path
+scores, memoised per seed set.
+"""
+
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Triple = Tuple[str, str, str]
+
+# Attribute name -> relation label used in triples. Attributes not listed
+# here use their upper-cased name ("sensor_type" -> "SENSOR_TYPE").
+RELATION_NAMES = {
+    "symptoms": "SYMPTOM",
+    "affects": "AFFECTS",
+    "related_dtcs": "RELATED_TO",
+    "fuses": "FUSE",
+    "fuse": "FUSE_RATING",
+    "indicates": "INDICATES",
+    "caused_by": "CAUSED_BY",
+    "repair_steps": "REPAIR_STEP",
+    "ecu_pins": "ECU_PIN",
+}
+
+# Attributes that describe the node itself rather than link it
+_SKIPPED_ATTRIBUTES = {"type"}
+
+# Hops multi_hop() may take: (relation, follow_reverse_edge, weight).
+# Reverse edges let a symptom reach the DTCs that list it as a SYMPTOM and a
+# DTC reach the components that list it as RELATED_TO.
+Hop = Tuple[str, bool, float]
+DIAGNOSTIC_HOPS: Tuple[Hop, ...] = (
+    ("INDICATES", False, 1.0),     # symptom -> DTC
+    ("CAUSED_BY", False, 1.0),     # symptom -> DTC
+    ("SYMPTOM", True, 1.0),        # symptom <- DTC
+    ("AFFECTS", False, 0.8),       # DTC -> component
+    ("RELATED_TO", True, 0.8),     # DTC <- component
+    ("FUSE", False, 0.6),          # component -> fuse
+    ("FUSE_RATING", False, 0.6),   # component -> fuse rating
+)
+REPAIR_HOP: Hop = ("REPAIR_STEP", False, 0.7)
+
+KG_MAX_HOPS = int(os.environ.get("KG_MAX_HOPS", "3"))
+KG_FAN_OUT = int(os.environ.get("KG_FAN_OUT", "8"))
+
+
+def relation_name(attribute: str) -> str:
+    return RELATION_NAMES.get(attribute, attribute.upper())
+
+
+def _csr(n_nodes: int, src: np.ndarray, dst: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Build (indptr, indices); a stable sort keeps per-node insertion order."""
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int32)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32)
+
+
+class KnowledgeGraphStore:
+    """Read-only, array-backed view of a KNOWLEDGE_GRAPH dict."""
+
+    def __init__(self, knowledge_graph: Dict[str, Dict]):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.node_types: List[str] = []
+
+        # Interned KG nodes first so their ids are stable and small
+        for name, node in knowledge_graph.items():
+            self._intern(name, node.get("type", "Node"))
+
+        edges: Dict[str, Tuple[List[int], List[int]]] = {}
+        for name, node in knowledge_graph.items():
+            src = self.ids[name]
+            for attribute, value in node.items():
+                if attribute in _SKIPPED_ATTRIBUTES:
+                    continue
+                relation = relation_name(attribute)
+                values = value if isinstance(value, list) else [value]
+                srcs, dsts = edges.setdefault(relation, ([], []))
+                for item in values:
+                    srcs.append(src)
+                    dsts.append(self._intern(str(item), "Value"))
+
+        n = len(self.names)
+        self.relations: List[str] = sorted(edges)
+        self.relation_ids: Dict[str, int] = {r: i for i, r in enumerate(self.relations)}
+        self._forward: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._reverse: List[Tuple[np.ndarray, np.ndarray]] = []
+        for relation in self.relations:
+            src = np.array(edges[relation][0], dtype=np.int64)
+            dst = np.array(edges[relation][1], dtype=np.int64)
+            self._forward.append(_csr(n, src, dst))
+            self._reverse.append(_csr(n, dst, src))
+
+        # Memoised per (seeds, hops, limits); the store is immutable
+        self.multi_hop = lru_cache(maxsize=1024)(self._multi_hop)
+
+    def _intern(self, name: str, node_type: str) -> int:
+        node_id = self.ids.get(name)
+        if node_id is None:
+            node_id = len(self.names)
+            self.ids[name] = node_id
+            self.names.append(name)
+            self.node_types.append(node_type)
+        return node_id
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def node_type(self, name: str) -> Optional[str]:
+        node_id = self.ids.get(name)
+        return None if node_id is None else self.node_types[node_id]
+
+    # ------------------------------------------------------------------
+    # Array-level lookups (ids in, ids out)
+    # ------------------------------------------------------------------
+
+    def out_ids(self, node_id: int, relation: str) -> np.ndarray:
+        rel = self.relation_ids.get(relation)
+        if rel is None:
+            return np.empty(0, dtype=np.int32)
+        indptr, indices = self._forward[rel]
+        return indices[indptr[node_id]:indptr[node_id + 1]]
+
+    def in_ids(self, node_id: int, relation: str) -> np.ndarray:
+        rel = self.relation_ids.get(relation)
+        if rel is None:
+            return np.empty(0, dtype=np.int32)
+        indptr, indices = self._reverse[rel]
+        return indices[indptr[node_id]:indptr[node_id + 1]]
+
+    # ------------------------------------------------------------------
+    # Name-level helpers
+    # ------------------------------------------------------------------
+
+    def neighbors(self, name: str, relation: str, reverse: bool = False) -> List[str]:
+        """Targets of `relation` edges from `name` (sources if reverse=True)."""
+        node_id = self.ids.get(name)
+        if node_id is None:
+            return []
+        ids = self.in_ids(node_id, relation) if reverse else self.out_ids(node_id, relation)
+        return [self.names[i] for i in ids]
+
+    def facts(self,
+              name: str,
+              relations: Sequence[str],
+              limits: Optional[Dict[str, int]] = None) -> List[Triple]:
+        """
+        Triples (name, relation, target) for `relations`, in the given
+        relation order and KG insertion order within a relation.
+        """
+        node_id = self.ids.get(name)
+        if node_id is None:
+            return []
+        limits = limits or {}
+        triples: List[Triple] = []
+        for relation in relations:
+            ids = self.out_ids(node_id, relation)
+            if relation in limits:
+                ids = ids[:limits[relation]]
+            triples.extend((name, relation, self.names[i]) for i in ids)
+        return triples
+
+    # ------------------------------------------------------------------
+    # Multi-hop traversal
+    # ------------------------------------------------------------------
+
+    def _multi_hop(self,
+                   seeds: Tuple[str, ...],
+                   hops: Tuple[Hop, ...] = DIAGNOSTIC_HOPS,
+                   max_depth: int = KG_MAX_HOPS,
+                   fan_out: int = KG_FAN_OUT,
+                   decay: float = 0.8) -> Tuple[Tuple[Triple, float], ...]:
+        """
+        Bounded BFS from `seeds`; returns ((triple, score), ...) best first.
+
+        Every seed starts with score 1.0. Crossing an edge passes the
+        source score times the hop weight and `decay` to the target (the
+        best hop only, when two relations link the same pair). Scores
+        arriving at a node from different sources on the same level are
+        summed, so a DTC reached from two symptoms outranks one reached
+        from a single symptom (candidate intersection). An edge scores the
+        weaker of its two endpoints. Each node is expanded once, following
+        at most `fan_out` edges per hop type, for at most `max_depth` levels.
+
+        Call through self.multi_hop (memoised); pass `seeds` as a sorted
+        tuple so equal entity sets share a cache entry.
+        """
+        frontier: Dict[int, float] = {
+            self.ids[name]: 1.0 for name in seeds if name in self.ids
+        }
+        scores: Dict[int, float] = dict(frontier)
+        edges: Dict[Triple, Tuple[int, int]] = {}
+
+        for _depth in range(max_depth):
+            next_frontier: Dict[int, float] = {}
+            for node_id, score in frontier.items():
+                gains: Dict[int, float] = {}
+                for relation, reverse, weight in hops:
+                    ids = self.in_ids(node_id, relation) if reverse else self.out_ids(node_id, relation)
+                    for other in ids[:fan_out]:
+                        other = int(other)
+                        if reverse:
+                            triple = (self.names[other], relation, self.names[node_id])
+                        else:
+                            triple = (self.names[node_id], relation, self.names[other])
+                        edges.setdefault(triple, (node_id, other))
+                        if other not in scores:
+                            gains[other] = max(gains.get(other, 0.0), score * weight * decay)
+                for other, gained in gains.items():
+                    next_frontier[other] = next_frontier.get(other, 0.0) + gained
+            scores.update(next_frontier)
+            frontier = next_frontier
+            if not frontier:
+                break
+
+        ranked = [
+            (triple, round(min(scores[a], scores[b]), 4))
+            for triple, (a, b) in edges.items()
+        ]
+        # Stable sort: ties keep discovery (BFS / KG) order
+        ranked.sort(key=lambda item: -item[1])
+        return tuple(ranked)
+
+
+def dedupe(triples: Iterable[Triple]) -> List[Triple]:
+    """Drop duplicate triples, keeping first (highest-ranked) occurrence."""
+    return list(dict.fromkeys(triples))
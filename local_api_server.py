@@ -10,19 +10,39 @@ Created on Wed Nov 12 18:54:42 2025
 # Flask server to expose the RAG logic to the HTML client.
 # Now includes:
 #   - /api/chat   : text → RAG (run_on_device_rag)
+#   - /api/chat/stream : text → RAG, answer tokens as Server-Sent Events
+#   - /api/chat/batch  : many queries → RAG (batched retrieval, deduped LLM calls)
 #   - /api/speech : WAV audio → Vosk STT → RAG
-
-from flask import Flask, request, jsonify,send_from_directory
+#   - /api/speech/stream : chunked raw WAV body, decoded while it uploads
+#   - /api/reindex: re-read manuals, re-embed only changed chunks
+#   - /api/health : KB size + cache counters
+#
+# Async serving mode (retrieval on a thread pool, Ollama call awaited):
+#   uvicorn local_api_server:asgi_app --port 5002
+# serves /, /api/chat, /api/chat/batch and /api/health from `asgi_app` below.
+
+from flask import (
+    Flask,
+    Response,
+    request,
+    jsonify,
+    send_from_directory,
+    stream_with_context,
+)
 from flask_cors import CORS
+import asyncio
 import os
 import sys
-import uuid
-import wave
-import audioop
 import json
 
 # Offline STT (Vosk)
-from vosk import Model, KaldiRecognizer
+from vosk import Model
+
+from speech_audio import AudioFormatError, pcm_blocks
+from speech_grammar import build_grammar, normalize_transcript
+from speech_workers import SpeechQueueFull, SpeechWorkerPool
+
+from asgi_app import make_asgi_app
 
 app = Flask(__name__)
 CORS(app)
@@ -33,7 +53,14 @@ try:
     # Import the main RAG function from your script
     from updated_hybrid_rag_ollama_on_device_1 import (
         run_on_device_rag,
+        run_on_device_rag_async,
+        run_on_device_rag_batch,
+        stream_on_device_rag,
         load_data_from_files,
+        KNOWLEDGE_GRAPH,
+        ENTITY_ALIAS_TABLES,
+        reindex,
+        get_stats,
     )
 except ImportError:
     print(
@@ -52,10 +79,24 @@ VOSK_MODEL_PATH = os.environ.get(
     "VOSK_MODEL_PATH", "./models/vosk-model-small-en-us-0.15"
 )
 
+# "free" (full vocabulary) or "constrained" (KG grammar); per request via 'mode'
+SPEECH_MODES = ("free", "constrained")
+SPEECH_MODE = os.environ.get("SPEECH_MODE", "free").lower()
+
 vosk_model = None
+speech_pool = None
 if os.path.isdir(VOSK_MODEL_PATH):
     print(f"✅ Loading Vosk model from: {VOSK_MODEL_PATH}")
     vosk_model = Model(VOSK_MODEL_PATH)
+    # Fork the recognizer workers now, while the model is loaded and before
+    # the server starts its request threads. The grammar for "constrained"
+    # mode covers the KG as loaded above (restart to pick up reindexed DTCs).
+    speech_grammar = build_grammar(KNOWLEDGE_GRAPH, ENTITY_ALIAS_TABLES)
+    speech_pool = SpeechWorkerPool(vosk_model, grammar=speech_grammar)
+    print(
+        f"   - Speech workers: {speech_pool.workers}, "
+        f"grammar phrases: {len(speech_grammar)}"
+    )
 else:
     print(
         f"⚠️ Vosk model not found at {VOSK_MODEL_PATH}. "
@@ -76,6 +117,27 @@ def serve_nano3():
     return send_from_directory(BASE_DIR, "nano_3.html")
 
 
+def format_rag_output(output: dict) -> dict:
+    """Shape a run_on_device_rag result for the HTML client."""
+    response_data = {"answer": output["answer"]} if "answer" in output else {}
+    response_data.update({
+        "cache": output.get("cache", "miss"),
+        "sources": {
+            "vector_chunks": [
+                {
+                    "text": c["text"],
+                    "score": c["score"],
+                    "page": c["page"],
+                }
+                for c in output["vdb_chunks"]
+            ],
+            "scores": f"KG Triples: {len(output['kg_triples'])}",
+            "locked_specs": output["locked_specs"],
+        },
+    })
+    return response_data
+
+
 @app.route("/api/chat", methods=["POST"])
 def chat_endpoint():
     """
@@ -94,23 +156,7 @@ def chat_endpoint():
         output = run_on_device_rag(query)
 
         # Prepare response for the HTML client
-        response_data = {
-            "answer": output["answer"],
-            "sources": {
-                "vector_chunks": [
-                    {
-                        "text": c["text"],
-                        "score": c["score"],
-                        "page": c["page"],
-                    }
-                    for c in output["vdb_chunks"]
-                ],
-                "scores": f"KG Triples: {len(output['kg_triples'])}",
-                "locked_specs": output["locked_specs"],
-            },
-        }
-
-        return jsonify(response_data)
+        return jsonify(format_rag_output(output))
 
     except Exception as e:
         # Return a generic error to the client
@@ -119,90 +165,130 @@ def chat_endpoint():
         ), 500
 
 
-@app.route("/api/speech", methods=["POST"])
-def speech_endpoint():
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream_endpoint():
     """
-    Offline speech endpoint.
+    Streaming version of /api/chat (text/event-stream).
+    Expects JSON: { "message": "your question" }
 
-    Frontend sends:
-        FormData with field 'audio' = WAV blob from browser (mono/16-bit/any rate).
-    Steps:
-        1. Save WAV to temp file
-        2. Use Vosk to transcribe (convert to mono + 16 kHz internally)
-        3. Call run_on_device_rag(transcript)
-        4. Return same structure as /api/chat plus 'transcript'
+    Events:
+        meta  : {cache, sources} as soon as retrieval is done
+        token : {"text": "..."} for each piece of the answer
+        done  : {"answer": "<full html>"}
+        error : {"error": "..."}
     """
-    if vosk_model is None:
-        return jsonify({"error": "Vosk model not available on server"}), 500
+    data = request.get_json(silent=True) or {}
+    query = data.get("message", "")
+    if not query:
+        return jsonify({"error": "No query message provided."}), 400
 
-    if "audio" not in request.files:
-        return jsonify(
-            {"error": "No audio file uploaded. Use field name 'audio'."}
-        ), 400
+    def generate():
+        try:
+            for event, payload in stream_on_device_rag(query):
+                if event == "meta":
+                    payload = format_rag_output(payload)
+                yield _sse(event, payload)
+        except Exception as e:
+            yield _sse(
+                "error",
+                {"error": f"Internal Server Error during RAG process: {str(e)}"},
+            )
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    audio_file = request.files["audio"]
 
-    # Save to a temporary path
-    tmp_path = os.path.join("/tmp", f"nano_upload_{uuid.uuid4().hex}.wav")
-    audio_file.save(tmp_path)
+def _batch_queries(data: dict):
+    """Validated list of query strings from a batch request, or an error."""
+    queries = data.get("messages")
+    if not isinstance(queries, list) or not queries:
+        return None, "Provide a non-empty 'messages' list."
+    if not all(isinstance(q, str) and q.strip() for q in queries):
+        return None, "Every message must be a non-empty string."
+    return queries, None
 
+
+@app.route("/api/chat/batch", methods=["POST"])
+def chat_batch_endpoint():
+    """
+    Bulk diagnostics for the workshop-management system.
+    Expects JSON: { "messages": ["P0117", "P0118 on vehicle 12", ...] }
+    Returns: { "results": [ <same shape as /api/chat>, ... ] } in input order.
+    """
+    data = request.get_json(silent=True) or {}
+    queries, error = _batch_queries(data)
+    if error:
+        return jsonify({"error": error}), 400
     try:
-        wf = wave.open(tmp_path, "rb")
+        outputs = run_on_device_rag_batch(queries)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": f"Cannot read WAV file: {str(e)}"}), 400
+        return jsonify(
+            {"error": f"Internal Server Error during RAG process: {str(e)}"}
+        ), 500
+    return jsonify({"results": [format_rag_output(o) for o in outputs]})
 
-    n_channels = wf.getnchannels()
-    sampwidth = wf.getsampwidth()
-    framerate = wf.getframerate()
 
-    if sampwidth != 2:
-        wf.close()
-        try:
-            os.remove(tmp_path)
-        except OSError:
-            pass
-        return jsonify({"error": "Audio must be 16-bit PCM WAV."}), 400
+@app.route("/api/health", methods=["GET"])
+def health_endpoint():
+    """Liveness check plus KB size and cache hit/miss/eviction counters."""
+    stats = get_stats()
+    stats["status"] = "healthy"
+    stats["vosk_loaded"] = vosk_model is not None
+    if speech_pool is not None:
+        stats["speech"] = speech_pool.stats()
+    return jsonify(stats)
 
-    TARGET_RATE = 16000
-    recognizer = KaldiRecognizer(vosk_model, TARGET_RATE)
-
-    transcript_parts = []
 
+@app.route("/api/reindex", methods=["POST"])
+def reindex_endpoint():
+    """
+    Rebuild the vector index from the manuals without restarting.
+    Only the server-configured MANUAL_PATHS are read; the request cannot
+    name files, since the server listens on all interfaces without auth.
+    """
     try:
-        while True:
-            data = wf.readframes(4000)
-            if len(data) == 0:
-                break
-
-            # Convert stereo → mono if needed
-            if n_channels > 1:
-                data_mono = audioop.tomono(data, sampwidth, 0.5, 0.5)
-            else:
-                data_mono = data
-
-            # Resample to 16 kHz if needed
-            if framerate != TARGET_RATE:
-                data_mono, _ = audioop.ratecv(
-                    data_mono, sampwidth, 1, framerate, TARGET_RATE, None
-                )
-
-            if recognizer.AcceptWaveform(data_mono):
-                res = json.loads(recognizer.Result())
-                if "text" in res:
-                    transcript_parts.append(res["text"])
-
-        final_res = json.loads(recognizer.FinalResult())
-        if "text" in final_res:
-            transcript_parts.append(final_res["text"])
-    finally:
-        wf.close()
-        try:
-            os.remove(tmp_path)
-        except OSError:
-            pass
+        stats = reindex()
+        return jsonify({"status": "ok", "reindex": stats})
+    except Exception as e:
+        return jsonify({"error": f"Reindex failed: {str(e)}"}), 500
+
+
+def _speech_mode(mode) -> str:
+    mode = (mode or SPEECH_MODE).lower()
+    return mode if mode in SPEECH_MODES else SPEECH_MODE
 
-    transcript = " ".join(t.strip() for t in transcript_parts if t.strip())
-    transcript = transcript.strip()
+
+def _speech_response(blocks, mode: str):
+    """Transcribe PCM blocks on the speech pool, then answer like /api/chat."""
+    try:
+        raw_transcript, timing = speech_pool.transcribe(
+            blocks, constrained=(mode == "constrained")
+        )
+    except SpeechQueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "2"}
+    except AudioFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    except (TimeoutError, EOFError, OSError) as e:
+        # Worker timed out or died mid-job (pipe closed); it is being replaced
+        return jsonify({"error": f"Speech recognizer failed: {e}"}), 503, {"Retry-After": "2"}
+    except Exception as e:
+        return jsonify({"error": f"Internal Server Error during speech recognition: {e}"}), 500
+    print(
+        f"🎙️ speech job ({mode}): queue {timing['queue_ms']:.0f} ms, "
+        f"decode {timing['decode_ms']:.0f} ms for {timing['audio_s']:.1f} s audio"
+    )
+    # "p zero one one seven" -> "P0117", so entity extraction sees the DTC
+    transcript = normalize_transcript(raw_transcript)
 
     if not transcript:
         return jsonify(
@@ -220,26 +306,125 @@ def speech_endpoint():
             }
         ), 500
 
-    response_data = {
-        "answer": output["answer"],
-        "sources": {
-            "vector_chunks": [
-                {
-                    "text": c["text"],
-                    "score": c["score"],
-                    "page": c["page"],
-                }
-                for c in output["vdb_chunks"]
-            ],
-            "scores": f"KG Triples: {len(output['kg_triples'])}",
-            "locked_specs": output["locked_specs"],
-        },
-        "transcript": transcript,
+    response_data = format_rag_output(output)
+    response_data["transcript"] = transcript
+    response_data["raw_transcript"] = raw_transcript
+    response_data["speech_mode"] = "constrained" if timing["constrained"] else "free"
+    response_data["speech_timing"] = {
+        k: round(timing[k], 1) for k in ("queue_ms", "decode_ms", "audio_s")
     }
 
     return jsonify(response_data)
 
 
+@app.route("/api/speech", methods=["POST"])
+def speech_endpoint():
+    """
+    Offline speech endpoint.
+
+    Frontend sends:
+        FormData with field 'audio' = WAV blob from browser (mono/16-bit/any rate)
+        and optionally 'mode' = "free" | "constrained" (default SPEECH_MODE).
+    Steps:
+        1. Read the WAV straight from the upload stream (no temp file)
+        2. Use Vosk to transcribe (converted to mono + 16 kHz block by block)
+        3. Call run_on_device_rag(transcript)
+        4. Return same structure as /api/chat plus 'transcript'
+    """
+    if vosk_model is None:
+        return jsonify({"error": "Vosk model not available on server"}), 500
+
+    if "audio" not in request.files:
+        return jsonify(
+            {"error": "No audio file uploaded. Use field name 'audio'."}
+        ), 400
+
+    try:
+        blocks = pcm_blocks(request.files["audio"].stream)
+    except AudioFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    mode = _speech_mode(request.form.get("mode") or request.args.get("mode"))
+    return _speech_response(blocks, mode)
+
+
+@app.route("/api/speech/stream", methods=["POST"])
+def speech_stream_endpoint():
+    """
+    Streaming speech upload.
+
+    The request body is the raw WAV itself (Content-Type: audio/wav),
+    ideally sent with Transfer-Encoding: chunked while recording. Blocks
+    are decoded as they arrive, so only the tail of the audio is left to
+    recognize once the technician stops talking. ?mode=constrained selects
+    the grammar recognizer. Returns the same structure as /api/speech.
+    """
+    if vosk_model is None:
+        return jsonify({"error": "Vosk model not available on server"}), 500
+
+    try:
+        blocks = pcm_blocks(request.stream)
+    except AudioFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    return _speech_response(blocks, _speech_mode(request.args.get("mode")))
+
+
+# ---------------------------------------------------------------------------
+# Async serving mode (ASGI)
+# ---------------------------------------------------------------------------
+
+async def _async_root(_data):
+    with open(os.path.join(BASE_DIR, "nano_3.html"), "r", encoding="utf-8") as f:
+        return 200, f.read()
+
+
+async def _async_chat(data):
+    query = data.get("message", "")
+    if not query:
+        return 400, {"error": "No query message provided."}
+    try:
+        output = await run_on_device_rag_async(query)
+    except Exception as e:
+        return 500, {"error": f"Internal Server Error during RAG process: {str(e)}"}
+    return 200, format_rag_output(output)
+
+
+async def _async_chat_batch(data):
+    queries, error = _batch_queries(data)
+    if error:
+        return 400, {"error": error}
+    loop = asyncio.get_running_loop()
+    try:
+        # Batched retrieval + bounded LLM fan-out run off the event loop
+        outputs = await loop.run_in_executor(None, run_on_device_rag_batch, queries)
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    except Exception as e:
+        return 500, {"error": f"Internal Server Error during RAG process: {str(e)}"}
+    return 200, {"results": [format_rag_output(o) for o in outputs]}
+
+
+async def _async_health(_data):
+    stats = get_stats()
+    stats["status"] = "healthy"
+    stats["mode"] = "asgi"
+    stats["vosk_loaded"] = vosk_model is not None
+    if speech_pool is not None:
+        stats["speech"] = speech_pool.stats()
+    return 200, stats
+
+
+asgi_app = make_asgi_app(
+    {
+        ("GET", "/"): _async_root,
+        ("GET", "/nano_3.html"): _async_root,
+        ("POST", "/api/chat"): _async_chat,
+        ("POST", "/api/chat/batch"): _async_chat_batch,
+        ("GET", "/api/health"): _async_health,
+    },
+    cors_origin="http://localhost:8080",
+)
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5002))
     print("-" * 50)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming ingestion of service manuals into MANUAL_CHUNKS / KNOWLEDGE_GRAPH.
+
+Supported inputs:
+
+    - *.pdf    : read page by page (needs `pypdf`), split into overlapping
+                 word windows, tagged with dtc / component / page / section.
+    - *.jsonl  : one record per line, streamed.
+    - *.json   : a list of records, or {"chunks": [...], "knowledge_graph": {...}}.
+
+A JSON(L) record is either a manual chunk ({"text": ..., "page": ..., ...})
+or a KG node ({"kg_node": "P0118", "attributes": {"type": "DTC", ...}}).
+
+Everything is generator based: only one PDF page (plus the current window)
+is held while chunking. Embeddings are NOT computed here; the backends hand
+the merged chunk list to embedding_store.load_or_encode(), which encodes in
+fixed-size batches and persists the result.
+
+Manual paths are taken from the MANUAL_PATHS env var (os.pathsep separated).
+"""
+
+import json
+import os
+import re
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+MANUAL_PATHS = [
+    p for p in os.environ.get("MANUAL_PATHS", "").split(os.pathsep) if p.strip()
+]
+
+# Word windows: ~180 words per chunk with 40 words carried over.
+CHUNK_WORDS = int(os.environ.get("INGEST_CHUNK_WORDS", "180"))
+CHUNK_OVERLAP = int(os.environ.get("INGEST_CHUNK_OVERLAP", "40"))
+
+DTC_PATTERN = re.compile(r"\b[PBCU][0-9]{4}\b", re.IGNORECASE)
+
+# "4.2 Radiator Fan", "5 COOLING SYSTEM", "ENGINE COOLANT TEMPERATURE SENSOR"
+_NUMBERED_HEADING = re.compile(r"^\d+(\.\d+)*\s+[A-Za-z].{1,78}$")
+_CAPS_HEADING = re.compile(r"^[A-Z0-9][A-Z0-9 /&(),.-]{3,78}$")
+
+
+# ---------------------------------------------------------------------------
+# 1. READERS (generators)
+# ---------------------------------------------------------------------------
+
+def iter_pdf_pages(path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) for each page of a PDF, 1-based."""
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise ImportError(
+            "PDF ingestion needs 'pypdf' (pip install pypdf)"
+        ) from e
+
+    reader = PdfReader(path)
+    for page_no, page in enumerate(reader.pages, start=1):
+        yield page_no, page.extract_text() or ""
+
+
+def iter_json_records(path: str) -> Iterator[Dict]:
+    """Yield records from a .jsonl (streamed) or .json file."""
+    if path.lower().endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if isinstance(data, list):
+        yield from data
+        return
+
+    yield from data.get("chunks", [])
+    for name, attributes in data.get("knowledge_graph", {}).items():
+        yield {"kg_node": name, "attributes": attributes}
+
+
+# ---------------------------------------------------------------------------
+# 2. CHUNKING & TAGGING
+# ---------------------------------------------------------------------------
+
+def is_heading(line: str) -> bool:
+    """Heuristic section-heading detector for manual pages."""
+    line = line.strip()
+    if not line or len(line) > 80 or line.endswith((".", ",", ";", ":")):
+        return False
+    if _NUMBERED_HEADING.match(line):
+        return True
+    return bool(_CAPS_HEADING.match(line)) and any(ch.isalpha() for ch in line)
+
+
+def iter_windows(words: List[str],
+                 size: int = CHUNK_WORDS,
+                 overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """Yield overlapping word windows joined back into text."""
+    if not words:
+        return
+    step = max(1, size - overlap)
+    for start in range(0, len(words), step):
+        yield " ".join(words[start:start + size])
+        if start + size >= len(words):
+            break
+
+
+def tag_chunk(chunk: Dict, component_aliases: Dict[str, str]) -> Dict:
+    """
+    Fill in `dtc` / `component` from the text if not already set, plus the
+    multi-valued `dtcs` / `components` (every DTC / component mentioned).
+    """
+    text = chunk["text"]
+    if not chunk.get("dtcs"):
+        dtcs: List[str] = []
+        for match in DTC_PATTERN.finditer(text):
+            code = match.group(0).upper()
+            if code not in dtcs:
+                dtcs.append(code)
+        if dtcs:
+            chunk["dtcs"] = dtcs
+    if not chunk.get("dtc") and chunk.get("dtcs"):
+        chunk["dtc"] = chunk["dtcs"][0]
+
+    if not chunk.get("components"):
+        lowered = text.lower()
+        components: List[str] = []
+        # Longest alias first so "radiator fan" wins over "fan"
+        for alias in sorted(component_aliases, key=len, reverse=True):
+            if re.search(r"\b" + re.escape(alias) + r"\b", lowered):
+                if component_aliases[alias] not in components:
+                    components.append(component_aliases[alias])
+        if components:
+            chunk["components"] = components
+    if not chunk.get("component") and chunk.get("components"):
+        chunk["component"] = chunk["components"][0]
+    return chunk
+
+
+def iter_pdf_chunks(path: str,
+                    component_aliases: Dict[str, str],
+                    size: int = CHUNK_WORDS,
+                    overlap: int = CHUNK_OVERLAP) -> Iterator[Dict]:
+    """Stream tagged, overlapping chunks out of a PDF manual."""
+    doc = os.path.splitext(os.path.basename(path))[0]
+    section = "N/A"
+
+    for page_no, text in iter_pdf_pages(path):
+        # Split the page at headings so a chunk never straddles two sections
+        blocks: List[Tuple[str, List[str]]] = [(section, [])]
+        for line in text.splitlines():
+            if is_heading(line):
+                section = line.strip()
+                blocks.append((section, []))
+            else:
+                blocks[-1][1].extend(line.split())
+
+        n = 0
+        for block_section, words in blocks:
+            for window in iter_windows(words, size, overlap):
+                n += 1
+                yield tag_chunk(
+                    {
+                        "id": f"{doc}_p{page_no}_{n}",
+                        "text": window,
+                        "page": page_no,
+                        "section": block_section,
+                        "source": os.path.basename(path),
+                    },
+                    component_aliases,
+                )
+
+
+def iter_json_chunks(path: str,
+                     component_aliases: Dict[str, str],
+                     kg_nodes: Optional[Dict[str, Dict]] = None) -> Iterator[Dict]:
+    """
+    Stream chunks out of a JSON/JSONL dump.
+
+    KG-node records are collected into `kg_nodes` instead of being yielded.
+    """
+    doc = os.path.splitext(os.path.basename(path))[0]
+    for n, record in enumerate(iter_json_records(path), start=1):
+        if "kg_node" in record:
+            if kg_nodes is not None:
+                kg_nodes[record["kg_node"]] = record.get("attributes", {})
+            continue
+        if not record.get("text"):
+            continue
+        chunk = dict(record)
+        chunk.setdefault("id", f"{doc}_{n}")
+        chunk.setdefault("page", "N/A")
+        chunk.setdefault("section", "N/A")
+        chunk.setdefault("source", os.path.basename(path))
+        yield tag_chunk(chunk, component_aliases)
+
+
+def iter_manual_chunks(paths: Iterable[str],
+                       component_aliases: Dict[str, str],
+                       kg_nodes: Optional[Dict[str, Dict]] = None) -> Iterator[Dict]:
+    """Dispatch each path to the right reader and stream its chunks."""
+    for path in paths:
+        lowered = path.lower()
+        if lowered.endswith(".pdf"):
+            yield from iter_pdf_chunks(path, component_aliases)
+        elif lowered.endswith((".json", ".jsonl")):
+            yield from iter_json_chunks(path, component_aliases, kg_nodes)
+        else:
+            print(f"⚠️ Skipping unsupported manual file: {path}")
+
+
+# ---------------------------------------------------------------------------
+# 3. MERGE INTO THE IN-MEMORY KB
+# ---------------------------------------------------------------------------
+
+def component_aliases_from_kg(knowledge_graph: Dict[str, Dict]) -> Dict[str, str]:
+    """lowercase name -> canonical name for every Component node."""
+    return {
+        name.lower(): name
+        for name, node in knowledge_graph.items()
+        if node.get("type") == "Component"
+    }
+
+
+def merge_kg_node(knowledge_graph: Dict[str, Dict], name: str, attributes: Dict,
+                  replace: bool = False):
+    """
+    Add a node, or extend an existing one (lists are unioned, scalars kept).
+
+    With replace=True the given attributes overwrite the node's values
+    instead; attributes not given are left alone.
+    """
+    node = knowledge_graph.setdefault(name, {})
+    for key, value in attributes.items():
+        if replace:
+            node[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            existing = node.setdefault(key, [])
+            existing.extend(v for v in value if v not in existing)
+        else:
+            node.setdefault(key, value)
+
+
+def pages_used(chunks: Iterable[Dict]) -> List:
+    """
+    Distinct pages of `chunks`, sorted, without the "N/A" placeholder.
+
+    Built-in and PDF chunks carry int pages while JSON(L) records may have
+    none ("N/A") or a string, so ints sort first and strings after them.
+    """
+    pages = {c.get("page") for c in chunks} - {None, "", "N/A"}
+    return sorted(pages, key=lambda p: (0, p, "") if isinstance(p, int) else (1, 0, str(p)))
+
+
+def ingest_manuals(paths: Iterable[str],
+                   manual_chunks: List[Dict],
+                   knowledge_graph: Dict[str, Dict],
+                   component_aliases: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Stream `paths` into `manual_chunks` and `knowledge_graph` in place.
+
+    Every DTC seen in a chunk gets at least a {"type": "DTC"} node so the
+    retrieval side knows the code exists. KG-node records from the files
+    replace the attributes they name, so re-ingesting edited files on top
+    of the built-in graph picks up the edits. Returns ingestion stats.
+    """
+    paths = list(paths)
+    aliases = component_aliases_from_kg(knowledge_graph)
+    aliases.update(component_aliases or {})
+
+    seen_ids = {c["id"] for c in manual_chunks}
+    kg_nodes: Dict[str, Dict] = {}
+    pages = set()
+    added = 0
+    start = time.perf_counter()
+
+    for chunk in iter_manual_chunks(paths, aliases, kg_nodes):
+        if chunk["id"] in seen_ids:
+            continue
+        seen_ids.add(chunk["id"])
+        manual_chunks.append(chunk)
+        added += 1
+        pages.add((chunk.get("source"), chunk.get("page")))
+        for dtc in chunk.get("dtcs") or ([chunk["dtc"]] if chunk.get("dtc") else []):
+            merge_kg_node(knowledge_graph, dtc, {"type": "DTC"})
+
+    for name, attributes in kg_nodes.items():
+        merge_kg_node(knowledge_graph, name, attributes, replace=True)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "files": len(paths),
+        "pages": len(pages),
+        "chunks": added,
+        "kg_nodes": len(kg_nodes),
+        "seconds": round(elapsed, 2),
+        "pages_per_sec": round(len(pages) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    print(
+        f"✅ Ingested {stats['chunks']} chunks from {stats['pages']} pages "
+        f"({stats['files']} files) in {stats['seconds']}s "
+        f"({stats['pages_per_sec']} pages/s)"
+    )
+    return stats
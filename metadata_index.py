@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Inverted metadata indexes for pre-filtering the chunk rows.
+
+Built once per VectorIndex:
+
+    dtc       -> rows   (from chunk "dtc" and/or "dtcs")
+    component -> rows   (from chunk "component" and/or "components")
+
+Values may be a single string or a list, since real manual chunks often
+mention several DTCs. A filter ORs the posting bitmaps of the requested
+values (plus the rows carrying no tag at all, which keeps the old
+"tagged with one of these OR untagged" semantics), ANDs the
+fields together and returns the candidate row ids. Only those rows are
+then scored.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# field -> (chunk keys holding its values, entities key, untagged rows pass?)
+METADATA_FIELDS: Dict[str, Tuple[Tuple[str, ...], str, bool]] = {
+    "dtc": (("dtc", "dtcs"), "dtc_codes", True),
+    "component": (("component", "components"), "components", True),
+}
+
+
+def _values(chunk: Dict, keys: Iterable[str]) -> List[str]:
+    values: List[str] = []
+    for key in keys:
+        value = chunk.get(key)
+        if value is None or value == "" or value == "N/A":
+            continue
+        for item in (value if isinstance(value, (list, tuple, set)) else [value]):
+            item = str(item)
+            if item and item not in values:
+                values.append(item)
+    return values
+
+
+class MetadataIndex:
+    """value -> sorted int32 row ids per field, plus an untagged bitmap."""
+
+    def __init__(self, chunks: Sequence[Dict]):
+        self.n_rows = len(chunks)
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {}
+        self.untagged: Dict[str, np.ndarray] = {}
+
+        for field, (keys, _entity_key, _pass_untagged) in METADATA_FIELDS.items():
+            rows_by_value: Dict[str, List[int]] = {}
+            untagged = np.zeros(self.n_rows, dtype=bool)
+            for row, chunk in enumerate(chunks):
+                values = _values(chunk, keys)
+                if not values:
+                    untagged[row] = True
+                for value in values:
+                    rows_by_value.setdefault(value, []).append(row)
+            self.postings[field] = {
+                value: np.array(rows, dtype=np.int32)
+                for value, rows in rows_by_value.items()
+            }
+            self.untagged[field] = untagged
+
+    def candidate_mask(self, entities: Dict) -> Optional[np.ndarray]:
+        """Bitmap of rows passing the entity filters, or None if unfiltered."""
+        mask: Optional[np.ndarray] = None
+        for field, (_keys, entity_key, pass_untagged) in METADATA_FIELDS.items():
+            values = entities.get(entity_key) or []
+            if not values:
+                continue
+            if pass_untagged:
+                field_mask = self.untagged[field].copy()
+            else:
+                field_mask = np.zeros(self.n_rows, dtype=bool)
+            postings = self.postings[field]
+            for value in values:
+                rows = postings.get(str(value))
+                if rows is not None:
+                    field_mask[rows] = True
+            mask = field_mask if mask is None else (mask & field_mask)
+        return mask
+
+    def candidates(self, entities: Dict) -> Optional[np.ndarray]:
+        """Row ids passing the entity filters, or None if unfiltered."""
+        mask = self.candidate_mask(entities)
+        return None if mask is None else np.flatnonzero(mask)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP client for the local Ollama server.
+
+One requests.Session per process, so calls reuse keep-alive TCP
+connections to localhost:11434 instead of opening a new one per query:
+
+    - connection pool size   : OLLAMA_POOL_SIZE        (default 8)
+    - connect / read timeout : OLLAMA_CONNECT_TIMEOUT / OLLAMA_READ_TIMEOUT
+    - retries with backoff   : OLLAMA_RETRIES connect attempts, so queries
+                               sent while Ollama is still starting up wait
+                               for it instead of failing with "connection
+                               refused". Requests that reached the server
+                               are never re-sent.
+    - model keep-alive       : OLLAMA_KEEP_ALIVE is sent with every call and
+                               used by warm_up() to load the model at startup.
+
+AsyncOllamaClient is the httpx-based equivalent used by the async (ASGI)
+serving mode, with the same pool / timeout / retry settings.
+"""
+
+import asyncio
+import os
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434").rstrip("/")
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "8"))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "3"))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "180"))
+OLLAMA_RETRIES = int(os.environ.get("OLLAMA_RETRIES", "5"))
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+
+class OllamaClient:
+    """Thin wrapper around a pooled, retrying requests.Session."""
+
+    def __init__(self,
+                 base_url: str = OLLAMA_URL,
+                 pool_size: int = OLLAMA_POOL_SIZE,
+                 connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout: float = OLLAMA_READ_TIMEOUT,
+                 retries: int = OLLAMA_RETRIES,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.keep_alive = keep_alive
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,        # never re-send a request Ollama already received
+            status=0,
+            backoff_factor=0.5,   # 0.5s, 1s, 2s, 4s, ...
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path: str, payload: Dict, stream: bool = False) -> requests.Response:
+        """POST JSON to `path`, adding the model keep-alive if not set."""
+        payload = dict(payload)
+        payload.setdefault("keep_alive", self.keep_alive)
+        return self.session.post(
+            f"{self.base_url}{path}",
+            json=payload,
+            stream=stream,
+            timeout=self.timeout,
+        )
+
+    def warm_up(self, model: str) -> bool:
+        """
+        Load `model` into memory now (empty prompt + keep_alive), so the
+        first technician query doesn't pay the model load latency.
+        """
+        try:
+            resp = self.post("/api/generate", {"model": model, "prompt": ""})
+            resp.raise_for_status()
+            return True
+        except Exception as e:
+            print(f"⚠️ Ollama warm-up for '{model}' failed: {e}")
+            return False
+
+
+class AsyncOllamaClient:
+    """
+    httpx.AsyncClient counterpart of OllamaClient for the ASGI mode.
+
+    The underlying client is created lazily inside the running event loop.
+    Connection errors are retried with the same exponential backoff.
+    """
+
+    def __init__(self,
+                 base_url: str = OLLAMA_URL,
+                 pool_size: int = OLLAMA_POOL_SIZE,
+                 connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout: float = OLLAMA_READ_TIMEOUT,
+                 retries: int = OLLAMA_RETRIES,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.keep_alive = keep_alive
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    def _get_client(self):
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+        return self._client
+
+    async def post_json(self, path: str, payload: Dict) -> Dict:
+        """POST JSON to `path` and return the decoded JSON response."""
+        import httpx
+
+        payload = dict(payload)
+        payload.setdefault("keep_alive", self.keep_alive)
+        client = self._get_client()
+
+        for attempt in range(self.retries + 1):
+            try:
+                resp = await client.post(path, json=payload)
+                resp.raise_for_status()
+                return resp.json()
+            except httpx.ConnectError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(0.5 * (2 ** attempt))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
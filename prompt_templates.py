@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+System prompt templates shared by the Claude and Ollama backends.
+
+Both backends used to rebuild the whole system prompt per request (the
+per-query_type `response_sections` string, multi-line f-strings and
+"\\n".join), and their two copies of the instructions had drifted apart.
+Here one template per query_type is assembled once at import:
+
+    instructions   static formatting rules (identical for every request of
+                   a query_type - a stable prompt prefix; Ollama reuses its
+                   KV cache for it, and claude_prompt.py marks it
+                   cache_control for Claude prompt caching)
+    context        the only per-request part: the KG triples and manual
+                   chunks slotted between two fixed headers
+
+Each query_type has one template per backend: the Claude backend
+attaches reference images to image answers, so only its templates tell
+the model about them (_BACKEND_RULES); the Ollama templates do not.
+
+render() fills the context slots and enforces PROMPT_TOKEN_BUDGET over the
+whole system prompt by dropping the lowest-ranked chunks first (chunks and
+triples arrive in fused order, best first), then the lowest-ranked
+triples. Bump PROMPT_TEMPLATE_VERSION whenever the text below changes, so
+cached answers built from the old prompt are not reused.
+"""
+
+import os
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+from context_fusion import estimate_tokens, format_chunk, format_triple
+
+PROMPT_TEMPLATE_VERSION = "5"
+# Token budget of instructions + context (the user query comes on top)
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1536"))
+
+Triple = Tuple[str, str, str]
+
+QUERY_TYPES = ("explanation", "image_request", "repair", "general")
+BACKENDS = ("ollama", "claude")
+
+NO_TRIPLES = "No specific graph relationships found."
+NO_CHUNKS = "No relevant manual sections found."
+
+_RESPONSE_SECTIONS = {
+    "explanation": """
+2. For DTC explanation queries (details/description WITHOUT image request), include ONLY:
+   - <h3>📋 [DTC Code]: [Description]</h3>
+   - <h4>🔍 What This Means</h4>
+   - <h4>⚠️ Symptoms You Might Notice</h4>
+   - <h4>🔍 Most Likely Causes</h4>
+
+   STRICTLY EXCLUDE:
+   - Repair steps or procedures
+   - Detailed location information
+   - Component specifications (voltage, resistance, pin details)
+   - Installation or removal instructions
+
+   Keep response concise - focused ONLY on understanding the problem.""",
+    "image_request": """
+2. For image/location requests (show/picture/diagram), include:
+   - <h3>📋 [Component Name]: [Brief Description]</h3>
+   - <h4>📍 Component Location</h4> (detailed physical location)
+   - <h4>🔌 Connection Details</h4> (pin numbers, wire colors, connector type)
+   - <h4>🔧 Quick Visual Check</h4> (what to look for visually)
+
+   Describe location and checks clearly so a mechanic can find it physically.""",
+    "repair": """
+2. For repair queries, include:
+   - <h3>📋 [DTC Code]: [Description]</h3>
+   - <h4>🔍 What This Means</h4>
+   - <h4>🔧 Repair Procedure</h4> (use <ol><li>...</li></ol> for steps)
+   - <h4>📍 Component Location</h4>
+   - <h4>⚠️ Important Notes</h4>""",
+    "general": """
+2. For general queries, choose appropriate sections depending on context
+   (explanation, checks, or repair), but keep the structure clear with
+   <h3>, <h4>, <ul>, <ol>, and <p>.""",
+}
+
+_INSTRUCTIONS = """You are an expert TATA Nano diagnostic technician assistant.
+
+You MUST answer using ONLY the KNOWLEDGE GRAPH RELATIONSHIPS and RELEVANT MANUAL SECTIONS given after these instructions.
+If they do not contain the answer, say you don't know and suggest checking the service manual.
+
+CRITICAL FORMATTING INSTRUCTIONS:
+1. Structure your response with clear HTML formatting:
+   - Use <h3> for main headings
+   - Use <h4> for subheadings
+   - Use <strong> for emphasis
+   - Use <ul> and <li> for bullet lists
+   - Use <ol> and <li> for numbered lists
+   - Use <p> for paragraphs
+{response_sections}
+
+3. Always cite page numbers when you reference specific data (e.g., 'See Page 165').
+4. End with: <p><em>Source: TATA Nano EMS Service Manual v5.0</em></p>
+5. Use simple, clear language suitable for mechanics with basic technical knowledge.
+6. Do NOT invent voltages, resistances, or pin numbers beyond the provided context.
+
+ANSWER STYLE:
+- Professional but accessible
+- Use automotive terminology correctly
+- Match detail level EXACTLY to query type
+- Provide ONLY what's requested
+
+CRITICAL RULES FOR EXPLANATION QUERIES:
+- If user asks for "details" or "description" WITHOUT mentioning images/pictures/show:
+  * Give ONLY: explanation, symptoms, causes
+  * DO NOT include: repair steps, location details, pin numbers, connector specs, voltages, resistance values
+  * Keep it diagnostic understanding ONLY
+{backend_rules}
+NEVER make up information not in the provided context."""
+
+# Backend-specific rules, slotted in after the explanation rules
+_BACKEND_RULES = {
+    "ollama": "",
+    "claude": """
+- If user asks to "show" or wants "picture/image/location":
+  * Include detailed location, connector info, pin numbers
+  * Images will be added automatically
+""",
+}
+
+_TRIPLES_HEADER = "KNOWLEDGE GRAPH RELATIONSHIPS:\n"
+_CHUNKS_HEADER = "\n\nRELEVANT MANUAL SECTIONS:\n"
+
+
+class RenderedPrompt(NamedTuple):
+    instructions: str        # static, cacheable prefix
+    context: str             # per-request evidence
+    triples: List[Triple]    # evidence actually rendered (after trimming)
+    chunks: List[Dict]
+    tokens: int              # instructions + context
+    trimmed: int             # items dropped to fit the budget
+
+    @property
+    def text(self) -> str:
+        """Single-string system prompt, static part first."""
+        return f"{self.instructions}\n\n{self.context}"
+
+
+class PromptTemplate:
+    """Precompiled prompt for one query_type and backend; only the context is rendered."""
+
+    def __init__(self, query_type: str, backend: str = "ollama"):
+        self.query_type = query_type
+        self.backend = backend
+        self.instructions = _INSTRUCTIONS.format(
+            response_sections=_RESPONSE_SECTIONS[query_type],
+            backend_rules=_BACKEND_RULES[backend],
+        )
+        self._fixed_tokens = estimate_tokens(
+            self.instructions + "\n\n" + _TRIPLES_HEADER + _CHUNKS_HEADER
+        )
+
+    def render(self,
+               triples: Sequence[Triple],
+               chunks: Sequence[Dict],
+               token_budget: int = PROMPT_TOKEN_BUDGET,
+               count_tokens: Callable[[str], int] = estimate_tokens) -> RenderedPrompt:
+        triple_lines = [format_triple(t) for t in triples]
+        chunk_texts = [format_chunk(c) for c in chunks]
+
+        if count_tokens is estimate_tokens:
+            fixed = self._fixed_tokens
+        else:
+            fixed = count_tokens(self.instructions + "\n\n" + _TRIPLES_HEADER + _CHUNKS_HEADER)
+        triple_costs = [count_tokens(line) for line in triple_lines]
+        chunk_costs = [count_tokens(text) for text in chunk_texts]
+
+        n_triples, n_chunks = len(triple_lines), len(chunk_texts)
+        total = fixed + sum(triple_costs) + sum(chunk_costs)
+        # Lowest-ranked chunks go first, then lowest-ranked triples
+        while total > token_budget and n_chunks:
+            n_chunks -= 1
+            total -= chunk_costs[n_chunks]
+        while total > token_budget and n_triples:
+            n_triples -= 1
+            total -= triple_costs[n_triples]
+
+        context = "".join((
+            _TRIPLES_HEADER,
+            "\n".join(triple_lines[:n_triples]) or NO_TRIPLES,
+            _CHUNKS_HEADER,
+            "\n\n".join(chunk_texts[:n_chunks]) or NO_CHUNKS,
+        ))
+        return RenderedPrompt(
+            instructions=self.instructions,
+            context=context,
+            triples=list(triples[:n_triples]),
+            chunks=list(chunks[:n_chunks]),
+            tokens=total,
+            trimmed=(len(triple_lines) - n_triples) + (len(chunk_texts) - n_chunks),
+        )
+
+
+# backend -> query_type -> template
+PROMPT_TEMPLATES: Dict[str, Dict[str, PromptTemplate]] = {
+    backend: {query_type: PromptTemplate(query_type, backend) for query_type in QUERY_TYPES}
+    for backend in BACKENDS
+}
+
+
+def get_template(query_type: str = "general", backend: str = "ollama") -> PromptTemplate:
+    """Template for `backend` and `query_type` (unknown types use "general")."""
+    templates = PROMPT_TEMPLATES[backend]
+    return templates.get(query_type, templates["general"])
+
+
+def render_prompt(triples: Sequence[Triple],
+                  chunks: Sequence[Dict],
+                  query_type: str = "general",
+                  backend: str = "ollama",
+                  **kwargs) -> RenderedPrompt:
+    """Render the template for `query_type` on `backend`."""
+    return get_template(query_type, backend).render(triples, chunks, **kwargs)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Quantized copies of the chunk embedding matrix for memory-bound devices.
+
+The on-device box runs Vosk, Ollama and MiniLM side by side, so the
+float32 chunk matrix is the retrieval memory that is worth shrinking.
+EMBEDDING_DTYPE selects what VectorIndex scans:
+
+    float32   the embedding store itself (default)
+    float16   2x smaller, ranking practically unchanged, but slower to
+              scan on CPUs without native fp16 arithmetic
+    int8      4x smaller: per-row symmetric quantization,
+              row ~= scale * codes with scale = max|row| / 127
+
+Scans go over the quantized rows in blocks (only one block is ever
+widened to float32). The top EMBEDDING_RESCORE x k rows are then rescored
+against the float32 store, which stays memory-mapped and is only paged in
+for those rows. The quantized files are persisted next to the store as
+<model-slug>.<dtype>.npy (+ .scales.npy for int8) and reused while the
+store fingerprint is unchanged.
+"""
+
+import json
+import os
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from embedding_store import EMBEDDING_CACHE_DIR, store_fingerprint, store_paths
+
+EMBEDDING_DTYPE = os.environ.get("EMBEDDING_DTYPE", "float32").lower()
+# Rescore this many x top_k quantized hits in float32 (0 = no rescoring)
+EMBEDDING_RESCORE = int(os.environ.get("EMBEDDING_RESCORE", "4"))
+
+QUANTIZED_DTYPES = ("float16", "int8")
+
+_BLOCK_ROWS = 1024   # widened block stays in cache (~1.5 MB float32)
+
+
+class QuantizedMatrix:
+    """float16 or int8 (+ per-row float32 scales) view of a unit-row matrix."""
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.codes = codes
+        self.scales = scales
+        self.dtype = "int8" if scales is not None else "float16"
+
+    @classmethod
+    def quantize(cls, matrix: np.ndarray, dtype: str) -> "QuantizedMatrix":
+        if dtype == "float16":
+            return cls(np.asarray(matrix, dtype=np.float16))
+        if dtype != "int8":
+            raise ValueError(f"Unsupported quantized dtype '{dtype}'")
+
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), _BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+            scale = np.abs(block).max(axis=1) / 127.0
+            scale[scale == 0.0] = 1.0
+            codes[start:start + len(block)] = np.rint(block / scale[:, None])
+            scales[start:start + len(block)] = scale
+        return cls(codes, scales)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Approximate dot products of all rows (or `rows`) with `query`.
+
+        `query` is one vector (dim,) -> scores (n,), or a batch laid out as
+        columns (dim, b) -> scores (n, b).
+        """
+        n = len(self.codes) if rows is None else len(rows)
+        out = np.empty((n,) + query.shape[1:], dtype=np.float32)
+        for start in range(0, n, _BLOCK_ROWS):
+            if rows is None:
+                block = self.codes[start:start + _BLOCK_ROWS]
+            else:
+                block = self.codes[rows[start:start + _BLOCK_ROWS]]
+            out[start:start + len(block)] = block.astype(np.float32) @ query
+        if self.scales is not None:
+            scales = self.scales if rows is None else self.scales[rows]
+            out *= scales.reshape((-1,) + (1,) * (query.ndim - 1))
+        return out
+
+
+def quantized_paths(model_name: str, dtype: str,
+                    cache_dir: str = EMBEDDING_CACHE_DIR):
+    """Return (codes_path, scales_path, meta_path) for `dtype`."""
+    npy_path, _ = store_paths(model_name, cache_dir)
+    base = f"{npy_path[:-len('.npy')]}.{dtype}"
+    return base + ".npy", base + ".scales.npy", base + ".json"
+
+
+def _load(model_name: str, dtype: str, cache_dir: str,
+          fingerprint: str, n_rows: int) -> Optional[QuantizedMatrix]:
+    codes_path, scales_path, meta_path = quantized_paths(model_name, dtype, cache_dir)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") != fingerprint:
+                return None
+        codes = np.load(codes_path, mmap_mode="r")
+        scales = np.load(scales_path) if dtype == "int8" else None
+    except (OSError, ValueError):
+        return None
+    if len(codes) != n_rows:
+        return None
+    return QuantizedMatrix(codes, scales)
+
+
+def _save(quantized: QuantizedMatrix, model_name: str,
+          cache_dir: str, fingerprint: str) -> None:
+    codes_path, scales_path, meta_path = quantized_paths(model_name, quantized.dtype, cache_dir)
+    pid = os.getpid()
+    for path, array in ((codes_path, quantized.codes), (scales_path, quantized.scales)):
+        if array is None:
+            continue
+        tmp = f"{path}.{pid}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+    tmp = f"{meta_path}.{pid}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "dtype": quantized.dtype}, f)
+    os.replace(tmp, meta_path)
+
+
+def load_or_quantize(matrix: np.ndarray,
+                     chunks: Sequence[Dict],
+                     model_name: str,
+                     dtype: str = EMBEDDING_DTYPE,
+                     cache_dir: str = EMBEDDING_CACHE_DIR) -> Optional[QuantizedMatrix]:
+    """
+    Quantized copy of `matrix` (rows == `chunks`), or None for float32.
+
+    The persisted copy is memory-mapped when its fingerprint matches the
+    chunk store; otherwise it is rebuilt and (best effort) persisted.
+    """
+    if dtype == "float32" or len(matrix) == 0:
+        return None
+    if dtype not in QUANTIZED_DTYPES:
+        print(f"⚠️ Unknown EMBEDDING_DTYPE '{dtype}'; using float32")
+        return None
+
+    fingerprint = store_fingerprint(chunks, model_name)
+    quantized = _load(model_name, dtype, cache_dir, fingerprint, len(matrix))
+    if quantized is not None:
+        return quantized
+
+    quantized = QuantizedMatrix.quantize(matrix, dtype)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _save(quantized, model_name, cache_dir, fingerprint)
+        quantized = _load(model_name, dtype, cache_dir, fingerprint, len(matrix)) or quantized
+    except OSError as e:
+        print(f"⚠️ Could not persist {dtype} embeddings to {cache_dir}: {e}")
+    print(f"   - {dtype} embeddings: {quantized.nbytes / 1e6:.1f} MB "
+          f"(float32: {matrix.nbytes / 1e6:.1f} MB)")
+    return quantized
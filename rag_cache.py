@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caches shared by both RAG backends.
+
+    - QueryEmbeddingCache : bounded LRU of query text -> embedding, so the
+      same technician questions skip the transformer forward pass.
+    - AnswerCache         : TTL + LRU cache of final LLM answers, keyed on
+      everything that determines the prompt (see answer_cache_key), with
+      optional SQLite persistence so answers survive restarts.
+    - SemanticAnswerCache : nearest-neighbour lookup over embeddings of
+      already-answered queries, so paraphrases ("P0117 meaning" vs "what
+      does P0117 mean") with the same entities reuse an answer.
+
+Counters (hits / misses / evictions) are exposed on /api/health.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "1024"))
+
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(24 * 3600)))
+# Empty -> in-memory only
+ANSWER_CACHE_DB = os.environ.get("ANSWER_CACHE_DB", "")
+
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", "256"))
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case/whitespace-insensitive cache key ("What is P0117? " == "what is p0117")."""
+    return _WS.sub(" ", query.lower()).strip().rstrip("?.! ")
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of normalised query text -> embedding vector."""
+
+    def __init__(self, capacity: int = QUERY_CACHE_SIZE):
+        self.capacity = max(0, capacity)
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_encode(self, query: str,
+                      encode: Callable[[str], np.ndarray]) -> np.ndarray:
+        """Return the cached embedding for `query`, encoding it on a miss."""
+        key = normalize_query(query)
+        with self._lock:
+            emb = self._data.get(key)
+            if emb is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return emb
+            self.misses += 1
+
+        # Encode outside the lock so a slow forward pass doesn't block hits
+        emb = np.asarray(encode(query), dtype=np.float32)
+        emb.setflags(write=False)
+
+        if self.capacity == 0:
+            return emb
+        with self._lock:
+            self._data[key] = emb
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return emb
+
+    def get_or_encode_batch(self, queries: List[str],
+                            encode_batch: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings for `queries` as one (len(queries), dim) matrix.
+
+        Cached queries are looked up; all misses (deduplicated by normalised
+        text) are encoded in ONE encode_batch call.
+        """
+        keys = [normalize_query(q) for q in queries]
+        found: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        with self._lock:
+            for key, query in zip(keys, queries):
+                emb = self._data.get(key)
+                if emb is not None:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    found[key] = emb
+                elif key not in missing:
+                    self.misses += 1
+                    missing[key] = query
+
+        if missing:
+            encoded = np.asarray(encode_batch(list(missing.values())), dtype=np.float32)
+            for key, emb in zip(missing, encoded):
+                emb = emb.copy()
+                emb.setflags(write=False)
+                found[key] = emb
+            if self.capacity > 0:
+                with self._lock:
+                    for key in missing:
+                        self._data[key] = found[key]
+                        self._data.move_to_end(key)
+                    while len(self._data) > self.capacity:
+                        self._data.popitem(last=False)
+                        self.evictions += 1
+
+        return np.stack([found[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# ---------------------------------------------------------------------------
+# Answer cache
+# ---------------------------------------------------------------------------
+
+def chunk_fingerprints(chunks: List[Dict]) -> List[str]:
+    """id + text hash per chunk, so an edited manual section changes the key."""
+    return [
+        f"{c.get('id')}:{hashlib.sha1(c['text'].encode('utf-8')).hexdigest()[:12]}"
+        for c in chunks
+    ]
+
+
+def answer_cache_key(query: str,
+                     entities: Dict,
+                     chunks: List[Dict],
+                     model: str,
+                     prompt_version: str) -> str:
+    """
+    Hash of everything that decides the LLM prompt.
+
+    Chunks contribute chunk_fingerprints(), so an edited manual section
+    never serves an answer generated from its old wording.
+    """
+    payload = {
+        "q": normalize_query(query),
+        "dtc": sorted(entities.get("dtc_codes", [])),
+        "comp": sorted(entities.get("components", [])),
+        "sym": sorted(entities.get("symptoms", [])),
+        "type": entities.get("query_type", "general"),
+        "chunks": chunk_fingerprints(chunks),
+        "model": model,
+        "prompt": prompt_version,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Thread-safe TTL + LRU cache of generated answers.
+
+    With `db_path` set, entries are also written to SQLite and looked up
+    there on an in-memory miss (e.g. after a restart).
+    """
+
+    def __init__(self,
+                 capacity: int = ANSWER_CACHE_SIZE,
+                 ttl: float = ANSWER_CACHE_TTL,
+                 db_path: str = ANSWER_CACHE_DB):
+        self.capacity = max(0, capacity)
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, answer TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _fresh(self, created: float) -> bool:
+        return self.ttl <= 0 or (time.time() - created) < self.ttl
+
+    def _remember(self, key: str, created: float, answer: str) -> None:
+        # Caller holds the lock
+        self._data[key] = (created, answer)
+        self._data.move_to_end(key)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                created, answer = entry
+                if self._fresh(created):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return answer
+                del self._data[key]
+                self.expired += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT answer, created FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    answer, created = row
+                    if self._fresh(created):
+                        self._remember(key, created, answer)
+                        self.hits += 1
+                        return answer
+                    self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.expired += 1
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, answer: str) -> None:
+        if self.capacity == 0:
+            return
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, answer)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, answer, created) VALUES (?, ?, ?)",
+                    (key, answer, created),
+                )
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "capacity": self.capacity,
+                "ttl_seconds": self.ttl,
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# ---------------------------------------------------------------------------
+# Semantic answer cache
+# ---------------------------------------------------------------------------
+
+def entity_signature(entities: Dict,
+                     chunks: List[Dict],
+                     model: str,
+                     prompt_version: str) -> str:
+    """
+    Exact-match part of a semantic cache entry (entities + evidence chunks
+    + model + prompt), so a reindexed manual never serves an old answer.
+    """
+    return json.dumps(
+        [
+            sorted(entities.get("dtc_codes", [])),
+            sorted(entities.get("components", [])),
+            sorted(entities.get("symptoms", [])),
+            entities.get("query_type", "general"),
+            chunk_fingerprints(chunks),
+            model,
+            prompt_version,
+        ]
+    )
+
+
+class SemanticAnswerCache:
+    """
+    Small nearest-neighbour index over embeddings of answered queries.
+
+    A lookup only considers entries with the same entity signature (so
+    "P0117 meaning" never matches "P0118 meaning"), then returns the answer
+    of the most similar past query if cosine >= `threshold`. Embeddings sit
+    in one preallocated float32 matrix; when full, the oldest slot is reused.
+    """
+
+    def __init__(self,
+                 capacity: int = SEMANTIC_CACHE_SIZE,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = ANSWER_CACHE_TTL):
+        self.capacity = max(0, capacity)
+        self.threshold = threshold
+        self.ttl = ttl
+        self._matrix: Optional[np.ndarray] = None
+        self._signatures: List[Optional[str]] = [None] * self.capacity
+        self._answers: List[Optional[str]] = [None] * self.capacity
+        self._created = np.zeros(self.capacity, dtype=np.float64)
+        self._next = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def get(self, embedding: np.ndarray, signature: str) -> Optional[str]:
+        """Answer of the closest past query with the same signature, or None."""
+        with self._lock:
+            self.lookups += 1
+            if self._matrix is None:
+                return None
+
+            rows = [i for i, sig in enumerate(self._signatures) if sig == signature]
+            if self.ttl > 0:
+                cutoff = time.time() - self.ttl
+                rows = [i for i in rows if self._created[i] >= cutoff]
+            if not rows:
+                return None
+
+            rows = np.array(rows)
+            sims = self._matrix[rows] @ self._unit(embedding)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            self.hits += 1
+            return self._answers[int(rows[best])]
+
+    def put(self, embedding: np.ndarray, signature: str, answer: str) -> None:
+        if self.capacity == 0:
+            return
+        vec = self._unit(embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+            slot = self._next
+            if self._signatures[slot] is not None:
+                self.evictions += 1
+            self._matrix[slot] = vec
+            self._signatures[slot] = signature
+            self._answers[slot] = answer
+            self._created[slot] = time.time()
+            self._next = (slot + 1) % self.capacity
+
+    def clear(self) -> None:
+        with self._lock:
+            self._signatures = [None] * self.capacity
+            self._answers = [None] * self.capacity
+            self._created[:] = 0.0
+            self._next = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": sum(1 for sig in self._signatures if sig is not None),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "llm_calls_avoided": self.hits,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            }
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory WAV -> 16 kHz mono int16 PCM conversion for Vosk.
+
+The speech endpoints used to save every upload to /tmp, reopen it with
+`wave` and run `audioop.tomono` / `audioop.ratecv` per 4000-frame block.
+Here the upload (or a chunked request body) is read straight from its
+stream:
+
+    - header      : parsed with `wave` on the stream itself, which works
+                    for non-seekable request bodies as well
+    - downmix     : numpy mean over the channel axis
+    - resample    : vectorised linear interpolation (np.interp), the same
+                    filter class as audioop.ratecv; the fractional read
+                    position and last sample carry over between blocks,
+                    so blocks join without clicks or drift
+    - recognition : each converted block goes to KaldiRecognizer as soon
+                    as it is read, so a chunked upload is decoded while
+                    the technician is still talking
+
+audioop is deprecated (and removed in Python 3.13); nothing here needs it.
+"""
+
+import json
+import os
+import time
+import wave
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+import numpy as np
+
+TARGET_RATE = 16000
+# Frames read per block (~0.25 s at 16 kHz, ~0.1 s at 44.1 kHz)
+SPEECH_BLOCK_FRAMES = int(os.environ.get("SPEECH_BLOCK_FRAMES", "4000"))
+
+
+class AudioFormatError(ValueError):
+    """The upload is not a PCM WAV stream Vosk can be fed from."""
+
+
+class StreamingResampler:
+    """Linear-interpolation resampler that keeps its phase across blocks."""
+
+    def __init__(self, src_rate: int, dst_rate: int = TARGET_RATE):
+        self.step = src_rate / float(dst_rate)
+        self._pos = 0.0                               # next output, in input samples
+        self._tail = np.empty(0, dtype=np.float32)    # last input sample seen
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.step == 1.0:
+            return samples
+        x = np.concatenate((self._tail, samples))
+        last = len(x) - 1
+        n_out = int((last - self._pos) // self.step) + 1 if last >= self._pos else 0
+        positions = self._pos + self.step * np.arange(n_out)
+        out = np.interp(positions, np.arange(len(x)), x).astype(np.float32)
+        # Re-base the read position on the sample kept as the next tail
+        self._pos += n_out * self.step - max(last, 0)
+        self._tail = x[-1:]
+        return out
+
+
+def pcm_blocks(stream: BinaryIO,
+               block_frames: int = SPEECH_BLOCK_FRAMES) -> Iterator[bytes]:
+    """
+    Yield 16 kHz mono int16 PCM blocks from a WAV byte stream.
+
+    Raises AudioFormatError (before the first block) when the stream is
+    not 16-bit PCM WAV.
+    """
+    try:
+        wf = wave.open(stream, "rb")
+    except (wave.Error, EOFError) as e:
+        raise AudioFormatError(f"Cannot read WAV file: {e}") from e
+    channels = wf.getnchannels()
+    if wf.getsampwidth() != 2:
+        wf.close()
+        raise AudioFormatError("Audio must be 16-bit PCM WAV.")
+    resampler = StreamingResampler(wf.getframerate())
+
+    def blocks() -> Iterator[bytes]:
+        try:
+            while True:
+                data = wf.readframes(block_frames)
+                if not data:
+                    break
+                # A truncated final frame can leave a partial sample behind
+                samples = np.frombuffer(data[:len(data) - len(data) % (2 * channels)],
+                                        dtype="<i2")
+                mono = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+                out = resampler.process(mono)
+                if len(out):
+                    yield np.clip(np.rint(out), -32768, 32767).astype("<i2").tobytes()
+        finally:
+            wf.close()
+
+    return blocks()
+
+
+def transcribe(recognizer, blocks: Iterator[bytes],
+               timing: Optional[Dict] = None) -> str:
+    """
+    Feed PCM blocks to a KaldiRecognizer and join the recognized text.
+
+    If `timing` is given it receives decode_ms (time spent inside the
+    recognizer, not waiting for blocks) and audio_s (audio duration).
+    """
+    parts: List[str] = []
+    decode_s = 0.0
+    n_bytes = 0
+    for block in blocks:
+        n_bytes += len(block)
+        start = time.perf_counter()
+        if recognizer.AcceptWaveform(block):
+            parts.append(json.loads(recognizer.Result()).get("text", ""))
+        decode_s += time.perf_counter() - start
+    start = time.perf_counter()
+    parts.append(json.loads(recognizer.FinalResult()).get("text", ""))
+    decode_s += time.perf_counter() - start
+    if timing is not None:
+        timing["decode_ms"] = decode_s * 1000.0
+        timing["audio_s"] = n_bytes / 2.0 / TARGET_RATE
+    return " ".join(p.strip() for p in parts if p.strip()).strip()
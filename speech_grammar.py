@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vosk grammar for "constrained" speech mode, plus spoken-DTC normalization.
+
+Free-vocabulary decoding searches the full language model graph and
+often mishears spelled codes such as "P zero one one seven". Vosk can
+instead restrict a KaldiRecognizer to a phrase list, which is both
+faster and far more robust for the small workshop vocabulary. The phrase
+list is built from:
+
+    - KNOWLEDGE_GRAPH node names (DTCs spelled out, components, symptoms)
+    - the backend's alias / keyword tables (the same ones compiled into
+      ENTITY_MATCHER)
+    - spelled letters + digit words, so codes missing from the KG can
+      still be dictated, and a small set of question words
+    - "[unk]", which absorbs anything outside the list
+
+Vosk lets any sequence of listed phrases through, so "what does p zero
+one one seven mean" decodes as phrases. Words the acoustic model does
+not know are dropped by Vosk with a warning. Grammars only work with
+models that ship a dynamic graph, such as the small vosk-model-* builds.
+
+normalize_transcript() then folds spelled codes back ("p zero one one
+seven" -> "P0117") so extract_entities picks them up, in either mode.
+"""
+
+import re
+from typing import Dict, Iterable, List
+
+# Spoken forms of each DTC prefix letter and digit
+LETTER_WORDS = {
+    "p": "P", "pee": "P",
+    "b": "B", "bee": "B",
+    "c": "C", "see": "C", "sea": "C",
+    "u": "U", "you": "U",
+}
+DIGIT_WORDS = {
+    "zero": "0", "oh": "0", "o": "0",
+    "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+}
+_SPELL_DIGITS = ["zero", "one", "two", "three", "four",
+                 "five", "six", "seven", "eight", "nine"]
+
+# Glue words a technician puts around the domain phrases
+QUESTION_WORDS = [
+    "what", "is", "the", "a", "an", "of", "for", "my", "on", "in", "and",
+    "does", "do", "why", "how", "where", "which", "it", "car", "code",
+    "error", "fault", "check", "test", "value", "please", "nano",
+]
+
+_DTC_CODE = re.compile(r"^[PBCU][0-9]{4}$")
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def spell_dtc(code: str) -> List[str]:
+    """Spoken forms of a DTC: "P0117" -> ["p zero one one seven", "p oh one one seven"]."""
+    letter = code[0].lower()
+    digits = [_SPELL_DIGITS[int(d)] for d in code[1:]]
+    forms = [" ".join([letter] + digits)]
+    if "zero" in digits:
+        forms.append(" ".join([letter] + ["oh" if d == "zero" else d for d in digits]))
+    return forms
+
+
+def build_grammar(knowledge_graph: Dict[str, Dict],
+                  alias_tables: Dict[str, Iterable[str]]) -> List[str]:
+    """Phrase list for KaldiRecognizer(model, rate, json.dumps(phrases))."""
+    phrases: List[str] = []
+    seen = set()
+
+    def add(phrase: str) -> None:
+        phrase = " ".join(_TOKEN.findall(phrase.lower()))
+        if phrase and phrase not in seen:
+            seen.add(phrase)
+            phrases.append(phrase)
+
+    for name in knowledge_graph:
+        if _DTC_CODE.match(name.upper()):
+            for form in spell_dtc(name.upper()):
+                add(form)
+        else:
+            add(name)
+    for table in alias_tables.values():
+        for alias in table:
+            add(alias)
+    for word in list(LETTER_WORDS) + list(DIGIT_WORDS) + QUESTION_WORDS:
+        add(word)
+    phrases.append("[unk]")
+    return phrases
+
+
+def normalize_transcript(text: str) -> str:
+    """
+    Fold spelled-out codes into DTCs: "p zero one one seven" -> "P0117".
+
+    A prefix letter followed by exactly four digit words (or digits) is
+    replaced; anything else is left as recognized.
+    """
+    tokens = text.split()
+    out: List[str] = []
+    i = 0
+    while i < len(tokens):
+        letter = LETTER_WORDS.get(tokens[i].lower())
+        if letter:
+            digits = []
+            j = i + 1
+            while j < len(tokens) and len(digits) < 4:
+                word = tokens[j].lower()
+                if word in DIGIT_WORDS:
+                    digits.append(DIGIT_WORDS[word])
+                elif word.isdigit() and len(digits) + len(word) <= 4:
+                    digits.extend(word)
+                else:
+                    break
+                j += 1
+            if len(digits) == 4:
+                out.append(letter + "".join(digits))
+                i = j
+                continue
+        out.append(tokens[i])
+        i += 1
+    return " ".join(out)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool of Vosk recognizer processes fed from the speech endpoints.
+
+Decoding is CPU-bound and holds the GIL, so recognizing inside the Flask
+request thread made two concurrent voice queries on the workshop tablet
+take turns. Instead:
+
+    - workers   : SPEECH_WORKERS processes, forked after the Vosk model is
+                  loaded, so they share its memory copy-on-write. Each
+                  creates its KaldiRecognizer once and Reset()s it per job
+    - jobs      : a request thread borrows an idle worker and streams PCM
+                  blocks to it over a pipe as they are converted (a chunked
+                  upload is still decoded while it arrives); an empty block
+                  ends the job and the worker replies with the transcript
+    - queue     : at most SPEECH_QUEUE_SIZE requests wait for a worker;
+                  beyond that transcribe() raises SpeechQueueFull (-> 429)
+    - timing    : every job reports queue_ms, decode_ms and audio_s, and
+                  the pool keeps running totals for /api/health
+    - failures  : a worker that times out or dies is handed to one respawn
+                  thread, which closes it and forks the replacement, so
+                  request threads never fork. The server is multithreaded
+                  by then, so the child only touches its pipe and the
+                  Vosk model (no locks a request thread may be holding)
+    - modes     : given a grammar (see speech_grammar.py), each worker also
+                  keeps a grammar-constrained recognizer; a job picks one
+                  with transcribe(blocks, constrained=True)
+
+With SPEECH_WORKERS=0, or where fork is unavailable, jobs are decoded in
+the calling thread with a fresh recognizer, as before.
+"""
+
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from speech_audio import TARGET_RATE, transcribe
+
+SPEECH_WORKERS = int(os.environ.get("SPEECH_WORKERS", "2"))
+SPEECH_QUEUE_SIZE = int(os.environ.get("SPEECH_QUEUE_SIZE", "4"))
+# Max wait for a free worker, and for a worker's final result
+SPEECH_JOB_TIMEOUT = float(os.environ.get("SPEECH_JOB_TIMEOUT", "30"))
+
+_END_OF_JOB = b""
+# Sent instead of a mode flag to stop a worker. Closing the pipe alone is
+# not enough: later forks inherit copies of the parent's pipe ends.
+_STOP = None
+
+
+class SpeechQueueFull(RuntimeError):
+    """Every worker is busy and the wait queue is full."""
+
+
+def _recognizers(model, sample_rate: int, grammar: Optional[List[str]]) -> Dict:
+    """{False: free-vocabulary recognizer, True: constrained (if grammar)}."""
+    from vosk import KaldiRecognizer
+
+    recognizers = {False: KaldiRecognizer(model, sample_rate)}
+    if grammar:
+        recognizers[True] = KaldiRecognizer(model, sample_rate, json.dumps(grammar))
+    return recognizers
+
+
+def _worker_main(conn, model, sample_rate: int, grammar: Optional[List[str]]) -> None:
+    """Worker process: pre-created recognizers, one job at a time from `conn`."""
+    recognizers = _recognizers(model, sample_rate, grammar)
+    while True:
+        timing: Dict = {}
+        try:
+            # A job is its mode flag, then PCM blocks until the empty block
+            mode = conn.recv()
+            if mode is _STOP:
+                return
+            recognizer = recognizers.get(mode, recognizers[False])
+            text = transcribe(recognizer, iter(conn.recv_bytes, _END_OF_JOB), timing)
+        except (EOFError, OSError):
+            return   # pool closed
+        recognizer.Reset()
+        conn.send({"text": text, **timing})
+
+
+class _Worker:
+    def __init__(self, ctx, model, sample_rate: int, grammar: Optional[List[str]]):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child, model, sample_rate, grammar), daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def close(self) -> None:
+        try:
+            self.conn.send(_STOP)
+        except OSError:
+            pass   # already dead
+        self.conn.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class SpeechWorkerPool:
+    """Bounded recognizer pool; transcribe(blocks) -> (transcript, timing)."""
+
+    def __init__(self, model, workers: int = SPEECH_WORKERS,
+                 queue_size: int = SPEECH_QUEUE_SIZE,
+                 sample_rate: int = TARGET_RATE,
+                 timeout: float = SPEECH_JOB_TIMEOUT,
+                 grammar: Optional[List[str]] = None):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.grammar = grammar
+        self.timeout = timeout
+        self._ctx = None
+        if workers > 0:
+            try:
+                self._ctx = multiprocessing.get_context("fork")
+            except ValueError:
+                print("⚠️ fork not available; decoding speech in request threads")
+                workers = 0
+        self.workers = workers
+        # In-flight jobs (running + waiting) admitted at once
+        self._slots = threading.BoundedSemaphore(max(1, workers) + queue_size)
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(self._spawn())
+        # Broken workers go here; None stops the respawn thread
+        self._closed = False
+        self._broken: "queue.Queue[Optional[_Worker]]" = queue.Queue()
+        if workers:
+            threading.Thread(target=self._respawn_loop, name="speech-respawn",
+                             daemon=True).start()
+
+        self._lock = threading.Lock()
+        self._stats = {"jobs": 0, "rejected": 0, "failed": 0,
+                       "queue_ms": 0.0, "decode_ms": 0.0, "audio_s": 0.0}
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.model, self.sample_rate, self.grammar)
+
+    def _respawn_loop(self) -> None:
+        """Replace broken workers, one at a time, off the request threads."""
+        while True:
+            worker = self._broken.get()
+            if worker is None:
+                return
+            worker.close()
+            if self._closed:
+                continue
+            try:
+                self._idle.put(self._spawn())
+            except OSError as e:
+                print(f"⚠️ Could not respawn speech worker: {e}")
+
+    def transcribe(self, blocks: Iterator[bytes],
+                   constrained: bool = False) -> Tuple[str, Dict]:
+        """Decode `blocks`; constrained=True uses the grammar recognizer if any."""
+        constrained = constrained and bool(self.grammar)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise SpeechQueueFull("Speech recognizer queue is full; retry shortly.")
+        try:
+            if self.workers == 0:
+                text, timing = self._transcribe_inline(blocks, constrained)
+            else:
+                text, timing = self._transcribe_pooled(blocks, constrained)
+        except SpeechQueueFull:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        finally:
+            self._slots.release()
+
+        with self._lock:
+            self._stats["jobs"] += 1
+            for key in ("queue_ms", "decode_ms", "audio_s"):
+                self._stats[key] += timing[key]
+        return text, timing
+
+    def _transcribe_inline(self, blocks: Iterator[bytes],
+                           constrained: bool) -> Tuple[str, Dict]:
+        grammar = self.grammar if constrained else None
+        recognizer = _recognizers(self.model, self.sample_rate, grammar)[constrained]
+        timing: Dict = {"queue_ms": 0.0, "constrained": constrained}
+        text = transcribe(recognizer, blocks, timing)
+        return text, timing
+
+    def _transcribe_pooled(self, blocks: Iterator[bytes],
+                           constrained: bool) -> Tuple[str, Dict]:
+        start = time.perf_counter()
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise SpeechQueueFull("No speech recognizer became free in time.")
+        queue_ms = (time.perf_counter() - start) * 1000.0
+
+        healthy = False
+        try:
+            try:
+                worker.conn.send(constrained)
+                for block in blocks:
+                    worker.conn.send_bytes(block)
+            finally:
+                # Always close the job so the worker resets, even when the
+                # upload broke off mid-stream
+                worker.conn.send_bytes(_END_OF_JOB)
+                if not worker.conn.poll(self.timeout):
+                    raise TimeoutError("Speech recognizer did not finish in time.")
+                result = worker.conn.recv()
+                healthy = True
+        finally:
+            if healthy:
+                self._idle.put(worker)
+            else:
+                self._broken.put(worker)
+
+        return result["text"], {"queue_ms": queue_ms,
+                                "decode_ms": result["decode_ms"],
+                                "audio_s": result["audio_s"],
+                                "constrained": constrained}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        jobs = stats["jobs"] or 1
+        return {
+            "workers": self.workers,
+            "grammar_phrases": len(self.grammar or []),
+            "busy": self.workers - self._idle.qsize(),
+            "jobs": stats["jobs"],
+            "rejected": stats["rejected"],
+            "failed": stats["failed"],
+            "avg_queue_ms": round(stats["queue_ms"] / jobs, 1),
+            "avg_decode_ms": round(stats["decode_ms"] / jobs, 1),
+            # < 1.0 means faster than real time
+            "real_time_factor": round(
+                stats["decode_ms"] / 1000.0 / stats["audio_s"], 3
+            ) if stats["audio_s"] else None,
+        }
+
+    def close(self) -> None:
+        self._closed = True
+        self._broken.put(None)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,80 @@
+"""
+Route-level tests for the Claude backend with a fake Anthropic client.
+
+Importing the backend needs its full runtime (Flask, anthropic,
+sentence-transformers and the MiniLM weights); without them these tests
+are skipped.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("anthropic")
+pytest.importorskip("sentence_transformers")
+
+ANSWER = "<h3>📋 Coolant Sensor</h3><p><em>Source: TATA Nano EMS Service Manual v5.0</em></p>"
+
+
+class FakeMessages:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        usage = SimpleNamespace(input_tokens=100, cache_read_input_tokens=0,
+                                cache_creation_input_tokens=0, output_tokens=20)
+        return SimpleNamespace(content=[SimpleNamespace(text=ANSWER)], usage=usage)
+
+
+@pytest.fixture(scope="module")
+def backend():
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("ANTHROPIC_API_KEY", "sk-ant-test-key-not-used")
+        mp.setenv("ANSWER_CACHE_DB", "")
+        import chatbot_backend_claude_1
+    return chatbot_backend_claude_1
+
+
+@pytest.fixture
+def fake_client(backend, monkeypatch):
+    client = SimpleNamespace(messages=FakeMessages())
+    monkeypatch.setattr(backend, "claude_client", client)
+    backend.answer_cache.clear()
+    backend.semantic_cache.clear()
+    return client
+
+
+def test_chat_adds_requested_images(backend, fake_client):
+    response = backend.app.test_client().post(
+        "/api/chat", json={"message": "Show me picture of coolant sensor location"}
+    )
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(fake_client.messages.calls) == 1
+    system = fake_client.messages.calls[0]["system"]
+    assert system[0]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in system[1]
+    assert "Component Images & Location" in body["answer"]
+    assert body["answer"].endswith("Source: TATA Nano EMS Service Manual v5.0</em></p>")
+
+
+def test_chat_response_leaves_explanations_without_images(backend, fake_client):
+    query = "What does P0117 mean?"
+    ctx = backend.retrieve_context(query)
+    answer = backend.generate_answer(query, ctx["prompt"], max_tokens=ctx["max_tokens"])
+    payload = backend.chat_response(query, ctx, answer, "miss")
+    assert payload["answer"] == ANSWER
+    assert payload["cache"] == "miss"
+
+
+def test_stream_ends_with_error_event_when_retrieval_fails(backend, monkeypatch):
+    def broken_retrieval(query):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(backend, "retrieve_context", broken_retrieval)
+    response = backend.app.test_client().post("/api/chat/stream", json={"message": "P0117"})
+    events = [block for block in response.get_data(as_text=True).split("\n\n") if block]
+    assert events[-1].startswith("event: error\n")
+    assert "index unavailable" in events[-1]
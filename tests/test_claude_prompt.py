@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from claude_prompt import PROMPT_CACHE_CONTROL, PromptUsage, message_request
+from prompt_templates import render_prompt
+
+TRIPLES = [("P0117", "has_symptom", "Continuous Fan")]
+CHUNKS = [{"id": "c1", "text": "ECT sensor circuit low voltage.", "page": 165, "section": "DTC"}]
+
+
+class FakeMessages:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        usage = SimpleNamespace(input_tokens=40, cache_read_input_tokens=600,
+                                cache_creation_input_tokens=0, output_tokens=90)
+        return SimpleNamespace(content=[SimpleNamespace(text="<p>ok</p>")], usage=usage)
+
+
+class FakeClient:
+    def __init__(self):
+        self.messages = FakeMessages()
+
+
+def _send(client):
+    prompt = render_prompt(TRIPLES, CHUNKS, "explanation", backend="claude")
+    request = message_request("claude-test", "What is P0117?", prompt, 256)
+    client.messages.create(**request)
+    return prompt, client.messages.calls[-1]
+
+
+def test_cache_control_marks_only_the_static_instructions():
+    prompt, call = _send(FakeClient())
+
+    first, second = call["system"]
+    assert first == {"type": "text", "text": prompt.instructions,
+                     "cache_control": PROMPT_CACHE_CONTROL}
+    assert second == {"type": "text", "text": prompt.context}
+    assert "P0117" in second["text"] and "P0117" not in first["text"]
+    assert call["messages"] == [{"role": "user", "content": "What is P0117?"}]
+    assert call["max_tokens"] == 256
+
+
+def test_usage_totals_report_cached_fraction():
+    usage = PromptUsage()
+    response = FakeClient().messages.create()
+    usage.record(response.usage)
+    stats = usage.stats()
+    assert stats["requests"] == 1
+    assert stats["cached_fraction"] == round(600 / 640, 3)
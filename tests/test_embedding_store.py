@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import embedding_store
+from embedding_store import encode_to_store, load_embeddings, load_or_encode
+
+MODEL = "fake/mini-model"
+
+
+class FakeEmbedder:
+    """Deterministic 8-dim embeddings derived from the text."""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, batch_size=64, convert_to_numpy=True):
+        self.encoded += len(texts)
+        return np.array([np.random.default_rng(sum(map(ord, t))).normal(size=8)
+                         for t in texts], dtype=np.float32)
+
+
+def _chunks(*texts):
+    return [{"id": f"c{i}", "text": text} for i, text in enumerate(texts)]
+
+
+def test_unchanged_chunks_load_without_encoding(tmp_path):
+    chunks = _chunks("fan relay", "coolant sensor")
+    first = np.array(load_or_encode(chunks, FakeEmbedder(), MODEL, str(tmp_path)))
+
+    embedder = FakeEmbedder()
+    again = load_or_encode(chunks, embedder, MODEL, str(tmp_path))
+    assert embedder.encoded == 0
+    np.testing.assert_array_equal(again, first)
+
+
+def test_crash_before_sidecar_is_not_served(tmp_path, monkeypatch):
+    old = _chunks("fan relay", "coolant sensor")
+    load_or_encode(old, FakeEmbedder(), MODEL, str(tmp_path))
+
+    def crash(*args, **kwargs):
+        raise OSError("killed before the sidecar was written")
+
+    new = _chunks("window motor", "coolant sensor", "fuse F12")
+    monkeypatch.setattr(embedding_store, "_write_sidecar", crash)
+    with pytest.raises(OSError):
+        encode_to_store(new, FakeEmbedder(), MODEL, str(tmp_path))
+    monkeypatch.undo()
+
+    # The old sidecar no longer describes the replaced .npy
+    assert load_embeddings(old, MODEL, str(tmp_path)) is None
+    embedder = FakeEmbedder()
+    matrix = load_or_encode(new, embedder, MODEL, str(tmp_path))
+    assert embedder.encoded == len(new)
+    assert matrix.shape == (3, 8)
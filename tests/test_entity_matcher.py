@@ -0,0 +1,43 @@
+import pytest
+
+from entity_matcher import EntityMatcher
+
+TABLES = {
+    "component": {"fan": "Radiator Fan", "window": "Window Motor", "fuse": "Fuse",
+                  "coolant sensor": "Coolant Sensor"},
+    "image": {"show": "show", "image": "image", "picture": "picture"},
+    "detail": {"explain": "explain"},
+    "repair": {"repair": "repair", "fix": "fix"},
+}
+
+
+def test_plural_aliases_match():
+    found = EntityMatcher(TABLES).match("Both fans run and the windows are stuck")
+    assert found["component"] == ["Radiator Fan", "Window Motor"]
+
+
+def test_plural_keywords_match():
+    found = EntityMatcher(TABLES).match("Any images or pictures of the fuses?")
+    assert found["image"] == ["image", "picture"]
+    assert found["component"] == ["Fuse"]
+
+
+@pytest.mark.parametrize("query, category, keyword", [
+    ("fixing the fan", "repair", "fix"),
+    ("repairing the fan", "repair", "repair"),
+    ("showing the coolant sensor", "image", "show"),
+    ("P0117 explained simply", "detail", "explain"),
+])
+def test_inflected_query_type_keywords_match(query, category, keyword):
+    assert EntityMatcher(TABLES).match(query)[category] == [keyword]
+
+
+def test_word_boundaries_still_apply():
+    found = EntityMatcher(TABLES).match("Replaced the fanbelt near the windowsill, P0117 set")
+    assert found["component"] == []
+    assert found["dtc"] == ["P0117"]
+
+
+def test_keywords_must_start_a_word():
+    found = EntityMatcher(TABLES).match("Check the prefix of the fuse label")
+    assert found["repair"] == []
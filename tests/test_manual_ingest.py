@@ -0,0 +1,58 @@
+import copy
+import json
+
+from manual_ingest import ingest_manuals, merge_kg_node, pages_used
+
+
+def _write_jsonl(path, records):
+    path.write_text("\n".join(json.dumps(r) for r in records), encoding="utf-8")
+    return str(path)
+
+
+def test_pages_used_mixes_builtin_and_ingested_chunks(tmp_path):
+    chunks = [
+        {"id": "builtin_1", "text": "Coolant sensor circuit low.", "page": 165},
+        {"id": "builtin_2", "text": "Radiator fan relay check.", "page": 42},
+    ]
+    manual = _write_jsonl(tmp_path / "extra.jsonl", [
+        {"text": "P0118 coolant sensor circuit high."},          # no page
+        {"text": "Window motor wiring.", "page": "A-12"},
+    ])
+    ingest_manuals([manual], chunks, {})
+
+    assert chunks[2]["page"] == "N/A"
+    assert pages_used(chunks) == [42, 165, "A-12"]
+
+
+def test_reingest_on_builtin_graph_picks_up_edits_and_deletions(tmp_path):
+    builtin = {"P0117": {"type": "DTC", "symptoms": ["Continuous Fan"]}}
+    manual = tmp_path / "kg.jsonl"
+
+    _write_jsonl(manual, [
+        {"kg_node": "P0117", "attributes": {"symptoms": ["Continuous Fan", "Stalling"]}},
+        {"kg_node": "Fan Fuse", "attributes": {"type": "Component", "rating": "30A"}},
+        {"kg_node": "Old Relay", "attributes": {"type": "Component"}},
+    ])
+    graph = copy.deepcopy(builtin)
+    ingest_manuals([str(manual)], [], graph)
+    assert graph["Fan Fuse"]["rating"] == "30A"
+
+    _write_jsonl(manual, [
+        {"kg_node": "P0117", "attributes": {"symptoms": ["Continuous Fan"]}},
+        {"kg_node": "Fan Fuse", "attributes": {"type": "Component", "rating": "40A"}},
+    ])
+    graph = copy.deepcopy(builtin)
+    ingest_manuals([str(manual)], [], graph)
+
+    assert graph["Fan Fuse"]["rating"] == "40A"
+    assert graph["P0117"] == {"type": "DTC", "symptoms": ["Continuous Fan"]}
+    assert "Old Relay" not in graph
+    assert builtin == {"P0117": {"type": "DTC", "symptoms": ["Continuous Fan"]}}
+
+
+def test_merge_kg_node_keeps_scalars_unless_replacing():
+    graph = {"Fan Fuse": {"rating": "30A", "pins": [1]}}
+    merge_kg_node(graph, "Fan Fuse", {"rating": "40A", "pins": [2]})
+    assert graph["Fan Fuse"] == {"rating": "30A", "pins": [1, 2]}
+    merge_kg_node(graph, "Fan Fuse", {"rating": "40A", "pins": [2]}, replace=True)
+    assert graph["Fan Fuse"] == {"rating": "40A", "pins": [2]}
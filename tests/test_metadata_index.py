@@ -0,0 +1,20 @@
+from metadata_index import MetadataIndex
+
+CHUNKS = [
+    {"id": "a", "dtcs": ["P0117", "P0118"], "component": "Coolant Sensor", "page": 165},
+    {"id": "b", "dtc": "P0118", "page": 166},
+    {"id": "c", "component": "Window Motor", "page": 40},
+    {"id": "d", "page": "N/A"},
+]
+
+
+def test_tagged_or_untagged_rows_pass_each_filter():
+    index = MetadataIndex(CHUNKS)
+    assert index.candidates({}) is None
+    assert index.candidates({"dtc_codes": ["P0117"]}).tolist() == [0, 2, 3]
+    assert index.candidates({"dtc_codes": ["P0118"],
+                             "components": ["Window Motor"]}).tolist() == [1, 2, 3]
+
+
+def test_pages_are_not_a_filter():
+    assert MetadataIndex(CHUNKS).candidates({"pages": [165]}) is None
@@ -0,0 +1,24 @@
+import pytest
+
+from prompt_templates import QUERY_TYPES, get_template, render_prompt
+
+
+@pytest.mark.parametrize("query_type", QUERY_TYPES)
+def test_image_rules_only_in_claude_templates(query_type):
+    ollama = get_template(query_type, "ollama").instructions
+    claude = get_template(query_type, "claude").instructions
+    assert "Images will be added automatically" not in ollama
+    assert "Images will be added automatically" in claude
+
+
+def test_render_trims_lowest_ranked_chunks_first():
+    triples = [("P0117", "has_symptom", "Continuous Fan")]
+    chunks = [{"id": f"c{i}", "text": "word " * 200, "page": i, "section": "S"} for i in range(5)]
+    full = render_prompt(triples, chunks, "repair", token_budget=100_000)
+    budget = full.tokens - 1
+    trimmed = render_prompt(triples, chunks, "repair", token_budget=budget)
+
+    assert trimmed.tokens <= budget
+    assert trimmed.triples == triples
+    assert [c["id"] for c in trimmed.chunks] == ["c0", "c1", "c2", "c3"]
+    assert trimmed.trimmed == 1
@@ -0,0 +1,37 @@
+import numpy as np
+
+from rag_cache import AnswerCache, SemanticAnswerCache, answer_cache_key, entity_signature
+
+ENTITIES = {"dtc_codes": ["P0117"], "components": [], "symptoms": [], "query_type": "explanation"}
+
+
+def _chunks(fuse_rating):
+    return [{"id": "fuse_1", "text": f"Radiator fan fuse F12 is rated {fuse_rating}."}]
+
+
+def test_semantic_cache_misses_after_chunk_text_changes():
+    cache = SemanticAnswerCache(capacity=4, threshold=0.9)
+    emb = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    old = entity_signature(ENTITIES, _chunks("30A"), "model", "v")
+    cache.put(emb, old, "<p>Fuse is 30A</p>")
+
+    assert cache.get(emb * 2, old) == "<p>Fuse is 30A</p>"
+    new = entity_signature(ENTITIES, _chunks("40A"), "model", "v")
+    assert new != old
+    assert cache.get(emb, new) is None
+
+
+def test_clear_empties_both_answer_caches():
+    semantic = SemanticAnswerCache(capacity=4, threshold=0.9)
+    exact = AnswerCache(capacity=4, db_path="")
+    emb = np.array([0.0, 1.0], dtype=np.float32)
+    sig = entity_signature(ENTITIES, _chunks("30A"), "model", "v")
+    key = answer_cache_key("fan fuse?", ENTITIES, _chunks("30A"), "model", "v")
+    semantic.put(emb, sig, "old")
+    exact.put(key, "old")
+
+    semantic.clear()
+    exact.clear()
+    assert semantic.get(emb, sig) is None
+    assert exact.get(key) is None
+    assert semantic.stats()["size"] == 0
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from ann_index import ANNIndex, IVFIndex
+from benchmark_retrieval import recall_at_k
+from quantization import QuantizedMatrix
+from vector_index import VectorIndex
+
+N_ROWS, DIM, N_CLUSTERS, N_QUERIES, TOP_K = 4000, 48, 40, 50, 10
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(N_CLUSTERS, DIM))
+    matrix = _unit(centers[rng.integers(N_CLUSTERS, size=N_ROWS)]
+                   + 0.35 * rng.normal(size=(N_ROWS, DIM)))
+    queries = _unit(matrix[rng.choice(N_ROWS, size=N_QUERIES, replace=False)]
+                    + 0.1 * rng.normal(size=(N_QUERIES, DIM)))
+    chunks = [{"id": f"c{i}", "text": f"chunk {i}"} for i in range(N_ROWS)]
+    truth = [np.argsort(-(matrix @ q))[:TOP_K].tolist() for q in queries]
+    return chunks, matrix, queries, truth
+
+
+def _recall(index, queries, truth):
+    found = [[row for row, _score in index.search(q, top_k=TOP_K)] for q in queries]
+    return recall_at_k(truth, found)
+
+
+def test_exact_search_matches_brute_force(corpus):
+    chunks, matrix, queries, truth = corpus
+    index = VectorIndex(chunks, matrix, normalized=True)
+    assert _recall(index, queries, truth) == 1.0
+
+
+def test_ivf_recall(corpus):
+    chunks, matrix, queries, truth = corpus
+    ann = IVFIndex.build(matrix, nprobe=8)
+    index = VectorIndex(chunks, matrix, normalized=True, ann=ann)
+    assert _recall(index, queries, truth) >= 0.9
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_recall_with_rescoring(corpus, dtype):
+    chunks, matrix, queries, truth = corpus
+    quantized = QuantizedMatrix.quantize(matrix, dtype)
+    index = VectorIndex(chunks, matrix, normalized=True, quantized=quantized, rescore=4)
+    assert _recall(index, queries, truth) >= 0.98
+    batch = index.search_batch(queries, [None] * N_QUERIES, top_k=TOP_K)
+    assert batch == [index.search(q, top_k=TOP_K) for q in queries]
+
+
+def test_incomplete_ann_backend_fails_at_construction():
+    class NoSave(ANNIndex):
+        def candidates(self, query, k):
+            return np.arange(k)
+
+    with pytest.raises(TypeError):
+        NoSave()
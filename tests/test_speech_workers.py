@@ -0,0 +1,49 @@
+import os
+import time
+
+import pytest
+
+import speech_workers
+from speech_workers import SpeechWorkerPool
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+
+
+def _fake_worker_main(conn, model, sample_rate, grammar):
+    """Stand-in for the Vosk worker: constrained jobs crash the process."""
+    while True:
+        try:
+            constrained = conn.recv()
+            if constrained is None:
+                return
+            blocks = list(iter(conn.recv_bytes, b""))
+        except (EOFError, OSError):
+            return
+        if constrained:
+            os._exit(1)
+        conn.send({"text": f"{len(blocks)} blocks", "decode_ms": 1.0, "audio_s": 0.5})
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(speech_workers, "_worker_main", _fake_worker_main)
+    pool = SpeechWorkerPool(model=None, workers=1, queue_size=1, timeout=5, grammar=["p"])
+    yield pool
+    pool.close()
+
+
+def test_pooled_job_returns_text_and_timing(pool):
+    text, timing = pool.transcribe(iter([b"\0\0", b"\0\0"]))
+    assert text == "2 blocks"
+    assert timing["decode_ms"] == 1.0 and timing["constrained"] is False
+
+
+def test_dead_worker_is_replaced_off_the_request_thread(pool):
+    with pytest.raises((EOFError, OSError)):
+        pool.transcribe(iter([b"\0\0"]), constrained=True)
+    assert pool.stats()["failed"] == 1
+
+    start = time.perf_counter()
+    text, _timing = pool.transcribe(iter([b"\0\0"]))
+    assert text == "1 blocks"
+    assert time.perf_counter() - start < 5
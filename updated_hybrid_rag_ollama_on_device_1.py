@@ -15,6 +15,8 @@ This module is imported by local_api_server.py and must expose:
 
     - load_data_from_files()
     - run_on_device_rag(query: str) -> dict
+    - stream_on_device_rag(query: str) -> iterator of (event, data)
+    - run_on_device_rag_async(query: str) -> dict   (async serving mode)
 
 Key improvements:
 - Uses a hybrid KG + vector search (similar to Claude backend)
@@ -23,13 +25,33 @@ Key improvements:
 - Returns HTML-structured answers for better readability
 """
 
+import asyncio
+import copy
 import os
 import json
-from typing import List, Dict, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import requests
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from ann_index import load_or_build_ann
+from quantization import EMBEDDING_RESCORE, load_or_quantize
+from context_packer import make_token_counter, pack_context
+from prompt_templates import PROMPT_TEMPLATE_VERSION
+from embedding_store import encode_to_store, load_or_encode
+from entity_matcher import EntityMatcher
+from kg_store import DIAGNOSTIC_HOPS, REPAIR_HOP, KnowledgeGraphStore, dedupe
+from manual_ingest import MANUAL_PATHS, ingest_manuals, pages_used
+from ollama_client import AsyncOllamaClient, OllamaClient
+from rag_cache import (
+    AnswerCache,
+    QueryEmbeddingCache,
+    SemanticAnswerCache,
+    answer_cache_key,
+    entity_signature,
+)
+from vector_index import VectorIndex
 
 # ---------------------------------------------------------------------------
 # GLOBALS & CONFIG
@@ -39,8 +61,35 @@ from sklearn.metrics.pairwise import cosine_similarity
 #OLLAMA_MODEL = os.environ.get("OFFLINE_LLM_MODEL", "llama3.1:8b")
 OLLAMA_MODEL = os.environ.get("OFFLINE_LLM_MODEL", "gemma2:9b")
 
+# Pooled keep-alive HTTP client for localhost:11434 (see ollama_client.py),
+# plus its httpx twin for the async serving mode
+OLLAMA = OllamaClient()
+OLLAMA_ASYNC = AsyncOllamaClient()
+
+# Thread pool for the CPU-bound retrieval steps in async mode
+RETRIEVAL_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RETRIEVAL_THREADS", "4")),
+    thread_name_prefix="retrieval",
+)
+
+# run_on_device_rag_batch: max queries per call / concurrent Ollama calls
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", "256"))
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "2"))
+
 # Sentence-transformer for embeddings (cached locally after first download)
-EMBEDDER = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDER = SentenceTransformer(EMBEDDING_MODEL)
+# Prompt token counts for context packing (memoised per chunk text)
+COUNT_TOKENS = make_token_counter(EMBEDDER.tokenizer)
+
+# LRU of query text -> embedding (repeated questions skip the encoder)
+QUERY_EMBEDDINGS = QueryEmbeddingCache()
+
+# TTL/LRU cache of final answers (optionally SQLite-backed, see rag_cache.py)
+ANSWERS = AnswerCache()
+
+# Paraphrase-tolerant answer reuse (same entities + similar query embedding)
+SEMANTIC_ANSWERS = SemanticAnswerCache()
 
 # ------------------ KNOWLEDGE GRAPH (same idea as online backend) ----------
 
@@ -101,6 +150,10 @@ KNOWLEDGE_GRAPH: Dict[str, Dict] = {
     },
 }
 
+# Built-in graph above; reindex() rebuilds KNOWLEDGE_GRAPH from this plus
+# the current manuals, so KG nodes edited or deleted in the files go away.
+BUILTIN_KNOWLEDGE_GRAPH: Dict[str, Dict] = copy.deepcopy(KNOWLEDGE_GRAPH)
+
 # ------------------ MANUAL CHUNKS (small demo KB; extend as needed) ---------
 
 MANUAL_CHUNKS: List[Dict] = [
@@ -206,10 +259,70 @@ MANUAL_CHUNKS: List[Dict] = [
     },
 ]
 
+# Built-in chunks above; manuals from MANUAL_PATHS are appended at startup
+# and re-read by reindex().
+BUILTIN_CHUNKS: List[Dict] = list(MANUAL_CHUNKS)
+
 # ---------------------------------------------------------------------------
 # 1. ENTITY EXTRACTION (lightweight, domain-specific)
 # ---------------------------------------------------------------------------
 
+# Keyword / alias tables compiled into ENTITY_MATCHER (see entity_matcher.py)
+IMAGE_KEYWORDS = [
+    "show", "display", "picture", "image", "photo", "diagram",
+    "where is", "location of",
+]
+DETAIL_KEYWORDS = [
+    "details", "detail", "description", "describe", "what is",
+    "what does", "tell me", "explain", "mean", "meaning",
+]
+REPAIR_KEYWORDS = [
+    "repair", "fix", "steps", "procedure", "how to", "how do i fix",
+]
+COMPONENT_ALIASES = {
+    "coolant sensor": "Coolant Sensor",
+    "temperature sensor": "Coolant Sensor",
+    "ect sensor": "Coolant Sensor",
+    "radiator fan": "Radiator Fan",
+    "fan": "Radiator Fan",
+    "window motor": "Window Motor",
+    "window": "Window Motor",
+    "thermostat": "Thermostat",
+    "ecu": "ECU",
+}
+SYMPTOM_ALIASES = {
+    "continuous fan": "Continuous Fan",
+    "always on": "Continuous Fan",
+    "always running": "Continuous Fan",
+    "won't turn off": "Continuous Fan",
+    "fan running": "Continuous Fan",
+    "fan runs": "Continuous Fan",
+    "sluggish": "Sluggish Performance",
+    "slow": "Sluggish Performance",
+    "cold start": "Cold Start Problem",
+    "won't start": "Cold Start Problem",
+}
+
+
+# matcher category -> {alias: canonical}; also the speech grammar vocabulary
+ENTITY_ALIAS_TABLES = {
+    "component": COMPONENT_ALIASES,
+    "symptom": SYMPTOM_ALIASES,
+    "image": {kw: kw for kw in IMAGE_KEYWORDS},
+    "detail": {kw: kw for kw in DETAIL_KEYWORDS},
+    "repair": {kw: kw for kw in REPAIR_KEYWORDS},
+}
+
+
+def build_entity_matcher() -> EntityMatcher:
+    """Compile KG node names + the alias tables above into one automaton."""
+    return EntityMatcher.from_knowledge_graph(KNOWLEDGE_GRAPH, ENTITY_ALIAS_TABLES)
+
+
+# Rebuilt by load_data_from_files() / reindex() after new KG nodes arrive
+ENTITY_MATCHER = build_entity_matcher()
+
+
 def extract_entities(query: str) -> Dict[str, List[str]]:
     """
     Extract DTC codes, components, symptoms and detect query type.
@@ -220,81 +333,25 @@ def extract_entities(query: str) -> Dict[str, List[str]]:
       - 'image_request': wants location / picture (not used heavily offline)
       - 'general'      : default
     """
-    q = query.lower()
+    found = ENTITY_MATCHER.match(query)
     entities = {
-        "dtc_codes": [],
-        "components": [],
-        "symptoms": [],
+        "dtc_codes": found["dtc"],
+        "components": found["component"],
+        "symptoms": found["symptom"],
         "wants_image": False,
         "query_type": "general",
     }
 
-    # Image vs explanation/repair keywords
-    image_keywords = [
-        "show", "display", "picture", "image", "photo", "diagram",
-        "where is", "location of",
-    ]
-    detail_keywords = [
-        "details", "detail", "description", "describe", "what is",
-        "what does", "tell me", "explain", "mean", "meaning",
-    ]
-    repair_keywords = [
-        "repair", "fix", "steps", "procedure", "how to", "how do i fix",
-    ]
-
-    has_image = any(w in q for w in image_keywords)
-    has_detail = any(w in q for w in detail_keywords)
-    has_repair = any(w in q for w in repair_keywords)
-
-    if has_repair:
+    if found["repair"]:
         entities["query_type"] = "repair"
-    elif has_detail:
+    elif found["detail"]:
         entities["query_type"] = "explanation"
-    elif has_image:
+    elif found["image"]:
         entities["query_type"] = "image_request"
         entities["wants_image"] = True
     else:
         entities["query_type"] = "general"
 
-    # DTC codes
-    dtc_codes = ["p0117", "p0118", "p0300", "p0691"]
-    for dtc in dtc_codes:
-        if dtc in q:
-            entities["dtc_codes"].append(dtc.upper())
-
-    # Components
-    component_map = {
-        "coolant sensor": "Coolant Sensor",
-        "temperature sensor": "Coolant Sensor",
-        "ect sensor": "Coolant Sensor",
-        "radiator fan": "Radiator Fan",
-        "fan": "Radiator Fan",
-        "window motor": "Window Motor",
-        "window": "Window Motor",
-        "thermostat": "Thermostat",
-        "ecu": "ECU",
-    }
-    for kw, comp in component_map.items():
-        if kw in q:
-            entities["components"].append(comp)
-
-    # Symptoms
-    symptom_map = {
-        "continuous fan": "Continuous Fan",
-        "always on": "Continuous Fan",
-        "always running": "Continuous Fan",
-        "won't turn off": "Continuous Fan",
-        "fan running": "Continuous Fan",
-        "fan runs": "Continuous Fan",
-        "sluggish": "Sluggish Performance",
-        "slow": "Sluggish Performance",
-        "cold start": "Cold Start Problem",
-        "won't start": "Cold Start Problem",
-    }
-    for kw, sym in symptom_map.items():
-        if kw in q:
-            entities["symptoms"].append(sym)
-
     return entities
 
 
@@ -302,195 +359,189 @@ def extract_entities(query: str) -> Dict[str, List[str]]:
 # 2. KG RETRIEVAL
 # ---------------------------------------------------------------------------
 
+# Array-backed view of KNOWLEDGE_GRAPH (interned ids, CSR edges per
+# relation); rebuilt together with ENTITY_MATCHER when the KG changes.
+KG_STORE = KnowledgeGraphStore(KNOWLEDGE_GRAPH)
+
+# Relations returned per entity kind, in ranking order
+DTC_RELATIONS = ["FAULT_CAUSE", "BLINK_CODE", "SYMPTOM", "AFFECTS"]
+COMPONENT_RELATIONS = ["LOCATION", "VOLTAGE", "RESISTANCE", "RELATED_TO", "FUSE"]
+SYMPTOM_RELATIONS = ["INDICATES", "CAUSED_BY"]
+
+
 def kg_query(entities: Dict[str, List[str]]) -> List[Tuple[str, str, str]]:
-    """Get a small set of triples from the knowledge graph."""
+    """
+    Get a small set of triples from the knowledge graph.
+
+    Triples are ranked DTC facts > component facts > symptom facts, then by
+    relation order above and KG order, so the top 10 is deterministic.
+
+    Symptom-only queries ("fan runs and car is sluggish") have no DTC to
+    anchor on, so the symptoms seed a multi-hop traversal instead: DTCs
+    shared by several symptoms rank first, followed by the components they
+    affect, their fuses and (for repair queries) repair steps.
+    """
+    store = KG_STORE
     triples: List[Tuple[str, str, str]] = []
 
     # By DTC
+    dtc_relations = list(DTC_RELATIONS)
+    if entities.get("query_type") == "repair":
+        dtc_relations.append("REPAIR_STEP")
     for dtc in entities.get("dtc_codes", []):
-        if dtc in KNOWLEDGE_GRAPH:
-            node = KNOWLEDGE_GRAPH[dtc]
-            if "fault_cause" in node:
-                triples.append((dtc, "FAULT_CAUSE", node["fault_cause"]))
-            if "blink_code" in node:
-                triples.append((dtc, "BLINK_CODE", node["blink_code"]))
-            for sym in node.get("symptoms", []):
-                triples.append((dtc, "SYMPTOM", sym))
-            for comp in node.get("affects", []):
-                triples.append((dtc, "AFFECTS", comp))
-            if entities.get("query_type") == "repair":
-                for step in node.get("repair_steps", [])[:4]:
-                    triples.append((dtc, "REPAIR_STEP", step))
+        triples.extend(store.facts(dtc, dtc_relations, limits={"REPAIR_STEP": 4}))
 
     # By component
     for comp in entities.get("components", []):
-        if comp in KNOWLEDGE_GRAPH:
-            node = KNOWLEDGE_GRAPH[comp]
-            if "location" in node:
-                triples.append((comp, "LOCATION", node["location"]))
-            if "voltage" in node:
-                triples.append((comp, "VOLTAGE", node["voltage"]))
-            if "resistance" in node:
-                triples.append((comp, "RESISTANCE", node["resistance"]))
-            for dtc in node.get("related_dtcs", []):
-                triples.append((comp, "RELATED_TO", dtc))
-            for fuse in node.get("fuses", []):
-                triples.append((comp, "FUSE", fuse))
+        triples.extend(store.facts(comp, COMPONENT_RELATIONS))
 
     # By symptom
-    for sym in entities.get("symptoms", []):
-        if sym in KNOWLEDGE_GRAPH:
-            node = KNOWLEDGE_GRAPH[sym]
-            for dtc in node.get("indicates", []):
-                triples.append((sym, "INDICATES", dtc))
-            for cause in node.get("caused_by", []):
-                triples.append((sym, "CAUSED_BY", cause))
+    symptoms = entities.get("symptoms", [])
+    if symptoms and not entities.get("dtc_codes"):
+        hops = DIAGNOSTIC_HOPS
+        if entities.get("query_type") == "repair":
+            hops = hops + (REPAIR_HOP,)
+        ranked = store.multi_hop(tuple(sorted(symptoms)), hops)
+        triples.extend(triple for triple, _score in ranked)
+    else:
+        for sym in symptoms:
+            triples.extend(store.facts(sym, SYMPTOM_RELATIONS))
 
-    # De-duplicate and limit
-    return list({t for t in triples})[:10]
+    # De-duplicate (keeping rank order) and limit
+    return dedupe(triples)[:10]
 
 
 # ---------------------------------------------------------------------------
 # 3. VECTOR RETRIEVAL
 # ---------------------------------------------------------------------------
 
+# Built once from MANUAL_CHUNKS (see _ensure_embeddings), swapped by reindex()
+VECTOR_INDEX: VectorIndex = None
+_REINDEX_LOCK = threading.Lock()
+
+
 def _ensure_embeddings():
-    """Compute embeddings once (also called by load_data_from_files)."""
-    for chunk in MANUAL_CHUNKS:
-        if "embedding" not in chunk:
-            chunk["embedding"] = EMBEDDER.encode(chunk["text"])
+    """
+    Build the vector index once (also called by load_data_from_files).
+
+    Embeddings come from the on-disk store (embedding_store.py); the encoder
+    only runs when MANUAL_CHUNKS or the model changed since the last start.
+    """
+    global VECTOR_INDEX
+    if VECTOR_INDEX is None:
+        VECTOR_INDEX = _build_index(MANUAL_CHUNKS)
+
+
+def _build_index(chunks: List[Dict]) -> VectorIndex:
+    """
+    Memory-mapped embeddings + the ANN_BACKEND index and EMBEDDING_DTYPE
+    (int8 / float16) copy, if configured, for `chunks`.
+    """
+    embeddings = load_or_encode(chunks, EMBEDDER, EMBEDDING_MODEL)
+    ann = load_or_build_ann(embeddings, chunks, EMBEDDING_MODEL)
+    quantized = load_or_quantize(embeddings, chunks, EMBEDDING_MODEL)
+    return VectorIndex(chunks, embeddings, normalized=True, ann=ann,
+                       quantized=quantized, rescore=EMBEDDING_RESCORE)
 
 
 def vector_search(query: str,
                   entities: Dict[str, List[str]],
-                  top_k: int = 5) -> List[Dict]:
-    """Retrieve semantically relevant chunks from MANUAL_CHUNKS."""
+                  top_k: int = 4,
+                  query_emb=None) -> List[Dict]:
+    """
+    Retrieve relevant chunks from MANUAL_CHUNKS: dense (MiniLM) and BM25
+    rankings fused with RRF, so exact codes / fuse labels / pin numbers hit.
+    Pass `query_emb` when the caller has already encoded the query.
+    """
     _ensure_embeddings()
 
-    query_emb = EMBEDDER.encode(query)
-    filtered = list(MANUAL_CHUNKS)
-
-    if entities.get("dtc_codes"):
-        filtered = [
-            c for c in filtered
-            if c.get("dtc") in entities["dtc_codes"] or not c.get("dtc")
-        ]
-
-    if entities.get("components"):
-        filtered = [
-            c for c in filtered
-            if c.get("component") in entities["components"] or not c.get("component")
-        ]
-
-    results: List[Dict] = []
-    for chunk in filtered:
-        sim = cosine_similarity(
-            query_emb.reshape(1, -1),
-            chunk["embedding"].reshape(1, -1)
-        )[0][0]
-        results.append(
-            {
-                "text": chunk["text"],
-                "score": float(sim),
-                "page": chunk.get("page", "N/A"),
-                "section": chunk.get("section", "N/A"),
-            }
-        )
+    # Take one reference so a concurrent reindex() can't swap it mid-query
+    index = VECTOR_INDEX
+
+    if query_emb is None:
+        query_emb = QUERY_EMBEDDINGS.get_or_encode(query, EMBEDDER.encode)
+    hits = index.hybrid_search(query_emb, query, entities, top_k=top_k)
+    return index.results(hits)
+
+
+def reindex(manual_paths: List[str] = None) -> Dict:
+    """
+    Re-read the manuals and swap in a fresh index without a restart.
+
+    Only chunks whose id/text hash changed are re-encoded (see
+    embedding_store.encode_to_store); removed chunks are dropped. The new
+    VectorIndex is published with a single global assignment, so in-flight
+    queries finish on the old index. KNOWLEDGE_GRAPH is rebuilt the same
+    way, from the built-in graph plus the current files. Both answer caches
+    are emptied, since their answers were generated from the previous
+    manuals.
+    """
+    global VECTOR_INDEX, MANUAL_CHUNKS, KNOWLEDGE_GRAPH, ENTITY_MATCHER, KG_STORE
+    paths = MANUAL_PATHS if manual_paths is None else manual_paths
+
+    with _REINDEX_LOCK:
+        chunks = list(BUILTIN_CHUNKS)
+        graph = copy.deepcopy(BUILTIN_KNOWLEDGE_GRAPH)
+        if paths:
+            ingest_manuals(paths, chunks, graph)
 
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results[:top_k]
+        stats = encode_to_store(chunks, EMBEDDER, EMBEDDING_MODEL)
+        new_index = _build_index(chunks)
+
+        MANUAL_CHUNKS = chunks
+        VECTOR_INDEX = new_index
+        KNOWLEDGE_GRAPH = graph
+        ENTITY_MATCHER = build_entity_matcher()
+        KG_STORE = KnowledgeGraphStore(KNOWLEDGE_GRAPH)
+        ANSWERS.clear()
+        SEMANTIC_ANSWERS.clear()
+
+    stats["chunks"] = len(chunks)
+    return stats
 
 
 # ---------------------------------------------------------------------------
 # 4. PROMPT BUILDING & OLLAMA CALL
 # ---------------------------------------------------------------------------
 
-def build_system_prompt(triples: List[Tuple[str, str, str]],
-                        chunks: List[Dict],
-                        query_type: str) -> str:
-    """Create a rich system prompt similar to Claude backend, but for Ollama."""
-    if triples:
-        triples_text = "\n".join(
-            f"- {subj} --[{pred}]--> {obj}" for subj, pred, obj in triples[:5]
-        )
-    else:
-        triples_text = "No specific graph relationships found."
+# Prefix of the HTML returned by call_ollama_chat on failure (never cached)
+LLM_ERROR_PREFIX = "<p>⚠️ Error calling local LLM"
 
-    if chunks:
-        chunks_text = "\n\n".join(
-            f"[Page {c['page']}, {c['section']}]\n{c['text']}"
-            for c in chunks[:3]
-        )
-    else:
-        chunks_text = "No relevant manual sections found."
-
-    # Tailor sections based on query type
-    if query_type == "explanation":
-        response_sections = """
-2. For explanation/detail queries:
-   - Use headings:
-     <h3>📋 [DTC/Topic]: [Short description]</h3>
-     <h4>🔍 What This Means</h4>
-     <h4>⚠️ Symptoms You Might Notice</h4>
-     <h4>🔍 Most Likely Causes</h4>
-   - Do NOT include detailed repair steps or pin-level wiring unless explicitly asked.
-"""
-    elif query_type == "repair":
-        response_sections = """
-2. For repair/fix queries:
-   - Use headings:
-     <h3>📋 [DTC/Component]: [Short description]</h3>
-     <h4>🔍 What This Means</h4>
-     <h4>🔧 Repair Procedure</h4> (use <ol><li>...</li></ol> for steps)
-     <h4>📍 Component Location</h4>
-     <h4>⚠️ Important Notes</h4>
-"""
-    elif query_type == "image_request":
-        response_sections = """
-2. For location/image-type queries:
-   - Use headings:
-     <h3>📋 [Component]: [Short description]</h3>
-     <h4>📍 Component Location</h4>
-     <h4>🔌 Connection Details</h4>
-     <h4>🔧 Quick Visual Checks</h4>
-   - Describe location and checks clearly so a mechanic can find it physically.
-"""
-    else:
-        response_sections = """
-2. For general queries:
-   - Choose appropriate sections depending on context (explanation, checks, or repair),
-     but keep structure clear with <h3>, <h4>, <ul>, <ol>, and <p>.
-"""
 
-    system_prompt = f"""
-You are an expert TATA Nano diagnostic technician assistant.
-
-You MUST answer using ONLY the information in the context below.
-If the context does not contain the answer, say you don't know and suggest checking the service manual.
+def _chat_payload(model: str,
+                  system_prompt: str,
+                  user_query: str,
+                  temperature: float,
+                  num_predict: int,
+                  stream: bool) -> Dict:
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_query},
+        ],
+        "stream": stream,
+        "options": {
+            "temperature": temperature,
+            "num_predict": num_predict,
+        },
+    }
 
-KNOWLEDGE GRAPH RELATIONSHIPS:
-{triples_text}
 
-RELEVANT MANUAL SECTIONS:
-{chunks_text}
+def _chat_content(data) -> str:
+    # Typical Ollama chat response: {"message": {"role": "assistant", "content": "..."}}
+    if isinstance(data, dict) and "message" in data:
+        return data["message"].get("content", "").strip()
 
-CRITICAL FORMATTING INSTRUCTIONS:
-1. Structure your answer with clear HTML tags:
-   - <h3> for main headings
-   - <h4> for subheadings
-   - <strong> for emphasis
-   - <ul><li>...</li></ul> for bullet lists
-   - <ol><li>...</li></ol> for numbered steps
-   - <p> for normal paragraphs
+    # Fallback: try to read as plain "content"
+    return str(data)
 
-{response_sections}
 
-3. Always cite page numbers when you reference specific data (e.g., 'See Page 165').
-4. End with: <p><em>Source: TATA Nano EMS Service Manual v5.0</em></p>
-5. Use simple, clear language suitable for mechanics with basic technical knowledge.
-6. Do NOT invent voltages, resistances, or pin numbers beyond the provided context.
-"""
-    return system_prompt.strip()
+def _llm_error_html(model: str, e: Exception) -> str:
+    return (
+        f"{LLM_ERROR_PREFIX} model '{model}': {e}</p>"
+        "<p>Please check that Ollama is running and the model is installed.</p>"
+    )
 
 
 def call_ollama_chat(model: str,
@@ -501,36 +552,64 @@ def call_ollama_chat(model: str,
     """
     Call local Ollama /api/chat endpoint with system + user messages.
     """
-    url = "http://localhost:11434/api/chat"
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_query},
-        ],
-        "stream": False,
-        "options": {
-            "temperature": temperature,
-            "num_predict": num_predict,
-        },
-    }
+    payload = _chat_payload(
+        model, system_prompt, user_query, temperature, num_predict, stream=False
+    )
 
     try:
-        resp = requests.post(url, json=payload, timeout=180)
+        resp = OLLAMA.post("/api/chat", payload)
         resp.raise_for_status()
-        data = resp.json()
+        return _chat_content(resp.json())
+    except Exception as e:
+        return _llm_error_html(model, e)
+
+
+async def call_ollama_chat_async(model: str,
+                                 system_prompt: str,
+                                 user_query: str,
+                                 temperature: float = 0.3,
+                                 num_predict: int = 768) -> str:
+    """Awaitable call_ollama_chat (httpx), used by the async serving mode."""
+    payload = _chat_payload(
+        model, system_prompt, user_query, temperature, num_predict, stream=False
+    )
+
+    try:
+        return _chat_content(await OLLAMA_ASYNC.post_json("/api/chat", payload))
+    except Exception as e:
+        return _llm_error_html(model, e)
 
-        # Typical Ollama chat response: {"message": {"role": "assistant", "content": "..."}}
-        if isinstance(data, dict) and "message" in data:
-            return data["message"].get("content", "").strip()
 
-        # Fallback: try to read as plain "content"
-        return str(data)
+def stream_ollama_chat(model: str,
+                       system_prompt: str,
+                       user_query: str,
+                       temperature: float = 0.3,
+                       num_predict: int = 768) -> Iterator[str]:
+    """
+    Same request as call_ollama_chat but with "stream": true.
+
+    Ollama answers with one JSON object per line; each carries the next
+    piece of message.content and the last one has "done": true. Pieces are
+    yielded as soon as they arrive. On failure the error HTML is yielded.
+    """
+    payload = _chat_payload(
+        model, system_prompt, user_query, temperature, num_predict, stream=True
+    )
+
+    try:
+        with OLLAMA.post("/api/chat", payload, stream=True) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                piece = data.get("message", {}).get("content", "")
+                if piece:
+                    yield piece
+                if data.get("done"):
+                    break
     except Exception as e:
-        return (
-            f"<p>⚠️ Error calling local LLM model '{model}': {e}</p>"
-            "<p>Please check that Ollama is running and the model is installed.</p>"
-        )
+        yield _llm_error_html(model, e)
 
 
 # ---------------------------------------------------------------------------
@@ -542,14 +621,143 @@ def load_data_from_files():
     Called once on server startup from local_api_server.py.
 
     In this improved version we:
-      - Precompute embeddings for manual chunks (for faster queries).
-      - (You can extend this to load extra chunks from PDF/JSON in the future.)
+      - Stream extra manuals (PDF / JSON / JSONL from MANUAL_PATHS) into
+        MANUAL_CHUNKS and KNOWLEDGE_GRAPH (see manual_ingest.py).
+      - Load chunk embeddings from the on-disk store (memory-mapped), or
+        encode + persist them if the chunks/model changed.
+      - Warm up the Ollama model (keep-alive) so the first query doesn't
+        pay the model load time.
     """
+    global ENTITY_MATCHER, KG_STORE
+    if MANUAL_PATHS and VECTOR_INDEX is None:
+        ingest_manuals(MANUAL_PATHS, MANUAL_CHUNKS, KNOWLEDGE_GRAPH)
+        ENTITY_MATCHER = build_entity_matcher()
+        KG_STORE = KnowledgeGraphStore(KNOWLEDGE_GRAPH)
     _ensure_embeddings()
     print("✅ Offline RAG KB initialized (manual chunks + KG).")
     print(f"   - KG nodes: {len(KNOWLEDGE_GRAPH)}")
     print(f"   - Manual chunks: {len(MANUAL_CHUNKS)}")
     print(f"   - Ollama model: {OLLAMA_MODEL}")
+    if OLLAMA.warm_up(OLLAMA_MODEL):
+        print(f"   - Ollama model loaded (keep_alive={OLLAMA.keep_alive})")
+
+
+def get_stats() -> Dict:
+    """KB size and cache counters for /api/health in local_api_server.py."""
+    return {
+        "kg_nodes": len(KNOWLEDGE_GRAPH),
+        "vector_chunks": len(MANUAL_CHUNKS),
+        "vector_index": VECTOR_INDEX.memory_stats() if VECTOR_INDEX is not None else None,
+        "ollama_model": OLLAMA_MODEL,
+        "query_cache": QUERY_EMBEDDINGS.stats(),
+        "answer_cache": ANSWERS.stats(),
+        "semantic_cache": SEMANTIC_ANSWERS.stats(),
+        "llm_calls_avoided": ANSWERS.hits + SEMANTIC_ANSWERS.hits,
+    }
+
+
+def _prepare_query(query: str) -> Dict:
+    """Steps 1-4 shared by run_on_device_rag and stream_on_device_rag."""
+    # Step 1: entity extraction
+    entities = extract_entities(query)
+
+    # Step 2: KG + vector retrieval
+    # Encoded once: the same vector feeds retrieval and the semantic cache
+    query_emb = QUERY_EMBEDDINGS.get_or_encode(query, EMBEDDER.encode)
+    triples = kg_query(entities)
+    chunks = vector_search(query, entities, top_k=4, query_emb=query_emb)
+
+    return _build_context(query, entities, triples, chunks, query_emb)
+
+
+def _prepare_queries(queries: List[str]) -> List[Dict]:
+    """
+    _prepare_query for a batch: all query embeddings come from one encoder
+    call and are scored against the index with one matrix multiply.
+    """
+    _ensure_embeddings()
+    index = VECTOR_INDEX
+
+    entities_list = [extract_entities(q) for q in queries]
+    query_embs = QUERY_EMBEDDINGS.get_or_encode_batch(
+        queries, lambda texts: EMBEDDER.encode(texts, batch_size=len(texts))
+    )
+    hits_list = index.hybrid_search_batch(query_embs, queries, entities_list, top_k=4)
+
+    return [
+        _build_context(query, entities, kg_query(entities), index.results(hits), emb)
+        for query, entities, hits, emb in zip(queries, entities_list, hits_list, query_embs)
+    ]
+
+
+def _build_context(query: str,
+                   entities: Dict,
+                   triples: List[Tuple[str, str, str]],
+                   chunks: List[Dict],
+                   query_emb) -> Dict:
+    # Steps 3-4: reciprocal rank fusion of the evidence into the input token
+    # budget (measured with the embedder's tokenizer), rendered into the
+    # template for the query type; the static instructions come first so
+    # Ollama can reuse their KV cache
+    query_type = entities.get("query_type", "general")
+    packed = pack_context(query, triples, chunks, query_type, count_tokens=COUNT_TOKENS)
+    fusion, prompt = packed["fusion"], packed["prompt"]
+    triples, chunks = prompt.triples, prompt.chunks
+    system_prompt = prompt.text
+
+    return {
+        "query": query,
+        "entities": entities,
+        "triples": triples,
+        "chunks": chunks,
+        "system_prompt": system_prompt,
+        "num_predict": packed["max_output_tokens"],
+        "cache_key": answer_cache_key(
+            query, entities, chunks, OLLAMA_MODEL, PROMPT_TEMPLATE_VERSION
+        ),
+        "signature": entity_signature(
+            entities, chunks, OLLAMA_MODEL, PROMPT_TEMPLATE_VERSION
+        ),
+        "query_emb": query_emb,
+        "locked_specs": {
+            "pages_used": pages_used(chunks),
+            "dtc_codes": entities.get("dtc_codes", []),
+            "components": entities.get("components", []),
+            "query_type": query_type,
+            "context_tokens": fusion["tokens"],
+            "prompt_tokens": packed["input_tokens"],
+            "max_output_tokens": packed["max_output_tokens"],
+            "context_dropped": fusion["dropped"] + prompt.trimmed,
+        },
+    }
+
+
+def _cached_answer(ctx: Dict) -> Tuple[Optional[str], str]:
+    """Exact answer cache first, then the semantic (paraphrase) cache."""
+    answer_html = ANSWERS.get(ctx["cache_key"])
+    if answer_html is not None:
+        return answer_html, "hit"
+    answer_html = SEMANTIC_ANSWERS.get(ctx["query_emb"], ctx["signature"])
+    if answer_html is not None:
+        return answer_html, "semantic_hit"
+    return None, "miss"
+
+
+def _remember_answer(ctx: Dict, answer_html: str) -> None:
+    # "in", not startswith: a stream can fail after some tokens arrived
+    if answer_html and LLM_ERROR_PREFIX not in answer_html:
+        ANSWERS.put(ctx["cache_key"], answer_html)
+        SEMANTIC_ANSWERS.put(ctx["query_emb"], ctx["signature"], answer_html)
+
+
+def _pack_output(ctx: Dict, answer_html: str, cache_status: str) -> Dict:
+    return {
+        "answer": answer_html,
+        "cache": cache_status,
+        "vdb_chunks": ctx["chunks"],
+        "kg_triples": ctx["triples"],
+        "locked_specs": ctx["locked_specs"],
+    }
 
 
 def run_on_device_rag(query: str) -> Dict:
@@ -559,40 +767,145 @@ def run_on_device_rag(query: str) -> Dict:
     Returns:
         {
           "answer": "<html-formatted answer>",
-          "vdb_chunks": [ {text, score, page, section}, ... ],
+          "cache": "hit" | "semantic_hit" | "miss",
+          "vdb_chunks": [ {id, text, score, page, section}, ... ],
           "kg_triples": [ (subj, pred, obj), ... ],
           "locked_specs": {... any extra metadata ...}
         }
     """
-    # Step 1: entity extraction
-    entities = extract_entities(query)
+    ctx = _prepare_query(query)
+
+    # Step 5: call local LLM via Ollama, unless the same prompt (exact cache)
+    # or a paraphrase with the same entities (semantic cache) was answered
+    answer_html, cache_status = _cached_answer(ctx)
+    if answer_html is None:
+        answer_html = call_ollama_chat(
+            model=OLLAMA_MODEL,
+            system_prompt=ctx["system_prompt"],
+            user_query=query,
+            num_predict=ctx["num_predict"],
+        )
+        _remember_answer(ctx, answer_html)
 
-    # Step 2: KG + vector retrieval
-    triples = kg_query(entities)
-    chunks = vector_search(query, entities, top_k=5)
+    # Step 6: pack results for local_api_server.py
+    return _pack_output(ctx, answer_html, cache_status)
 
-    # Step 3: build system prompt
-    query_type = entities.get("query_type", "general")
-    system_prompt = build_system_prompt(triples, chunks, query_type)
 
-    # Step 4: call local LLM via Ollama
-    answer_html = call_ollama_chat(
-        model=OLLAMA_MODEL,
-        system_prompt=system_prompt,
-        user_query=query,
-    )
+async def run_on_device_rag_async(query: str) -> Dict:
+    """
+    Async run_on_device_rag for the ASGI mode of local_api_server.py.
 
-    # Step 5: pack results for local_api_server.py
-    locked_specs = {
-        "pages_used": sorted({c["page"] for c in chunks}),
-        "dtc_codes": entities.get("dtc_codes", []),
-        "components": entities.get("components", []),
-        "query_type": query_type,
-    }
+    Entity extraction, KG lookup and vector search run on RETRIEVAL_POOL;
+    the Ollama call is awaited, so the event loop keeps serving other
+    requests while the model generates.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = await loop.run_in_executor(RETRIEVAL_POOL, _prepare_query, query)
+
+    answer_html, cache_status = _cached_answer(ctx)
+    if answer_html is None:
+        answer_html = await call_ollama_chat_async(
+            model=OLLAMA_MODEL,
+            system_prompt=ctx["system_prompt"],
+            user_query=query,
+            num_predict=ctx["num_predict"],
+        )
+        _remember_answer(ctx, answer_html)
 
-    return {
-        "answer": answer_html,
-        "vdb_chunks": chunks,
-        "kg_triples": triples,
-        "locked_specs": locked_specs,
+    return _pack_output(ctx, answer_html, cache_status)
+
+
+def run_on_device_rag_batch(queries: List[str],
+                            max_concurrency: int = BATCH_LLM_CONCURRENCY) -> List[Dict]:
+    """
+    Bulk run_on_device_rag (e.g. a fleet's DTC readouts), used by
+    /api/chat/batch. Results are returned in input order.
+
+    Retrieval is batched (_prepare_queries). Queries that end up with the
+    same prompt (same answer cache key) share one Ollama call, and at most
+    `max_concurrency` calls run at once so the local model isn't swamped.
+    """
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries per batch")
+    if not queries:
+        return []
+
+    contexts = _prepare_queries(queries)
+
+    # One representative context per distinct prompt
+    unique: Dict[str, Dict] = {}
+    for ctx in contexts:
+        unique.setdefault(ctx["cache_key"], ctx)
+
+    answers: Dict[str, Tuple[str, str]] = {}
+    to_generate: List[Dict] = []
+    for key, ctx in unique.items():
+        answer_html, cache_status = _cached_answer(ctx)
+        if answer_html is None:
+            to_generate.append(ctx)
+        else:
+            answers[key] = (answer_html, cache_status)
+
+    def generate(ctx: Dict) -> str:
+        answer_html = call_ollama_chat(
+            model=OLLAMA_MODEL,
+            system_prompt=ctx["system_prompt"],
+            user_query=ctx["query"],
+            num_predict=ctx["num_predict"],
+        )
+        _remember_answer(ctx, answer_html)
+        return answer_html
+
+    if to_generate:
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency),
+                                thread_name_prefix="batch-llm") as pool:
+            for ctx, answer_html in zip(to_generate, pool.map(generate, to_generate)):
+                answers[ctx["cache_key"]] = (answer_html, "miss")
+
+    results = []
+    seen = set()
+    for ctx in contexts:
+        answer_html, cache_status = answers[ctx["cache_key"]]
+        # Later copies of a prompt answered in this batch report "batch_dedup"
+        if ctx["cache_key"] in seen and cache_status == "miss":
+            cache_status = "batch_dedup"
+        seen.add(ctx["cache_key"])
+        results.append(_pack_output(ctx, answer_html, cache_status))
+    return results
+
+
+def stream_on_device_rag(query: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    Streaming variant used by /api/chat/stream.
+
+    Yields (event, data) pairs:
+        ("meta",  {cache, vdb_chunks, kg_triples, locked_specs})  - first, right after retrieval
+        ("token", {"text": "..."})                                 - as Ollama produces them
+        ("done",  {"answer": "<full html>"})                        - last
+    """
+    ctx = _prepare_query(query)
+    answer_html, cache_status = _cached_answer(ctx)
+
+    yield "meta", {
+        "cache": cache_status,
+        "vdb_chunks": ctx["chunks"],
+        "kg_triples": ctx["triples"],
+        "locked_specs": ctx["locked_specs"],
     }
+
+    if answer_html is None:
+        parts: List[str] = []
+        for piece in stream_ollama_chat(
+            model=OLLAMA_MODEL,
+            system_prompt=ctx["system_prompt"],
+            user_query=query,
+            num_predict=ctx["num_predict"],
+        ):
+            parts.append(piece)
+            yield "token", {"text": piece}
+        answer_html = "".join(parts).strip()
+        _remember_answer(ctx, answer_html)
+    else:
+        yield "token", {"text": answer_html}
+
+    yield "done", {"answer": answer_html}
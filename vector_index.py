@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Matrix-backed vector index for the Nano manual chunks.
+
+Used by both backends (chatbot_backend_claude_1.py and
+updated_hybrid_rag_ollama_on_device_1.py) in place of per-chunk
+cosine_similarity calls:
+
+    - All chunk embeddings live in ONE contiguous float32 matrix,
+      L2-normalised once at build time (cosine == dot product).
+    - A query is scored with a single matrix-vector product.
+    - Top-k is selected with np.argpartition (no full sort).
+    - DTC / component filters come from inverted metadata indexes
+      (metadata_index.py); only the candidate rows are scored.
+    - With an ANN index attached (ann_index.py), only its candidate rows
+      are scored instead of the whole matrix.
+    - With a quantized copy attached (quantization.py), scans run over the
+      int8 / float16 rows and the best hits are rescored in float32.
+    - hybrid_search() also scores the rows with a BM25 index (exact part
+      codes, fuse labels, pin numbers) and fuses both rankings with
+      reciprocal rank fusion.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bm25_index import BM25Index
+from context_fusion import RRF_K
+from metadata_index import MetadataIndex
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Return a contiguous float32 copy of `matrix` with unit-length rows."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+class VectorIndex:
+    """
+    Dense index over MANUAL_CHUNKS.
+
+    `chunks[i]` is the metadata dict for row i of `matrix`. The chunk dicts
+    are kept as-is (no "embedding" key is required on them).
+
+    Pass `normalized=True` for rows that are already unit-length float32
+    (e.g. a memmap from embedding_store); the array is then used without
+    copying so the pages stay shared between processes.
+
+    `ann` is an optional ann_index.ANNIndex and `quantized` an optional
+    quantization.QuantizedMatrix over the same rows; `rescore` quantized
+    hits per result are re-ranked with the float32 rows (0 disables).
+    """
+
+    # ANN candidates requested per result, before mask filtering
+    ANN_OVERSAMPLE = 10
+    # Queries scored per matrix multiply in search_batch()
+    BATCH_QUERY_BLOCK = 64
+
+    def __init__(self, chunks: Sequence[Dict], embeddings: np.ndarray,
+                 normalized: bool = False, ann=None, quantized=None,
+                 rescore: int = 4):
+        self.chunks: List[Dict] = list(chunks)
+        self.ann = ann
+        self.quantized = quantized
+        self.rescore = rescore
+        if len(self.chunks) == 0:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        elif normalized:
+            self.matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        else:
+            self.matrix = _normalize_rows(np.asarray(embeddings))
+        if self.matrix.shape[0] != len(self.chunks):
+            raise ValueError(
+                f"Got {self.matrix.shape[0]} embeddings for "
+                f"{len(self.chunks)} chunks"
+            )
+
+        # value -> rows postings for the dtc / component filters
+        self.metadata = MetadataIndex(self.chunks)
+
+        # Sparse twin over the same rows, built with the dense matrix so a
+        # reindex swaps both at once
+        self.lexical = BM25Index(self.chunks)
+
+    @classmethod
+    def from_chunks(cls, chunks: Sequence[Dict], embedder,
+                    batch_size: int = 64) -> "VectorIndex":
+        """Encode all chunk texts in one batched call and build the index."""
+        chunks = list(chunks)
+        if not chunks:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        embeddings = embedder.encode(
+            [c["text"] for c in chunks],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+        )
+        return cls(chunks, embeddings)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def memory_stats(self) -> Dict:
+        """Size of the matrix that is scanned per query vs. the float32 rows."""
+        float32_bytes = int(self.matrix.nbytes)
+        scan_bytes = self.quantized.nbytes if self.quantized is not None else float32_bytes
+        return {
+            "dtype": self.quantized.dtype if self.quantized is not None else "float32",
+            "scan_mb": round(scan_bytes / 1e6, 2),
+            "float32_mb": round(float32_bytes / 1e6, 2),
+            "ann": self.ann.backend if self.ann is not None else "exact",
+        }
+
+    # ------------------------------------------------------------------
+    # Filtering
+    # ------------------------------------------------------------------
+
+    def filter_mask(self, entities: Dict) -> np.ndarray:
+        """
+        Boolean row mask for the entity filters.
+
+        Same semantics as the old list comprehensions: a chunk passes the
+        DTC filter if it is tagged with one of the query's DTCs OR carries
+        no DTC at all (likewise for components). Chunks may carry several
+        DTCs / components (see metadata_index.py).
+        """
+        mask = self.metadata.candidate_mask(entities)
+        return np.ones(len(self.chunks), dtype=bool) if mask is None else mask
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def search(self,
+               query_embedding: np.ndarray,
+               entities: Optional[Dict] = None,
+               top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return [(row, cosine score), ...] sorted by descending score."""
+        if len(self.chunks) == 0 or top_k <= 0:
+            return []
+
+        # Candidate rows from the metadata postings (None == every row)
+        rows = self.metadata.candidates(entities or {})
+        n_candidates = len(self.chunks) if rows is None else len(rows)
+        if n_candidates == 0:
+            return []
+
+        query = _normalize_rows(query_embedding)[0]
+
+        if self.ann is not None:
+            candidates = np.unique(
+                self.ann.candidates(query, max(self.ANN_OVERSAMPLE * top_k, 100))
+            )
+            if rows is not None:
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            # Too few candidates survive the filters: scan all filtered rows
+            if len(candidates) >= min(top_k, n_candidates):
+                rows = candidates
+
+        if self.quantized is None:
+            scores = self.matrix @ query if rows is None else self.matrix[rows] @ query
+        else:
+            scores = self.quantized.scores(query, rows)
+        return self._finish(rows, scores, query, top_k)
+
+    def search_batch(self,
+                     query_embeddings: np.ndarray,
+                     entities_list: Sequence[Optional[Dict]],
+                     top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """
+        search() for many queries, scored with ONE matrix multiply.
+
+        Queries are scored against every row at once (rows x queries, in
+        blocks of BATCH_QUERY_BLOCK queries to bound the score matrix), then
+        each column is restricted to that query's filtered rows. With
+        an ANN index the candidate sets differ per query, so each query is
+        searched on its own instead.
+        """
+        queries = _normalize_rows(query_embeddings)
+        if len(self.chunks) == 0 or top_k <= 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        if self.ann is not None:
+            return [self.search(q, e, top_k) for q, e in zip(queries, entities_list)]
+
+        results: List[List[Tuple[int, float]]] = []
+        for start in range(0, len(queries), self.BATCH_QUERY_BLOCK):
+            block = queries[start:start + self.BATCH_QUERY_BLOCK]
+            if self.quantized is None:
+                all_scores = self.matrix @ block.T
+            else:
+                all_scores = self.quantized.scores(np.ascontiguousarray(block.T))
+
+            for j, query in enumerate(block):
+                rows = self.metadata.candidates(entities_list[start + j] or {})
+                if rows is not None and len(rows) == 0:
+                    results.append([])
+                    continue
+                scores = all_scores[:, j] if rows is None else all_scores[rows, j]
+                results.append(self._finish(rows, np.ascontiguousarray(scores), query, top_k))
+        return results
+
+    def _finish(self, rows: Optional[np.ndarray], scores: np.ndarray,
+                query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """Top-k of the scanned scores, rescored in float32 if quantized."""
+        k = min(top_k, len(scores))
+        if self.quantized is None or self.rescore <= 0:
+            return self._top_k(rows, scores, k)
+
+        # Re-rank the best quantized hits with the exact float32 rows
+        hits = self._top_k(rows, scores, min(self.rescore * k, len(scores)))
+        hit_rows = np.array([row for row, _score in hits], dtype=np.int64)
+        return self._top_k(hit_rows, self.matrix[hit_rows] @ query, k)
+
+    @staticmethod
+    def _top_k(rows: Optional[np.ndarray], scores: np.ndarray,
+               k: int) -> List[Tuple[int, float]]:
+        """Top-k of `scores` (indexed like `rows`, or by row if None)."""
+        if k <= 0 or len(scores) == 0:
+            return []
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        ids = top if rows is None else rows[top]
+        return [(int(i), float(scores[j])) for i, j in zip(ids, top)]
+
+    def hybrid_search(self,
+                      query_embedding: np.ndarray,
+                      query_text: str,
+                      entities: Optional[Dict] = None,
+                      top_k: int = 5,
+                      k: int = RRF_K) -> List[Tuple[int, float]]:
+        """
+        Dense + BM25 retrieval fused with reciprocal rank fusion.
+
+        Each retriever contributes its top `4 * top_k` candidates; rows are
+        ranked by sum(1 / (k + rank)) and returned with their cosine score,
+        so callers see the same (row, score) shape as search().
+        """
+        if len(self.chunks) == 0 or top_k <= 0:
+            return []
+        depth = max(4 * top_k, 20)
+        dense = self.search(query_embedding, entities, top_k=depth)
+        return self._fuse(dense, query_embedding, query_text, entities, top_k, k)
+
+    def hybrid_search_batch(self,
+                            query_embeddings: np.ndarray,
+                            query_texts: Sequence[str],
+                            entities_list: Sequence[Optional[Dict]],
+                            top_k: int = 5,
+                            k: int = RRF_K) -> List[List[Tuple[int, float]]]:
+        """hybrid_search() for many queries; the dense side uses search_batch()."""
+        if len(self.chunks) == 0 or top_k <= 0:
+            return [[] for _ in query_texts]
+        depth = max(4 * top_k, 20)
+        dense_lists = self.search_batch(query_embeddings, entities_list, top_k=depth)
+        return [
+            self._fuse(dense, emb, text, entities, top_k, k)
+            for dense, emb, text, entities
+            in zip(dense_lists, query_embeddings, query_texts, entities_list)
+        ]
+
+    def _fuse(self, dense: List[Tuple[int, float]], query_embedding: np.ndarray,
+              query_text: str, entities: Optional[Dict],
+              top_k: int, k: int) -> List[Tuple[int, float]]:
+        """RRF of the dense hits with BM25 hits for `query_text`."""
+        depth = max(4 * top_k, 20)
+        sparse = self.lexical.search(query_text, self.metadata.candidate_mask(entities or {}), top_k=depth)
+
+        fused: Dict[int, float] = {}
+        for ranking in (dense, sparse):
+            for rank, (row, _score) in enumerate(ranking, start=1):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+        if not fused:
+            return []
+
+        rows = sorted(fused, key=lambda row: -fused[row])[:top_k]
+        query = _normalize_rows(query_embedding)[0]
+        return [(row, float(self.matrix[row] @ query)) for row in rows]
+
+    def results(self, hits: List[Tuple[int, float]]) -> List[Dict]:
+        """Turn search hits into the {id, text, score, page, section} dicts."""
+        results: List[Dict] = []
+        for row, score in hits:
+            chunk = self.chunks[row]
+            results.append(
+                {
+                    "id": chunk.get("id"),
+                    "text": chunk["text"],
+                    "score": score,
+                    "page": chunk.get("page", "N/A"),
+                    "section": chunk.get("section", "N/A"),
+                }
+            )
+        return results